@@ -5,22 +5,35 @@
 掃描 HiStock 的概念股/產業 ID 範圍，找出所有有效的題材分類。
 輸出: data/histock_themes_all.json (格式: {id: {"name": ..., "stock_count": ...}})
 
-執行時間: 約 5-10 分鐘 (掃 200 個 ID, 含速率限制)
-建議: 每月跑一次更新對照表
+執行時間: 首次約 1 分鐘 (4 執行緒併發), 之後靠探測快取只查新 ID, 幾秒鐘
+建議: 每週跑一次更新對照表
+
+加速方式:
+  - 探測快取 data/histock_probe_cache.json: 已判定為有效/空的 ID, --max-age 天內不再查;
+    已知最大有效 ID 之後的空 ID (新題材會出現的地方) 只快取 FRONTIER_MAX_AGE_DAYS 天
+  - 串流讀取, 讀到 </title> 發現不是題材頁就斷線, 不下載整頁
+  - 多執行緒併發, 同一 host 的請求間隔由 --delay 控制
+  - 最後一個有效 ID 之後連續 --max-gap 個都是空的, 就停止往後掃
 
 用法：
   python3 1_discover_themes.py
   python3 1_discover_themes.py --range 50,250  # 自訂掃描範圍
+  python3 1_discover_themes.py --refresh       # 忽略快取全部重查
 """
 import requests
-from bs4 import BeautifulSoup
 import re
 import json
 import time
 import os
 import sys
 import argparse
-from datetime import datetime
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "backend"))
+from html_tables import extract_title, extract_links
+from rate_limiter import HostRateLimiter
 
 HEADERS = {
     "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 "
@@ -31,69 +44,185 @@ HEADERS = {
 }
 
 URL_TEMPLATE = "https://histock.tw/global/globalclass.aspx?mid=0&id={id}"
+CACHE_PATH = "data/histock_probe_cache.json"
+FRONTIER_MAX_AGE_DAYS = 1  # 已知最大有效 ID 之後的空 ID: 新題材出現在這裡, 不能信太久
+CHUNK_SIZE = 4096
 
 # 標題正則: <title>上市 XXX概念股成份股行情報價</title> 或 <title>上市 XXX成份股行情報價</title>
 TITLE_RE = re.compile(r"上市\s*(.+?)(?:概念股)?成份股", re.S)
 
+STOCK_HREF_RE = re.compile(r"/stock/\d+$")
+
 # 排除明顯不是台股題材的 (例如美股、陸股分類)
 EXCLUDE_KEYWORDS = ["美股", "陸股", "港股", "日股", "韓股"]
 
 
-def probe_id(theme_id: int, session: requests.Session) -> dict | None:
-    """探測單一 ID，回傳 {name, stock_count} 或 None"""
+def _read_until_title(chunks) -> tuple[bytes, bool]:
+    """從串流讀到 </title> 為止, 回傳 (目前讀到的 bytes, 是否已讀完整頁)"""
+    buf = b""
+    for chunk in chunks:
+        buf += chunk
+        if b"</title>" in buf.lower():
+            return buf, False
+    return buf, True
+
+
+def _probe(theme_id: int, session: requests.Session,
+           limiter: HostRateLimiter | None = None) -> tuple[str, dict | None]:
+    """
+    探測單一 ID, 回傳 (status, info)
+    status: "valid" (info = {name, stock_count}) / "empty" (不是題材頁) / "error" (網路錯誤, 不寫快取)
+    """
     url = URL_TEMPLATE.format(id=theme_id)
     try:
-        resp = session.get(url, timeout=10)
-        if resp.status_code != 200:
-            return None
-        if len(resp.text) < 5000:  # 異常短的回應通常是錯誤頁
-            return None
+        if limiter is not None:
+            limiter.wait(url)
+        with session.get(url, timeout=10, stream=True) as resp:
+            if resp.status_code != 200:
+                return ("empty" if resp.status_code == 404 else "error"), None
+            if resp.encoding is None or resp.encoding.lower() == "iso-8859-1":
+                resp.encoding = "utf-8"
 
-        soup = BeautifulSoup(resp.text, "lxml")
+            chunks = resp.iter_content(CHUNK_SIZE)
+            head, complete = _read_until_title(chunks)
 
-        # 從 <title> 取題材名稱
-        title_tag = soup.find("title")
-        if not title_tag:
-            return None
-        title = title_tag.get_text(strip=True)
+            # 從 <title> 取題材名稱; 不是題材頁就不必下載/解析整頁
+            title = extract_title(head.decode(resp.encoding, errors="replace"))
+            if not title:
+                return "empty", None
 
-        m = TITLE_RE.search(title)
-        if not m:
-            return None
-        theme_name = m.group(1).strip()
+            m = TITLE_RE.search(title)
+            if not m:
+                return "empty", None
+            theme_name = m.group(1).strip()
 
-        # 排除非台股
-        if any(kw in theme_name for kw in EXCLUDE_KEYWORDS):
-            return None
+            # 排除非台股
+            if any(kw in theme_name for kw in EXCLUDE_KEYWORDS):
+                return "empty", None
+
+            body = head if complete else head + b"".join(chunks)
+            text = body.decode(resp.encoding, errors="replace")
+
+        if len(text) < 5000:  # 異常短的回應通常是錯誤頁
+            return "empty", None
 
         # 數成分股數
-        stock_links = soup.find_all("a", href=re.compile(r"/stock/\d+$"))
+        stock_links = extract_links(text, STOCK_HREF_RE)
         valid_codes = set()
-        for a in stock_links:
-            code = a["href"].split("/")[-1]
+        for href, _ in stock_links:
+            code = href.split("/")[-1]
             if code.isdigit() and len(code) == 4:
                 valid_codes.add(code)
 
         # 過濾掉導覽列重複出現的個股 (台積電等熱門股會在側邊欄)
         # 真正的成分股一定 >= 5 檔，否則跳過
         if len(valid_codes) < 5:
-            return None
+            return "empty", None
 
-        return {
+        return "valid", {
             "name": theme_name,
             "stock_count": len(valid_codes),
         }
     except Exception as e:
         print(f"  [!] id={theme_id}: {type(e).__name__}: {e}", file=sys.stderr)
-        return None
+        return "error", None
+
+
+def probe_id(theme_id: int, session: requests.Session) -> dict | None:
+    """探測單一 ID，回傳 {name, stock_count} 或 None"""
+    return _probe(theme_id, session)[1]
+
+
+def load_probe_cache() -> dict:
+    if not os.path.exists(CACHE_PATH):
+        return {}
+    try:
+        with open(CACHE_PATH, encoding="utf-8") as f:
+            return json.load(f)
+    except Exception:
+        return {}
+
+
+def save_probe_cache(cache: dict):
+    tmp = CACHE_PATH + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(cache, f, ensure_ascii=False, indent=1, sort_keys=True)
+    os.replace(tmp, CACHE_PATH)
+
+
+def scan_ids(start_id: int, end_id: int, cache: dict, max_age_days: float,
+             workers: int, delay: float, max_gap: int) -> dict:
+    """
+    依 ID 順序分批併發探測, 回傳 {id: info}（含快取中仍有效的）
+
+    快取裡 max_age_days 內判定過的 ID 不再查 (已知最大有效 ID 之後的空 ID 只信
+    FRONTIER_MAX_AGE_DAYS 天); 超過已知最大有效 ID 後連續 max_gap 個空 ID 就停止。
+    cache 會原地更新。
+    """
+    now = datetime.now()
+    fresh_after = (now - timedelta(days=max_age_days)).strftime("%Y-%m-%d %H:%M:%S")
+    frontier_fresh_after = (now - timedelta(days=min(max_age_days, FRONTIER_MAX_AGE_DAYS))
+                            ).strftime("%Y-%m-%d %H:%M:%S")
+    known_max = max((int(k) for k, v in cache.items() if v.get("status") == "valid"), default=start_id)
+    limiter = HostRateLimiter({"histock.tw": delay})
+    local = threading.local()
+
+    def session():
+        if not hasattr(local, "session"):
+            local.session = requests.Session()
+            local.session.headers.update(HEADERS)
+        return local.session
+
+    def probe(tid):
+        entry = cache.get(str(tid))
+        frontier = tid > known_max and entry and entry.get("status") == "empty"
+        cutoff = frontier_fresh_after if frontier else fresh_after
+        if entry and entry.get("checked_at", "") >= cutoff:
+            return tid, entry["status"], entry.get("info"), True
+        status, info = _probe(tid, session(), limiter)
+        return tid, status, info, False
+
+    found = {}
+    gap = 0
+    probed = skipped = 0
+    batch = max(1, workers * 2)
+    with ThreadPoolExecutor(max_workers=workers) as ex:
+        for lo in range(start_id, end_id + 1, batch):
+            ids = range(lo, min(lo + batch, end_id + 1))
+            for tid, status, info, cached in ex.map(probe, ids):
+                if cached:
+                    skipped += 1
+                else:
+                    probed += 1
+                    if status != "error":
+                        cache[str(tid)] = {"status": status, "info": info,
+                                           "checked_at": datetime.now().strftime("%Y-%m-%d %H:%M:%S")}
+                if status == "valid":
+                    found[str(tid)] = info
+                    gap = 0
+                    if not cached:
+                        print(f"  id={tid:3d}  {info['name']:<30s}  ({info['stock_count']} 檔)")
+                elif status == "empty":
+                    gap += 1
+            if gap >= max_gap and lo + batch - 1 > known_max:
+                print(f"  id={lo + batch - 1} 之前已連續 {gap} 個空 ID, 停止往後掃")
+                break
+    print(f"探測 {probed} 個 ID, 快取略過 {skipped} 個")
+    return found
 
 
 def main():
     parser = argparse.ArgumentParser()
     parser.add_argument("--range", default="50,250",
                         help="ID 掃描範圍, 例如 50,250")
-    parser.add_argument("--delay", type=float, default=1.5,
-                        help="每次請求間隔秒數 (避免被擋)")
+    parser.add_argument("--delay", type=float, default=0.5,
+                        help="同一 host 的請求間隔秒數 (避免被擋)")
+    parser.add_argument("--workers", type=int, default=4, help="併發執行緒數")
+    parser.add_argument("--max-age", type=float, default=30,
+                        help="探測快取有效天數, 超過才重查")
+    parser.add_argument("--max-gap", type=int, default=30,
+                        help="最後一個有效 ID 之後連續幾個空 ID 就停止")
+    parser.add_argument("--refresh", action="store_true", help="忽略探測快取")
     parser.add_argument("--output", default="data/histock_themes_all.json")
     args = parser.parse_args()
 
@@ -102,8 +231,7 @@ def main():
 
     print(f"=== HiStock 題材分類探測 ===")
     print(f"範圍: id={start_id} ~ {end_id} (共 {end_id - start_id + 1} 個)")
-    print(f"延遲: {args.delay} 秒/次")
-    print(f"預估時間: {(end_id - start_id + 1) * args.delay / 60:.1f} 分鐘")
+    print(f"併發: {args.workers} 執行緒, 間隔 {args.delay} 秒/次")
     print()
 
     session = requests.Session()
@@ -119,16 +247,12 @@ def main():
     print(f"✅ 連通性 OK ({test['name']}, {test['stock_count']} 檔)")
     print()
 
-    found = {}
-    for tid in range(start_id, end_id + 1):
-        info = probe_id(tid, session)
-        if info:
-            found[str(tid)] = info
-            print(f"  id={tid:3d}  {info['name']:<30s}  ({info['stock_count']} 檔)")
-        else:
-            # 安靜略過
-            pass
-        time.sleep(args.delay)
+    cache = {} if args.refresh else load_probe_cache()
+    t0 = time.perf_counter()
+    found = scan_ids(start_id, end_id, cache, args.max_age, args.workers,
+                     args.delay, args.max_gap)
+    save_probe_cache(cache)
+    print(f"耗時 {time.perf_counter() - t0:.1f} 秒")
 
     print()
     print(f"=== 完成 ===")
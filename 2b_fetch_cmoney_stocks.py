@@ -8,19 +8,28 @@
 讀入: config/themes_config_cmoney.json
 輸出: data/theme_stocks_cmoney.json (含成分股 + 當日股價快照)
 
-執行時間: 約 30 秒 (15 次請求 x 1.5 秒)
+執行時間: 約 5-10 秒 (WORKERS 條執行緒併發, 同 host 間隔 REQUEST_INTERVAL 秒)
+
+每個題材的成分股代號算一個 member_hash, 跟上次輸出比對:
+  - output["changed_themes"]: 成分股有變動 (或新增) 的題材, 給 3v2_calc_theme_radar 增量重算
+  - 抓取失敗的題材沿用上次的成分股 (股價欄位清空, 標 stale), 不會從雷達上消失
 
 用法: python3 2b_fetch_cmoney_stocks.py
 """
 import requests
 from bs4 import BeautifulSoup
+import hashlib
 import re
 import json
-import time
 import os
 import sys
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from datetime import datetime
 
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "backend"))
+from rate_limiter import HostRateLimiter
+
 HEADERS = {
     "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 "
                   "(KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36",
@@ -31,6 +40,10 @@ URL_TEMPLATE = "https://www.cmoney.tw/forum/concept/{cid}"
 CONFIG_PATH = "config/themes_config_cmoney.json"
 OUTPUT_PATH = "data/theme_stocks_cmoney.json"
 
+WORKERS = 4
+REQUEST_INTERVAL = 0.5
+LIMITER = HostRateLimiter({"www.cmoney.tw": REQUEST_INTERVAL})
+
 
 def parse_price(s: str) -> float | None:
     """'2,215' → 2215.0, '-' → None"""
@@ -55,10 +68,27 @@ def parse_volume(s: str) -> int | None:
         return None
 
 
+def member_hash(stocks: list[dict]) -> str:
+    """成分股代號 (不含股價) 的雜湊, 用來判斷題材成分有沒有變"""
+    codes = ",".join(sorted(s["code"] for s in stocks))
+    return hashlib.sha1(codes.encode("utf-8")).hexdigest()[:16]
+
+
+def load_previous() -> dict:
+    """上次輸出的題材資料 (沒有或壞掉回傳 {})"""
+    if not os.path.exists(OUTPUT_PATH):
+        return {}
+    try:
+        with open(OUTPUT_PATH, encoding="utf-8") as f:
+            return json.load(f).get("themes", {})
+    except Exception:
+        return {}
+
+
 def fetch_theme(theme_key: str, cid: str, session: requests.Session) -> dict:
     """抓取單一題材的成分股 (含股價快照)"""
     url = URL_TEMPLATE.format(cid=cid)
-    resp = session.get(url, timeout=15)
+    resp = LIMITER.get(url, session=session, timeout=15)
     resp.raise_for_status()
 
     soup = BeautifulSoup(resp.text, "lxml")
@@ -132,36 +162,68 @@ def main():
 
     print(f"=== 抓取 {len(themes)} 個題材的成分股 ===\n")
 
-    session = requests.Session()
-    session.headers.update(HEADERS)
+    previous = load_previous()
+    local = threading.local()
 
-    result = {}
-    failed = []
+    def fetch(theme_key, cid):
+        # requests.Session 不保證執行緒安全, 每條執行緒一個
+        if not hasattr(local, "session"):
+            local.session = requests.Session()
+            local.session.headers.update(HEADERS)
+        return fetch_theme(theme_key, cid, local.session)
 
-    for theme_key, cid in themes.items():
-        try:
-            data = fetch_theme(theme_key, cid, session)
+    fetched = {}
+    failed = []
+    with ThreadPoolExecutor(max_workers=WORKERS) as ex:
+        futures = {ex.submit(fetch, k, cid): k for k, cid in themes.items()}
+        for fut in as_completed(futures):
+            theme_key = futures[fut]
+            cid = themes[theme_key]
+            try:
+                data = fut.result()
+            except Exception as e:
+                print(f"  ❌ {theme_key:<20s} ({cid}): {type(e).__name__}: {e}")
+                failed.append(theme_key)
+                continue
             n = len(data["stocks"])
             if n < 3:
                 print(f"  ⚠️  {theme_key:<20s} ({cid}): 只有 {n} 檔, 可能解析失敗")
                 failed.append(theme_key)
             else:
-                result[theme_key] = data
-                stock_codes = [s["code"] for s in data["stocks"]]
-                print(f"  ✅ {theme_key:<20s} ({cid}): {n} 檔 - {stock_codes}")
-        except Exception as e:
-            print(f"  ❌ {theme_key:<20s} ({cid}): {type(e).__name__}: {e}")
-            failed.append(theme_key)
-        time.sleep(1.5)
+                fetched[theme_key] = data
+
+    # 依設定檔順序組裝, 比對成分股雜湊
+    result = {}
+    changed = []
+    for theme_key, cid in themes.items():
+        data = fetched.get(theme_key)
+        prev = previous.get(theme_key)
+        if data is None:
+            if prev and prev.get("stocks"):
+                # 沿用上次成分股; 股價是舊的, 清掉讓雷達自己算
+                stale = [{**s, "price": None, "change": None, "change_pct": None, "volume": None}
+                         for s in prev["stocks"]]
+                result[theme_key] = {**prev, "stocks": stale, "stale": True}
+            continue
+        data["member_hash"] = member_hash(data["stocks"])
+        result[theme_key] = data
+        stock_codes = [s["code"] for s in data["stocks"]]
+        if prev is None or prev.get("member_hash") != data["member_hash"]:
+            changed.append(theme_key)
+            print(f"  ✅ {theme_key:<20s} ({cid}): {len(stock_codes)} 檔 (成分變動) - {stock_codes}")
+        else:
+            print(f"  ✅ {theme_key:<20s} ({cid}): {len(stock_codes)} 檔 (成分未變)")
 
     print()
     if failed:
         print(f"⚠️  失敗: {failed}")
+    print(f"成分變動: {len(changed)}/{len(result)} 個題材")
 
     os.makedirs(os.path.dirname(OUTPUT_PATH), exist_ok=True)
     output = {
         "updated_at": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
         "source": "CMoney",
+        "changed_themes": changed,
         "themes": result,
     }
     with open(OUTPUT_PATH, "w", encoding="utf-8") as f:
@@ -10,28 +10,49 @@
 輸出: data/theme_radar.json (給前端用的題材熱度排行)
 
 策略:
-  - 當日股價: CMoney 直接給, HiStock 沒給就從 Yahoo 補
-  - 5 日漲幅: 一律從 Yahoo Finance 算 (CMoney/HiStock 都沒有)
+  - 收盤價歷史: 優先讀本地 K 線庫 backend/data/kline_history/{code}.csv 的最後幾根
+  - K 線庫沒有/落後的個股: 下載一次 TWSE STOCK_DAY_ALL (全上市當日收盤) 補上今日
+  - 還是缺 5 日歷史的 (多半是上櫃): 才逐檔問 Yahoo; --offline 則完全不連網
+  - 當日漲幅: CMoney 直接給就用, 否則由收盤價歷史算
   - 加速度 = 今日漲幅 - (5日累積/5)
+  - 題材彙總 (平均/中位數漲幅、寬度、法人重疊數) 用 題材 × 個股 成員矩陣一次算完
+  - 資料日期 = 實際用到的收盤日: K 線庫落後最近交易日時, 先下載 STOCK_DAY_ALL, 以它的日期為準
+  - 增量重算: 資料日期沒變、題材輸入 (成分股/快照/法人) 的雜湊也沒變, 而且
+    2b_fetch_cmoney_stocks 沒標記成分變動 (changed_themes) 的題材, 直接沿用上次結果
 
-執行時間: 約 1-3 分鐘 (取決於成分股總數)
+執行時間: K 線庫已更新時 < 1 秒; 需要逐檔問 Yahoo 時約 1-3 分鐘
 
-用法: python3 3v2_calc_theme_radar.py
+用法: python3 3v2_calc_theme_radar.py [--offline]
 """
 import requests
+import csv
+import hashlib
 import json
 import os
 import sys
-import statistics
+import time
+import warnings
 from datetime import datetime
 from concurrent.futures import ThreadPoolExecutor, as_completed
 
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "backend"))
+from twse_json import fetch, parse_stock_day_all
+from json_export import write_json
+import trading_day
+
 CMONEY_PATH = "data/theme_stocks_cmoney.json"
 HISTOCK_PATH = "data/theme_stocks.json"
 FOREIGN_PATH = "data/foreign_top_stocks.json"
 OUTPUT_PATH = "data/theme_radar.json"
+KLINE_DIR = "backend/data/kline_history"
+
+# 算 5 日漲幅要 6 根收盤價
+HISTORY_BARS = 6
 
 YAHOO_URL = "https://query1.finance.yahoo.com/v8/finance/chart/{code}.{exch}?interval=1d&range=10d"
+STOCK_DAY_ALL_URL = "https://www.twse.com.tw/rwd/zh/afterTrading/STOCK_DAY_ALL?response=json"
 HEADERS = {
     "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 "
                   "(KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36",
@@ -77,6 +98,169 @@ def fetch_yahoo_history(code: str) -> dict | None:
     return None
 
 
+def read_kline_tail(code: str, n: int = HISTORY_BARS) -> list[dict]:
+    """讀 K 線庫 CSV 的最後 n 根 (只讀檔尾, 不解析整份 10 年資料)"""
+    path = os.path.join(KLINE_DIR, f"{code}.csv")
+    if not os.path.exists(path):
+        return []
+    try:
+        with open(path, "rb") as f:
+            f.seek(0, os.SEEK_END)
+            size = f.tell()
+            f.seek(max(0, size - 96 * (n + 2)))
+            lines = f.read().decode("utf-8").splitlines()
+        rows = []
+        for row in csv.reader(lines[-n:]):
+            if len(row) < 6 or row[0] == "date":
+                continue
+            rows.append({"date": row[0], "close": float(row[4]), "volume": int(float(row[5]))})
+        return rows
+    except Exception:
+        return []
+
+
+def fetch_stock_day_all() -> tuple[str | None, dict]:
+    """下載 TWSE STOCK_DAY_ALL (一次請求拿全上市當日收盤), 回傳 (YYYY-MM-DD, {code: {...}})"""
+    try:
+        meta, q = fetch(STOCK_DAY_ALL_URL, parse_stock_day_all,
+                        fields=["code", "close", "prev_close", "volume"], headers=HEADERS, timeout=20)
+    except Exception as e:
+        print(f"⚠️  STOCK_DAY_ALL 下載失敗: {e}", file=sys.stderr)
+        return None, {}
+    if meta.get("stat") != "OK":
+        return None, {}
+
+    raw_date = str(meta.get("date", ""))
+    day = f"{raw_date[:4]}-{raw_date[4:6]}-{raw_date[6:8]}" if len(raw_date) == 8 else None
+
+    # 收盤/漲跌缺值或不比價 (除權息) 的不收, 稍後問 Yahoo
+    ok = np.isfinite(q["close"]) & np.isfinite(q["prev_close"]) & np.isfinite(q["volume"])
+    quotes = {
+        code: {"close": close, "prev_close": prev_close, "volume": int(volume)}
+        for code, close, prev_close, volume in zip(
+            q["code"][ok].tolist(), q["close"][ok].tolist(),
+            q["prev_close"][ok].tolist(), q["volume"][ok].tolist())
+    }
+    return day, quotes
+
+
+def latest_date(tails: dict) -> str | None:
+    """K 線庫裡最新的日期"""
+    return max((t[-1]["date"] for t in tails.values() if t), default=None)
+
+
+def effective_data_date(store_date: str | None, offline: bool = False) -> tuple[str | None, tuple | None]:
+    """
+    這次計算實際用到的收盤日期 (決定能否沿用上次結果)
+
+    K 線庫已到最近交易日 → K 線庫日期; 落後 → 先下載 STOCK_DAY_ALL, 以它的日期為準;
+    STOCK_DAY_ALL 也拿不到 → 缺的會問 Yahoo, 以最近交易日為準
+    Returns: (data_date, stock_day_all), stock_day_all 為已下載的 (day, quotes), 沒下載為 None
+    """
+    if offline:
+        return store_date, None
+    try:
+        market = trading_day.latest_trading_day()
+    except Exception:
+        market = None
+    market = market.strftime("%Y-%m-%d") if market else None
+    if store_date and (market is None or store_date >= market):
+        return store_date, None
+
+    day, quotes = fetch_stock_day_all()
+    if quotes and day:
+        return max(d for d in (store_date, day) if d), (day, quotes)
+    return market or store_date, (day, quotes)
+
+
+def load_close_history(codes: list[str], offline: bool = False, tails: dict | None = None,
+                       stock_day_all: tuple | None = None) -> dict:
+    """
+    取得每檔最近 HISTORY_BARS 根收盤價
+
+    K 線庫 → STOCK_DAY_ALL (一次請求) → Yahoo (逐檔), offline=True 只用 K 線庫
+    tails: 已讀好的 {code: read_kline_tail(code)} (可省略)
+    stock_day_all: 已下載的 fetch_stock_day_all() 結果 (可省略, 需要時才下載)
+    Returns: {code: {"closes": [...], "volume": int}}, closes 由舊到新
+    """
+    tails = {c: tails[c] if tails and c in tails else read_kline_tail(c) for c in codes}
+    dates = sorted({b["date"] for t in tails.values() for b in t[-2:]})
+    latest = dates[-1] if dates else None
+
+    history = {}
+    pending = []
+    for code, tail in tails.items():
+        if len(tail) == HISTORY_BARS and tail[-1]["date"] == latest:
+            history[code] = {"closes": [b["close"] for b in tail], "volume": tail[-1]["volume"]}
+        else:
+            pending.append(code)
+    print(f"K 線庫: {len(history)}/{len(codes)} 檔 (最新 {latest or '無'})")
+    if offline or not pending:
+        return history
+
+    # 不在 K 線庫或落後的: 用 STOCK_DAY_ALL 補上今日那根
+    day, quotes = stock_day_all if stock_day_all is not None else fetch_stock_day_all()
+    if quotes:
+        if latest and day and day > latest:
+            # K 線庫整體落後一天: 最新的也一併接上今日
+            pending = list(codes)
+            history = {}
+            prev_day = latest
+        else:
+            prev_day = dates[-2] if len(dates) > 1 else None
+        still = []
+        for code in pending:
+            q = quotes.get(code)
+            if not q:
+                still.append(code)
+                continue
+            tail = [b for b in tails[code] if not day or b["date"] < day]
+            if len(tail) >= HISTORY_BARS - 1 and tail[-1]["date"] == prev_day:
+                closes = [b["close"] for b in tail[-(HISTORY_BARS - 1):]] + [q["close"]]
+                history[code] = {"closes": closes, "volume": q["volume"]}
+            else:
+                # 歷史不足或有缺口: 先放今日漲幅, 5 日漲幅稍後問 Yahoo
+                history[code] = {"closes": [q["prev_close"], q["close"]], "volume": q["volume"]}
+                still.append(code)
+        pending = still
+        print(f"STOCK_DAY_ALL ({day}): 補齊後還缺 {len(pending)}/{len(codes)} 檔")
+
+    if not pending:
+        return history
+
+    print(f"需查詢 {len(pending)} 檔個股的 Yahoo 歷史資料 (算 5 日漲幅)...")
+    found = 0
+    with ThreadPoolExecutor(max_workers=8) as ex:
+        future_to_code = {ex.submit(fetch_yahoo_history, c): c for c in pending}
+        for f in as_completed(future_to_code):
+            info = f.result()
+            if not info:
+                continue
+            # Yahoo 只回漲幅, 換算成等價的收盤價序列
+            close = info["today_close"]
+            prev = close / (1 + info["today_change_pct"] / 100)
+            first = close / (1 + info["five_day_change_pct"] / 100)
+            closes = [first] + [prev] * (HISTORY_BARS - 2) + [close]
+            history[future_to_code[f]] = {"closes": closes, "volume": info["today_volume"]}
+            found += 1
+    print(f"✅ Yahoo 抓到 {found}/{len(pending)} 檔")
+    return history
+
+
+def stock_changes(codes: list[str], history: dict) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """收盤價歷史 → (今日漲幅%, 5 日漲幅%, 今日收盤), 缺資料為 NaN"""
+    closes = np.full((len(codes), HISTORY_BARS), np.nan)
+    for i, code in enumerate(codes):
+        h = history.get(code)
+        if h:
+            c = h["closes"][-HISTORY_BARS:]
+            closes[i, HISTORY_BARS - len(c):] = c
+    with np.errstate(divide="ignore", invalid="ignore"):
+        today = (closes[:, -1] - closes[:, -2]) / closes[:, -2] * 100
+        five_day = (closes[:, -1] - closes[:, 0]) / closes[:, 0] * 100
+    return today, five_day, closes[:, -1]
+
+
 def load_foreign_buy_codes() -> tuple[set, set, set]:
     """載入法人買超個股, 回傳 (外資買超, 投信買超, 雙買) 三個集合"""
     if not os.path.exists(FOREIGN_PATH):
@@ -114,9 +298,10 @@ def load_foreign_buy_codes() -> tuple[set, set, set]:
         return set(), set(), set()
 
 
-def merge_theme_data() -> tuple[dict, str]:
-    """合併 CMoney 與 HiStock 來源, 統一格式"""
+def merge_theme_data() -> tuple[dict, str, set]:
+    """合併 CMoney 與 HiStock 來源, 統一格式; 另回傳 CMoney 標記成分變動的題材"""
     sources_used = []
+    changed = set()
     merged = {}  # {theme_key: {stocks: [{code, name, ...}], source: "cmoney"|"histock"}}
 
     # 優先載入 CMoney (有今日股價)
@@ -130,6 +315,7 @@ def merge_theme_data() -> tuple[dict, str]:
             }
         if cmoney_data.get("themes"):
             sources_used.append("CMoney")
+        changed = set(cmoney_data.get("changed_themes", cmoney_data.get("themes", {}).keys()))
 
     # 補充載入 HiStock (沒有今日股價, 要從 Yahoo 補)
     if os.path.exists(HISTOCK_PATH):
@@ -146,7 +332,25 @@ def merge_theme_data() -> tuple[dict, str]:
         if histock_data.get("themes"):
             sources_used.append("HiStock")
 
-    return merged, " + ".join(sources_used) if sources_used else "(none)"
+    return merged, " + ".join(sources_used) if sources_used else "(none)", changed
+
+
+def theme_input_hash(tdata: dict, foreign_buy: set, trust_buy: set) -> str:
+    """題材輸入的雜湊: 成分股、來源給的快照、法人買超標記 (收盤價另由資料日期判斷)"""
+    key = [(s["code"], s.get("price"), s.get("change_pct"), s.get("volume"),
+            s["code"] in foreign_buy, s["code"] in trust_buy)
+           for s in sorted(tdata["stocks"], key=lambda x: x["code"])]
+    return hashlib.sha1(json.dumps(key).encode("utf-8")).hexdigest()[:16]
+
+
+def load_previous_radar() -> dict:
+    if not os.path.exists(OUTPUT_PATH):
+        return {}
+    try:
+        with open(OUTPUT_PATH, encoding="utf-8") as f:
+            return json.load(f)
+    except Exception:
+        return {}
 
 
 def status_label(score: dict) -> str:
@@ -169,7 +373,8 @@ def status_label(score: dict) -> str:
 
 
 def main():
-    merged, sources = merge_theme_data()
+    offline = "--offline" in sys.argv[1:]
+    merged, sources, changed_themes = merge_theme_data()
     if not merged:
         print(f"❌ 找不到任何題材資料")
         print(f"   請先執行 2b_fetch_cmoney_stocks.py 或 2_fetch_theme_stocks.py")
@@ -183,97 +388,131 @@ def main():
           f"雙買: {len(both_buy)} 檔")
     print()
 
-    # 收集所有需要查詢 5 日歷史的代號
-    all_codes = set()
-    for tdata in merged.values():
-        for s in tdata["stocks"]:
-            all_codes.add(s["code"])
-    print(f"需查詢 {len(all_codes)} 檔個股的 Yahoo 歷史資料 (算 5 日漲幅)...")
-
-    # 並行抓 Yahoo
-    yahoo_cache = {}
-    with ThreadPoolExecutor(max_workers=8) as ex:
-        future_to_code = {ex.submit(fetch_yahoo_history, c): c for c in all_codes}
-        completed = 0
-        for f in as_completed(future_to_code):
-            code = future_to_code[f]
-            info = f.result()
-            if info:
-                yahoo_cache[code] = info
-            completed += 1
-            if completed % 20 == 0:
-                print(f"  ... {completed}/{len(all_codes)}")
-    print(f"✅ Yahoo 抓到 {len(yahoo_cache)}/{len(all_codes)} 檔")
-    print()
-
-    # 計算每個題材
+    t0 = time.perf_counter()
+
+    # 資料日期 + 每個題材的輸入雜湊, 跟上次輸出比對決定哪些題材要重算
+    all_codes = {s["code"] for tdata in merged.values() for s in tdata["stocks"]}
+    tails = {c: read_kline_tail(c) for c in all_codes}
+    data_date, stock_day_all = effective_data_date(latest_date(tails), offline)
+    hashes = {tk: theme_input_hash(tdata, foreign_buy, trust_buy) for tk, tdata in merged.items()}
+
+    previous = load_previous_radar()
+    reused = []
+    if previous.get("data_date") and previous.get("data_date") == data_date:
+        prev_scores = {p["theme"]: p for p in previous.get("themes", [])}
+        for tk in merged:
+            prev = prev_scores.get(tk)
+            if prev and tk not in changed_themes and prev.get("input_hash") == hashes[tk]:
+                reused.append({**prev, "members_changed": False})
+    reused_keys = {p["theme"] for p in reused}
+    print(f"資料日期: {data_date or '無'}, 沿用上次結果 {len(reused)}/{len(merged)} 個題材, "
+          f"成分變動 {len(changed_themes & set(merged))} 個")
+
+    # 要重算的題材的成分股 (保持首次出現順序) 與 題材 × 個股 成員矩陣
+    theme_keys = [tk for tk in merged if tk not in reused_keys]
+    code_index = {}
+    for tk in theme_keys:
+        for s in merged[tk]["stocks"]:
+            code_index.setdefault(s["code"], len(code_index))
+    codes = list(code_index)
+
+    history = load_close_history(codes, offline=offline, tails=tails,
+                                 stock_day_all=stock_day_all) if codes else {}
+    today, five_day, last_close = stock_changes(codes, history)
+
+    # 今日漲幅: CMoney 提供就用 (同一檔在各題材是同一份快照)
+    quoted = {}
+    for tk in theme_keys:
+        for s in merged[tk]["stocks"]:
+            if s.get("change_pct") is not None:
+                quoted.setdefault(s["code"], s["change_pct"])
+    for code, pct in quoted.items():
+        today[code_index[code]] = pct
+
+    today = np.round(today, 2)
+    five_day = np.round(five_day, 2)
+    valid = ~np.isnan(today) & ~np.isnan(five_day)
+
+    member = np.zeros((len(theme_keys), len(codes)), dtype=bool)
+    for t, tk in enumerate(theme_keys):
+        for s in merged[tk]["stocks"]:
+            member[t, code_index[s["code"]]] = True
+    member &= valid[None, :]
+
+    foreign_mask = np.array([c in foreign_buy for c in codes], dtype=bool)
+    trust_mask = np.array([c in trust_buy for c in codes], dtype=bool)
+    both_mask = np.array([c in both_buy for c in codes], dtype=bool)
+
+    counts = member.sum(axis=1)
+    weights = member.astype(np.float64)
+    today0 = np.where(valid, today, 0.0)
+    five0 = np.where(valid, five_day, 0.0)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        avg_today = weights @ today0 / counts
+        avg_5d = weights @ five0 / counts
+        breadth = (member & (today0 > 0)[None, :]).sum(axis=1) / counts * 100
+    with warnings.catch_warnings():
+        # 沒有有效成分股的題材整列都是 NaN, 後面會跳過
+        warnings.simplefilter("ignore", RuntimeWarning)
+        median_today = np.nanmedian(np.where(member, today0[None, :], np.nan), axis=1)
+        median_5d = np.nanmedian(np.where(member, five0[None, :], np.nan), axis=1)
+    accel = avg_today - avg_5d / 5
+    foreign_cnt = (member & foreign_mask[None, :]).sum(axis=1)
+    trust_cnt = (member & trust_mask[None, :]).sum(axis=1)
+    both_cnt = (member & both_mask[None, :]).sum(axis=1)
+
+    # 組每個題材的輸出 (只剩 leaders/laggards 需要逐檔)
     radar = []
-    for theme_key, tdata in merged.items():
+    for t, theme_key in enumerate(theme_keys):
+        tdata = merged[theme_key]
+        n = int(counts[t])
+        if n == 0:
+            print(f"  ⚠️  {theme_key}: 無有效個股資料, 跳過")
+            continue
+
         stock_results = []
         for s in tdata["stocks"]:
-            code = s["code"]
-            yh = yahoo_cache.get(code)
-
-            # 今日漲幅: CMoney 提供就用, 否則從 Yahoo
-            if s.get("change_pct") is not None:
-                today_pct = s["change_pct"]
-            elif yh:
-                today_pct = yh["today_change_pct"]
-            else:
-                continue  # 沒資料, 跳過
-
-            # 5 日漲幅: 只能從 Yahoo
-            if not yh:
+            i = code_index[s["code"]]
+            if not member[t, i]:
                 continue
-
+            h = history.get(s["code"], {})
             stock_results.append({
-                "code": code,
+                "code": s["code"],
                 "name": s.get("name", ""),
-                "price": s.get("price") or yh["today_close"],
-                "change_pct": round(today_pct, 2),
-                "five_day_pct": round(yh["five_day_change_pct"], 2),
-                "volume": s.get("volume") or yh["today_volume"],
-                "foreign_buy": code in foreign_buy,
-                "trust_buy": code in trust_buy,
-                "both_buy": code in both_buy,
+                "price": s.get("price") or float(last_close[i]),
+                "change_pct": float(today[i]),
+                "five_day_pct": float(five_day[i]),
+                "volume": s.get("volume") or h.get("volume"),
+                "foreign_buy": bool(foreign_mask[i]),
+                "trust_buy": bool(trust_mask[i]),
+                "both_buy": bool(both_mask[i]),
             })
-
-        if not stock_results:
-            print(f"  ⚠️  {theme_key}: 無有效個股資料, 跳過")
-            continue
-
-        today_pcts = [s["change_pct"] for s in stock_results]
-        five_day_pcts = [s["five_day_pct"] for s in stock_results]
-
-        avg_today = statistics.mean(today_pcts)
-        avg_5d = statistics.mean(five_day_pcts)
-        accel = avg_today - avg_5d / 5
-
-        rising = sum(1 for s in stock_results if s["change_pct"] > 0)
-        breadth = rising / len(stock_results) * 100
-        foreign_cnt = sum(1 for s in stock_results if s["foreign_buy"])
-        trust_cnt = sum(1 for s in stock_results if s["trust_buy"])
-        both_cnt = sum(1 for s in stock_results if s["both_buy"])
-
         sorted_stocks = sorted(stock_results, key=lambda x: x["change_pct"], reverse=True)
 
         score = {
             "theme": theme_key,
             "source": tdata["source"],
-            "stock_count": len(stock_results),
-            "avg_today_change_pct": round(avg_today, 2),
-            "avg_5d_change_pct": round(avg_5d, 2),
-            "acceleration": round(accel, 2),
-            "breadth_pct": round(breadth, 1),
-            "foreign_buy_count": foreign_cnt,
-            "trust_buy_count": trust_cnt,
-            "both_buy_count": both_cnt,
-            "foreign_buy_ratio": round(foreign_cnt / len(stock_results) * 100, 1),
+            "stock_count": n,
+            "avg_today_change_pct": round(float(avg_today[t]), 2),
+            "avg_5d_change_pct": round(float(avg_5d[t]), 2),
+            "median_today_change_pct": round(float(median_today[t]), 2),
+            "median_5d_change_pct": round(float(median_5d[t]), 2),
+            "acceleration": round(float(accel[t]), 2),
+            "breadth_pct": round(float(breadth[t]), 1),
+            "foreign_buy_count": int(foreign_cnt[t]),
+            "trust_buy_count": int(trust_cnt[t]),
+            "both_buy_count": int(both_cnt[t]),
+            "foreign_buy_ratio": round(int(foreign_cnt[t]) / n * 100, 1),
             "leaders": sorted_stocks[:5],
             "laggards": sorted_stocks[-3:][::-1],
+            "input_hash": hashes[theme_key],
+            "members_changed": theme_key in changed_themes,
         }
         score["status"] = status_label(score)
         radar.append(score)
+    radar.extend(reused)
+    print(f"計算完成: {time.perf_counter() - t0:.2f} 秒")
+    print()
 
     # 排序: 5 日漲幅由大到小
     radar.sort(key=lambda x: x["avg_5d_change_pct"], reverse=True)
@@ -297,10 +536,11 @@ def main():
     output = {
         "updated_at": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
         "sources": sources,
+        "data_date": data_date,
+        "changed_themes": sorted(changed_themes & set(merged)),
         "themes": radar,
     }
-    with open(OUTPUT_PATH, "w", encoding="utf-8") as f:
-        json.dump(output, f, ensure_ascii=False, indent=2)
+    write_json(OUTPUT_PATH, output)
     print(f"\n已儲存: {OUTPUT_PATH}")
 
 
@@ -9,7 +9,6 @@
 可獨立執行(測試),也可被 run_daily.py import。
 """
 
-import json
 import sys
 from datetime import datetime
 from pathlib import Path
@@ -20,6 +19,7 @@ sys.path.insert(0, str(Path(__file__).parent.parent))
 from ai_summary.context_builder import build_market_context
 from ai_summary.prompt_templates import SYSTEM_PROMPT, build_market_user_prompt
 from ai_summary.claude_client import client, MODEL
+from json_export import write_json
 
 # 輸出檔案路徑
 OUTPUT_PATH = Path(__file__).parent.parent / "data" / "ai_summary.json"
@@ -78,10 +78,8 @@ def generate_and_save() -> dict:
         },
     }
 
-    # 5. 寫檔(用 utf-8 + 美化排版)
-    OUTPUT_PATH.parent.mkdir(parents=True, exist_ok=True)
-    with open(OUTPUT_PATH, "w", encoding="utf-8") as f:
-        json.dump(result, f, ensure_ascii=False, indent=2)
+    # 5. 寫檔(共用寫檔器:原子寫入 + 記錄到 export_manifest,推播給前端)
+    write_json(OUTPUT_PATH, result, volatile=("generated_at",))
 
     print(f"✅ 已寫入 {OUTPUT_PATH}")
     return result
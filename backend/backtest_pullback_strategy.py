@@ -31,6 +31,9 @@ import requests
 import pandas as pd
 import numpy as np
 
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+from indicators import sma, macd, kd, rolling_quantile, rolling_max
+
 logging.basicConfig(level=logging.INFO, format='%(message)s')
 log = logging.getLogger(__name__)
 
@@ -89,7 +92,7 @@ def fetch_twii(days: int = 365) -> pd.DataFrame:
     df = df.set_index("date").sort_index()
 
     # 計算 MA60 + 多頭判斷
-    df["ma60"] = df["close"].rolling(60).mean()
+    df["ma60"] = sma(df["close"], 60)
     df["bullish"] = df["close"] > df["ma60"]
     return df
 
@@ -98,38 +101,21 @@ def fetch_twii(days: int = 365) -> pd.DataFrame:
 # 技術指標計算
 # ═══════════════════════════════════════════════════════════
 def add_indicators(df: pd.DataFrame) -> pd.DataFrame:
-    """計算 MA / MACD / KD"""
+    """計算 MA / MACD / KD（向量化核心在 indicators.py）"""
+    close = df["close"].to_numpy(dtype=float)
+
     # 均線
-    df["ma20"] = df["close"].rolling(20).mean()
-    df["ma60"] = df["close"].rolling(60).mean()
-
-    # MACD（標準參數 12, 26, 9）
-    ema12 = df["close"].ewm(span=12, adjust=False).mean()
-    ema26 = df["close"].ewm(span=26, adjust=False).mean()
-    df["dif"] = ema12 - ema26
-    df["macd"] = df["dif"].ewm(span=9, adjust=False).mean()
-    df["osc"] = df["dif"] - df["macd"]  # MACD 柱
-
-    # KD（用簡化版 9 日 RSV、3 日平滑）
-    low9 = df["low"].rolling(9).min()
-    high9 = df["high"].rolling(9).max()
-    rsv = (df["close"] - low9) / (high9 - low9) * 100
-
-    # K 和 D 用遞迴平滑（傳統 Wilder 平滑、近似實作）
-    k = pd.Series(index=df.index, dtype=float)
-    d = pd.Series(index=df.index, dtype=float)
-    k.iloc[0] = 50
-    d.iloc[0] = 50
-    for i in range(1, len(df)):
-        rsv_i = rsv.iloc[i]
-        if pd.isna(rsv_i):
-            k.iloc[i] = k.iloc[i-1]
-            d.iloc[i] = d.iloc[i-1]
-        else:
-            k.iloc[i] = (2/3) * k.iloc[i-1] + (1/3) * rsv_i
-            d.iloc[i] = (2/3) * d.iloc[i-1] + (1/3) * k.iloc[i]
-    df["k"] = k
-    df["d"] = d
+    df["ma20"] = sma(close, 20)
+    df["ma60"] = sma(close, 60)
+
+    # MACD（標準參數 12, 26, 9；EMA 起始值同 pandas ewm(adjust=False)）
+    dif, signal_line, osc = macd(close, 12, 26, 9, seed='first')
+    df["dif"] = dif
+    df["macd"] = signal_line
+    df["osc"] = osc  # MACD 柱
+
+    # KD（9 日 RSV、1/3 遞迴平滑；RSV 無法計算時沿用前值）
+    df["k"], df["d"] = kd(df["high"], df["low"], close, period=9)
 
     return df
 
@@ -173,7 +159,7 @@ def detect_signals(df: pd.DataFrame, osc_lookback: int = 60, osc_pct: float = 0.
     df["cond1"] = cond1
 
     # 條件 ②：OSC 深度負值
-    osc_threshold = df["osc"].rolling(osc_lookback).quantile(osc_pct)
+    osc_threshold = pd.Series(rolling_quantile(df["osc"], osc_lookback, osc_pct), index=df.index)
     osc_at_deep = df["osc"] <= osc_threshold
 
     if strategy == "v2_F":
@@ -204,8 +190,8 @@ def detect_signals(df: pd.DataFrame, osc_lookback: int = 60, osc_pct: float = 0.
 
     # 條件 ④（可選）：最近 N 天內有創 240 日新高
     if require_recent_high:
-        rolling_max = df["high"].rolling(high_lookback).max()
-        is_new_high = df["high"] >= rolling_max
+        high_max = pd.Series(rolling_max(df["high"], high_lookback), index=df.index)
+        is_new_high = df["high"] >= high_max
         cond4 = is_new_high.rolling(high_within_days).max().astype(bool)
         df["cond4"] = cond4
     else:
@@ -9,26 +9,39 @@
   3. 本地 JSON 手動補充 (覆蓋/微調)
 
 輸出: data/concept_stocks.json
+
+Yahoo 分類頁用 YAHOO_WORKERS 條執行緒併發抓 (同 host 間隔 YAHOO_INTERVAL 秒)，
+並帶上次的 ETag / Last-Modified 做條件式請求，304 就沿用上次解析結果。
+enrich_signals_with_concepts 共用一份記憶體內的 代號 → 概念 反向索引，
+concept_stocks.json 沒變就不重讀。
 """
 
 import json
 import os
 import re
-import time
-import requests
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 from pathlib import Path
 
+from rate_limiter import HostRateLimiter
+
 try:
-    from bs4 import BeautifulSoup
-    HAS_BS4 = True
+    from html_tables import extract_links
+    HAS_LXML = True
 except ImportError:
-    HAS_BS4 = False
-    print("⚠ beautifulsoup4 未安裝，Yahoo 爬蟲功能無法使用")
+    HAS_LXML = False
+    print("⚠ lxml 未安裝，Yahoo 爬蟲功能無法使用")
 
 DATA_DIR = Path(__file__).parent / 'data'
 OUTPUT_FILE = DATA_DIR / 'concept_stocks.json'
 MANUAL_FILE = DATA_DIR / 'concept_stocks_manual.json'
+HTTP_CACHE_FILE = DATA_DIR / 'concept_stocks_http_cache.json'
+
+YAHOO_URL = 'https://tw.stock.yahoo.com/class-quote'
+YAHOO_WORKERS = 4
+YAHOO_INTERVAL = 0.5
+LIMITER = HostRateLimiter({'tw.stock.yahoo.com': YAHOO_INTERVAL})
 
 HEADERS = {
     'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 '
@@ -143,35 +156,65 @@ CONCEPT_DEFINITIONS = {
 }
 
 
-def fetch_yahoo_concept(category_label):
-    if not HAS_BS4:
-        return []
+QUOTE_HREF_RE = re.compile(r'/quote/(\d{4,6})(?:\.TW)?')
+
+
+def _parse_concept_page(text):
+    """分類頁 HTML → [{stock_id, name}]，先找 __NEXT_DATA__，沒有再掃 /quote/ 連結"""
+    match = re.search(
+        r'<script id="__NEXT_DATA__" type="application/json">(.*?)</script>',
+        text
+    )
+    if match:
+        next_data = json.loads(match.group(1))
+        stocks = _extract_stocks(next_data)
+        if stocks:
+            return _dedupe(stocks)
+
     stocks = []
+    for href, link_text in extract_links(text, QUOTE_HREF_RE):
+        m = QUOTE_HREF_RE.search(href)
+        if len(m.group(1)) == 4:
+            stocks.append({'stock_id': m.group(1), 'name': link_text})
+    return _dedupe(stocks)
+
+
+def fetch_yahoo_concept_cached(category_label, cached=None):
+    """
+    條件式抓 Yahoo 分類頁
+
+    cached: 上次的 {'etag', 'last_modified', 'stocks'}（可為 None）
+    Returns: (stocks, entry, not_modified)，entry 是要存回快取的新 {'etag', 'last_modified', 'stocks'}
+    """
+    if not HAS_LXML:
+        return [], cached, False
+    headers = dict(HEADERS)
+    if cached and cached.get('stocks'):
+        if cached.get('etag'):
+            headers['If-None-Match'] = cached['etag']
+        if cached.get('last_modified'):
+            headers['If-Modified-Since'] = cached['last_modified']
     try:
-        url = 'https://tw.stock.yahoo.com/class-quote'
         params = {'category': category_label, 'categoryLabel': '概念股'}
-        resp = requests.get(url, params=params, headers=HEADERS, timeout=15)
+        resp = LIMITER.get(YAHOO_URL, params=params, headers=headers, timeout=15)
+        if resp.status_code == 304 and cached:
+            return cached['stocks'], cached, True
         resp.raise_for_status()
-
-        match = re.search(
-            r'<script id="__NEXT_DATA__" type="application/json">(.*?)</script>',
-            resp.text
-        )
-        if match:
-            next_data = json.loads(match.group(1))
-            stocks = _extract_stocks(next_data)
-            if stocks:
-                return _dedupe(stocks)
-
-        soup = BeautifulSoup(resp.text, 'html.parser')
-        for link in soup.find_all('a', href=True):
-            m = re.search(r'/quote/(\d{4,6})(?:\.TW)?', link.get('href', ''))
-            if m and len(m.group(1)) == 4:
-                stocks.append({'stock_id': m.group(1), 'name': link.get_text(strip=True)})
-        return _dedupe(stocks)
+        stocks = _parse_concept_page(resp.text)
+        entry = {
+            'etag': resp.headers.get('ETag'),
+            'last_modified': resp.headers.get('Last-Modified'),
+            'stocks': stocks,
+        }
+        return stocks, entry, False
     except Exception as e:
         print(f"  ⚠ Yahoo爬取失敗 ({category_label}): {e}")
-        return []
+        # 失敗就沿用上次抓到的成分股，不讓一次請求失敗清空整個概念
+        return (cached or {}).get('stocks') or [], cached, False
+
+
+def fetch_yahoo_concept(category_label):
+    return fetch_yahoo_concept_cached(category_label)[0]
 
 
 def _extract_stocks(data):
@@ -230,6 +273,33 @@ def collect_concept_stocks():
         except:
             pass
 
+    # 1. Yahoo 分類頁: 先併發抓完 (條件式請求), 下面再依定義順序組裝
+    http_cache = {}
+    if HTTP_CACHE_FILE.exists():
+        try:
+            with open(HTTP_CACHE_FILE, 'r', encoding='utf-8') as f:
+                http_cache = json.load(f)
+        except Exception:
+            http_cache = {}
+    categories = sorted({c['yahoo_category'] for c in CONCEPT_DEFINITIONS.values()
+                         if c.get('yahoo_category')})
+    yahoo_results = {}
+    with ThreadPoolExecutor(max_workers=YAHOO_WORKERS) as ex:
+        futures = {cat: ex.submit(fetch_yahoo_concept_cached, cat, http_cache.get(cat))
+                   for cat in categories}
+        for cat, fut in futures.items():
+            stocks, entry, not_modified = fut.result()
+            yahoo_results[cat] = (stocks, not_modified)
+            if entry:
+                http_cache[cat] = entry
+    unchanged = sum(1 for _, nm in yahoo_results.values() if nm)
+    print(f"\nYahoo 分類頁: {len(categories)} 頁, {unchanged} 頁未變動 (304)")
+    try:
+        with open(HTTP_CACHE_FILE, 'w', encoding='utf-8') as f:
+            json.dump(http_cache, f, ensure_ascii=False)
+    except Exception as e:
+        print(f"  ⚠ 寫入 {HTTP_CACHE_FILE.name} 失敗: {e}")
+
     concepts = {}
     stock_concepts = {}
 
@@ -238,19 +308,18 @@ def collect_concept_stocks():
         stock_ids = set()
         source = ''
 
-        # 1. Yahoo 爬蟲
+        # 1. Yahoo 爬蟲 (上面已併發抓好)
         yahoo_cat = config.get('yahoo_category', '')
         if yahoo_cat:
-            print(f"  嘗試 Yahoo ({yahoo_cat})...")
-            yahoo_stocks = fetch_yahoo_concept(yahoo_cat)
+            yahoo_stocks, not_modified = yahoo_results.get(yahoo_cat, ([], False))
             if yahoo_stocks:
                 for s in yahoo_stocks:
                     stock_ids.add(s['stock_id'])
-                print(f"  ✓ Yahoo: {len(yahoo_stocks)} 檔")
+                print(f"  ✓ Yahoo ({yahoo_cat}): {len(yahoo_stocks)} 檔"
+                      + (" (未變動)" if not_modified else ""))
                 source = 'yahoo'
             else:
-                print(f"  ✗ Yahoo 無資料")
-            time.sleep(1.5)
+                print(f"  ✗ Yahoo ({yahoo_cat}) 無資料")
 
         # 2. 內建清單
         if not stock_ids and config.get('builtin_stocks'):
@@ -301,6 +370,7 @@ def collect_concept_stocks():
     }
     with open(OUTPUT_FILE, 'w', encoding='utf-8') as f:
         json.dump(output, f, ensure_ascii=False, indent=2)
+    _set_concept_index(output)
 
     print(f"\n{'=' * 50}")
     print(f"✓ 已輸出: {OUTPUT_FILE}")
@@ -309,22 +379,54 @@ def collect_concept_stocks():
     return output
 
 
+# ============================================================
+# 代號 → 概念 反向索引（程序內共用）
+# ============================================================
+_index_lock = threading.Lock()
+_concept_index = None       # {stock_id: [{'id', 'label', 'color'}, ...]}
+_concept_index_mtime = None
+
+
+def _build_concept_index(data):
+    cm = data.get('concepts', {})
+    tags = {
+        cid: {'id': cid, 'label': cm.get(cid, {}).get('label', cid),
+              'color': cm.get(cid, {}).get('color', '#6B7280')}
+        for cids in data.get('stock_concepts', {}).values() for cid in cids
+    }
+    return {sid: [tags[c] for c in cids] for sid, cids in data.get('stock_concepts', {}).items()}
+
+
+def _set_concept_index(data):
+    global _concept_index, _concept_index_mtime
+    with _index_lock:
+        _concept_index = _build_concept_index(data)
+        _concept_index_mtime = OUTPUT_FILE.stat().st_mtime if OUTPUT_FILE.exists() else None
+
+
+def get_concept_index():
+    """代號 → 概念標籤 的索引；concept_stocks.json 沒變就沿用記憶體中的版本"""
+    global _concept_index, _concept_index_mtime
+    if not OUTPUT_FILE.exists():
+        return {}
+    mtime = OUTPUT_FILE.stat().st_mtime
+    with _index_lock:
+        if _concept_index is None or mtime != _concept_index_mtime:
+            with open(OUTPUT_FILE, 'r', encoding='utf-8') as f:
+                _concept_index = _build_concept_index(json.load(f))
+            _concept_index_mtime = mtime
+        return _concept_index
+
+
 def enrich_signals_with_concepts(signals):
     """為 MACD 訊號股加上概念標籤"""
     if not OUTPUT_FILE.exists():
         return signals
     try:
-        with open(OUTPUT_FILE, 'r', encoding='utf-8') as f:
-            data = json.load(f)
-        sc = data.get('stock_concepts', {})
-        cm = data.get('concepts', {})
+        index = get_concept_index()
         for signal in signals:
             sid = signal.get('code', signal.get('stock_id', ''))
-            cids = sc.get(sid, [])
-            signal['concepts'] = [
-                {'id': c, 'label': cm.get(c, {}).get('label', c), 'color': cm.get(c, {}).get('color', '#6B7280')}
-                for c in cids
-            ]
+            signal['concepts'] = [dict(tag) for tag in index.get(sid, [])]
         return signals
     except Exception as e:
         print(f"  ⚠ 概念股標籤失敗: {e}")
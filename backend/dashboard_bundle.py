@@ -0,0 +1,197 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+儀表板合併資料包
+=================================
+dashboard.html 首次載入要抓十幾個 JSON，每個都是一次來回。這裡把它們合併成
+data/dashboard_bundle.json（經 json_export.write_json，所以也有 .gz 與雜湊檔名），
+每次匯出跑完建一次；watchlist_server 的 /api/dashboard 直接送預先序列化好的 bytes。
+
+結構:
+    {
+        "built_at": "...",
+        "sources": {"market_data": {"file": "market_data.json", "mtime": ...}, ...},
+        "market_data": {...},
+        "futures_data": {...},
+        ...
+    }
+
+使用方式:
+    python3 dashboard_bundle.py          # run_daily 最後一步
+    from dashboard_bundle import BundleCache
+    body, gz_body, etag = cache.get(fields=['market_data', 'macd_signal_stocks.scan_date'])
+"""
+import gzip
+import hashlib
+import json
+import threading
+from collections import OrderedDict
+from datetime import datetime
+from pathlib import Path
+
+from json_export import dumps, load_manifest, write_json
+
+DATA_DIR = Path(__file__).parent / 'data'
+BUNDLE_NAME = 'dashboard_bundle.json'
+META_KEYS = ('built_at', 'sources')
+
+# 區塊名稱 → 檔名（dashboard.html 首屏用到的）
+BUNDLE_SOURCES = {
+    'market_data': 'market_data.json',
+    'futures_data': 'futures_data.json',
+    'industry_heatmap': 'industry_heatmap.json',
+    'macd_signal_stocks': 'macd_signal_stocks.json',
+    'new_high_stocks': 'new_high_stocks.json',
+    'turnover_analysis': 'turnover_analysis.json',
+    'disposal_stocks': 'disposal_stocks.json',
+    'pullback_signal_latest': 'pullback_signal_latest.json',
+    'theme_radar': 'theme_radar.json',
+    'ai_summary': 'ai_summary.json',
+    'foreign_top_stocks': 'foreign_top_stocks.json',
+    'institutional_money': 'institutional_money.json',
+    'limit_updown': 'limit_updown.json',
+    'vix': 'vix.json',
+    'top_volume_stocks': 'top_volume_stocks.json',
+    'insider_trading': 'insider_trading.json',
+}
+
+
+def source_signature(data_dir=DATA_DIR):
+    """各來源檔的 (mtime_ns, size)，用來判斷資料包是否過期"""
+    signature = {}
+    for key, name in BUNDLE_SOURCES.items():
+        try:
+            st = (Path(data_dir) / name).stat()
+        except OSError:
+            continue
+        signature[key] = (st.st_mtime_ns, st.st_size)
+    return signature
+
+
+def build_bundle(data_dir=DATA_DIR):
+    """
+    讀所有來源檔合併寫出 dashboard_bundle.json
+
+    缺檔或壞檔的區塊直接略過（前端會退回逐檔抓）。
+    Returns: True 表示資料包內容有變
+    """
+    data_dir = Path(data_dir)
+    bundle = {'built_at': datetime.now().isoformat(timespec='seconds'), 'sources': {}}
+    for key, name in BUNDLE_SOURCES.items():
+        path = data_dir / name
+        try:
+            mtime = path.stat().st_mtime
+            with open(path, encoding='utf-8') as f:
+                bundle[key] = json.load(f)
+        except (OSError, ValueError):
+            continue
+        bundle['sources'][key] = {
+            'file': name,
+            'mtime': datetime.fromtimestamp(mtime).isoformat(timespec='seconds'),
+        }
+    return write_json(data_dir / BUNDLE_NAME, bundle, volatile=META_KEYS)
+
+
+def select_fields(bundle, fields):
+    """
+    只取需要的區塊；支援一層以上的點路徑，例如 market_data.sentiment
+
+    不存在的欄位略過。built_at 一律保留，sources 只留選到的區塊。
+    """
+    selected = {'built_at': bundle.get('built_at')}
+    sources = {}
+    for field in fields:
+        key, *rest = field.split('.')
+        if key in META_KEYS or key not in bundle:
+            continue
+        value, target = bundle[key], selected
+        path = [key] + rest
+        try:
+            for part in rest:
+                value = value[part]
+        except (KeyError, TypeError):
+            continue
+        for part in path[:-1]:
+            target = target.setdefault(part, {})
+        target[path[-1]] = value
+        if key in bundle.get('sources', {}):
+            sources[key] = bundle['sources'][key]
+    selected['sources'] = sources
+    return selected
+
+
+class BundleCache:
+    """
+    /api/dashboard 的記憶體快取
+
+    完整資料包直接用磁碟上已序列化（與壓縮）好的 bytes；有指定欄位的結果依
+    欄位組合快取。資料包比來源檔舊（例如單獨重跑某個收集器）時就地重建。
+    """
+
+    MAX_SELECTIONS = 32
+
+    def __init__(self, data_dir=DATA_DIR):
+        self.data_dir = Path(data_dir)
+        self.path = self.data_dir / BUNDLE_NAME
+        self._lock = threading.Lock()
+        self._key = None
+        self._signature = None
+        self._bundle = None
+        self._full = None
+        self._selections = OrderedDict()
+
+    def _stale(self, signature):
+        try:
+            built = self.path.stat().st_mtime_ns
+        except OSError:
+            return True
+        return any(mtime > built for mtime, _ in signature.values())
+
+    def _load(self):
+        # 來源檔有動過（含新增/刪除）才重建；內容沒變時 build_bundle 不會改寫檔案，
+        # 所以記住這次的來源狀態，避免每個請求都重建。剛啟動時以 mtime 判斷，
+        # 沿用 run_daily 建好的資料包
+        signature = source_signature(self.data_dir)
+        if signature != self._signature:
+            if self._signature is not None or self._stale(signature):
+                build_bundle(self.data_dir)
+            self._signature = signature
+        st = self.path.stat()
+        key = (st.st_mtime_ns, st.st_size)
+        if key == self._key:
+            return
+        raw = self.path.read_bytes()
+        gz_path = self.path.with_name(self.path.name + '.gz')
+        gz = gz_path.read_bytes() if gz_path.exists() else gzip.compress(raw, 6)
+        entry = load_manifest(self.data_dir)['files'].get(BUNDLE_NAME, {})
+        self._bundle = json.loads(raw)
+        self._full = (raw, gz, entry.get('hash') or f'{key[0]:x}')
+        self._selections.clear()
+        self._key = key
+
+    def get(self, fields=None):
+        """
+        Returns: (body, gzip_body, etag)
+        """
+        with self._lock:
+            self._load()
+            if not fields:
+                return self._full
+            fields = tuple(sorted(set(fields)))
+            cached = self._selections.get(fields)
+            if cached is None:
+                body = dumps(select_fields(self._bundle, fields))
+                digest = hashlib.sha1(','.join(fields).encode()).hexdigest()[:8]
+                etag = f'{self._full[2]}-{digest}'
+                cached = (body, gzip.compress(body, 6), etag)
+                self._selections[fields] = cached
+                if len(self._selections) > self.MAX_SELECTIONS:
+                    self._selections.popitem(last=False)
+            else:
+                self._selections.move_to_end(fields)
+            return cached
+
+
+if __name__ == '__main__':
+    changed = build_bundle()
+    print(f"  {'已更新' if changed else '內容未變'} {DATA_DIR / BUNDLE_NAME}")
@@ -2,13 +2,14 @@
 主數據收集器 v2.0 - 整合所有數據源並存儲
 新增: 同時收集 TX (大台) 和 MXF (微台) 期貨數據
 """
-import json
 import sqlite3
 from datetime import datetime, timedelta
 import schedule
 import time
 from pathlib import Path
 
+import trading_day
+from json_export import write_json
 from scraper_twse import TWSEScraper
 from scraper_taifex import TAIFEXScraper  # 使用新版
 from scraper_options import OptionsScraper
@@ -24,6 +25,25 @@ from foreign_top_stocks_collector import collect_foreign_top_stocks
 from industry_foreign_flow_collector import collect_industry_foreign_flow
 from industry_heatmap_collector import collect_industry_heatmap
 
+TX_INSERT_SQL = """
+    INSERT OR REPLACE INTO futures_data 
+    (date, retail_long, retail_short, retail_ratio, retail_net,
+     open_interest, long_short_ratio, foreign_net, trust_net, dealer_net)
+    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+"""
+
+MXF_INSERT_SQL = '''
+    INSERT OR REPLACE INTO mxf_futures_data (
+        date, commodity_id, close_price, total_oi,
+        dealers_long, dealers_short, dealers_net,
+        trusts_long, trusts_short, trusts_net,
+        foreign_long, foreign_short, foreign_net,
+        institutional_net,
+        retail_long, retail_short, retail_net, retail_ratio,
+        timestamp
+    ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+'''
+
 class DataCollector:
     def __init__(self, db_path='data/market_data.db'):
         self.db_path = db_path
@@ -187,26 +207,7 @@ class DataCollector:
                 # 存入 futures_data 表
                 conn = sqlite3.connect(self.db_path)
                 cursor = conn.cursor()
-                date_str = result['date'].replace('/', '')
-                # 計算多空比
-                ratio = round(result['retail_long'] / result['retail_short'], 2) if result['retail_short'] > 0 else 0
-                cursor.execute("""
-                    INSERT OR REPLACE INTO futures_data 
-                    (date, retail_long, retail_short, retail_ratio, retail_net,
-                     open_interest, long_short_ratio, foreign_net, trust_net, dealer_net)
-                    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-                """, (
-                    date_str,
-                    result['retail_long'],
-                    result['retail_short'],
-                    result['retail_ratio'],
-                    result.get('retail_net', result['retail_long'] - result['retail_short']),
-                    result.get('total_oi', 0),
-                    ratio,
-                    result.get('foreign', {}).get('net', 0),
-                    result.get('trusts', {}).get('net', 0),
-                    result.get('dealers', {}).get('net', 0)
-                ))
+                cursor.execute(TX_INSERT_SQL, self._tx_row(result))
                 conn.commit()
                 conn.close()
                 print(f"  ✓ TX 散戶多空比: {result['retail_ratio']:.2f}")
@@ -240,43 +241,79 @@ class DataCollector:
             traceback.print_exc()
             return None
     
+    def _tx_row(self, result):
+        """get_retail_ratio(TX) 結果 → futures_data 一列"""
+        # 計算多空比
+        ratio = round(result['retail_long'] / result['retail_short'], 2) if result['retail_short'] > 0 else 0
+        return (
+            result['date'].replace('/', ''),
+            result['retail_long'],
+            result['retail_short'],
+            result['retail_ratio'],
+            result.get('retail_net', result['retail_long'] - result['retail_short']),
+            result.get('total_oi', 0),
+            ratio,
+            result.get('foreign', {}).get('net', 0),
+            result.get('trusts', {}).get('net', 0),
+            result.get('dealers', {}).get('net', 0)
+        )
+    
+    def _mxf_row(self, data):
+        """get_retail_ratio(MXF) 結果 → mxf_futures_data 一列"""
+        return (
+            data['date'].replace('/', ''),
+            data.get('commodity_id', 'MXF'),
+            data.get('close_price', 0),
+            data['total_oi'],
+            data['dealers']['long'],
+            data['dealers']['short'],
+            data['dealers']['net'],
+            data['trusts']['long'],
+            data['trusts']['short'],
+            data['trusts']['net'],
+            data['foreign']['long'],
+            data['foreign']['short'],
+            data['foreign']['net'],
+            data['institutional_net'],
+            data['retail_long'],
+            data['retail_short'],
+            data['retail_net'],
+            data['retail_ratio'],
+            data['timestamp']
+        )
+    
+    def backfill_futures(self, start_date, end_date):
+        """
+        回補 TX + MXF 期貨歷史: 一次下載整段 CSV, 兩張表在同一個交易內寫入
+        
+        start_date / end_date: datetime
+        Returns: 寫入的交易日數
+        """
+        print(f"\n回補期貨法人部位: {start_date:%Y-%m-%d} ~ {end_date:%Y-%m-%d}")
+        results = self.taifex_scraper.get_retail_ratio_range(
+            start_date, end_date, commodity_ids=('MXF', 'TX'), debug=True)
+        
+        tx_rows = [self._tx_row(r['TX']) for r in results.values() if 'TX' in r]
+        mxf_rows = [self._mxf_row(r['MXF']) for r in results.values() if 'MXF' in r]
+        
+        conn = sqlite3.connect(self.db_path)
+        try:
+            with conn:
+                conn.executemany(TX_INSERT_SQL, tx_rows)
+                conn.executemany(MXF_INSERT_SQL, mxf_rows)
+        finally:
+            conn.close()
+        
+        print(f"  ✓ TX {len(tx_rows)} 天, MXF {len(mxf_rows)} 天已存入資料庫")
+        return len(results)
+    
     def save_mxf_data(self, data):
         """儲存微台指數據到資料庫"""
         conn = sqlite3.connect(self.db_path)
         cursor = conn.cursor()
         
         try:
-            cursor.execute('''
-                INSERT OR REPLACE INTO mxf_futures_data (
-                    date, commodity_id, close_price, total_oi,
-                    dealers_long, dealers_short, dealers_net,
-                    trusts_long, trusts_short, trusts_net,
-                    foreign_long, foreign_short, foreign_net,
-                    institutional_net,
-                    retail_long, retail_short, retail_net, retail_ratio,
-                    timestamp
-                ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-            ''', (
-                data['date'].replace('/', ''),
-                data.get('commodity_id', 'MXF'),
-                data.get('close_price', 0),
-                data['total_oi'],
-                data['dealers']['long'],
-                data['dealers']['short'],
-                data['dealers']['net'],
-                data['trusts']['long'],
-                data['trusts']['short'],
-                data['trusts']['net'],
-                data['foreign']['long'],
-                data['foreign']['short'],
-                data['foreign']['net'],
-                data['institutional_net'],
-                data['retail_long'],
-                data['retail_short'],
-                data['retail_net'],
-                data['retail_ratio'],
-                data['timestamp']
-            ))
+            cursor.execute(MXF_INSERT_SQL, self._mxf_row(data))
             
             conn.commit()
             print(f"  ✓ 微台指數據已存入資料庫")
@@ -330,7 +367,12 @@ class DataCollector:
         conn.close()
     
     def get_last_trading_day(self):
-        """取得最近的交易日"""
+        """取得最近的交易日（交易日曆: TWSE 已有當日成交資訊的最近一天）"""
+        latest = trading_day.latest_trading_day()
+        if latest is not None:
+            return datetime.combine(latest, datetime.min.time())
+        
+        # 交易日曆無法取得時的備援: 依星期與收盤時間推算
         today = datetime.now()
         
         # 如果是週末，回推到週五
@@ -350,8 +392,7 @@ class DataCollector:
     
     def is_trading_day(self, date):
         """檢查是否為交易日"""
-        # 簡單版本: 排除週末
-        return date.weekday() < 5
+        return trading_day.is_trading_day(date)
     
     def has_data(self, date_str):
         """檢查資料庫中是否已有該日期的數據"""
@@ -447,8 +488,7 @@ class DataCollector:
         }
         
         # 輸出 JSON
-        with open(f'{output_dir}/futures_data.json', 'w', encoding='utf-8') as f:
-            json.dump(export_data, f, ensure_ascii=False, indent=2)
+        write_json(f'{output_dir}/futures_data.json', export_data)
         
         print(f"✓ 期貨數據已導出至 {output_dir}/futures_data.json")
         
@@ -494,13 +534,24 @@ class DataCollector:
         }
 
 if __name__ == "__main__":
+    import argparse
+    
+    parser = argparse.ArgumentParser(description='台股監控系統 v2.0 - 數據收集工具')
+    parser.add_argument('--backfill', nargs=2, metavar=('START', 'END'),
+                        help='回補 TX/MXF 期貨歷史 (YYYY-MM-DD YYYY-MM-DD)，不跑每日收集')
+    args = parser.parse_args()
+    
     collector = DataCollector()
     
     print("\n台股監控系統 v2.0 - 數據收集工具 (支援 TX + MXF)")
     print("="*60)
     
-    # 測試收集
-    result = collector.collect_daily_data()
+    if args.backfill:
+        start, end = (datetime.strptime(d, '%Y-%m-%d') for d in args.backfill)
+        collector.backfill_futures(start, end)
+    else:
+        # 測試收集
+        result = collector.collect_daily_data()
     
     # 導出 JSON
     print("\n正在導出數據...")
@@ -19,7 +19,6 @@ ETF 池長期高點 Enrich v1.0
 - 首次跑（145 檔，多數要抓 10 年）: 約 5-7 分鐘
 - 之後增量更新: 約 1-2 分鐘
 """
-import json
 import time
 from datetime import datetime
 from pathlib import Path
@@ -32,6 +31,7 @@ from kline_history_manager import (
 )
 from long_term_high_calc import calc_metrics
 from etf_pool_helper import get_combined_pool_codes, get_consensus_dict
+from json_export import write_json
 
 SCRIPT_DIR = Path(__file__).parent
 DATA_DIR = SCRIPT_DIR / 'data'
@@ -225,10 +225,10 @@ def main():
         'stocks': records,
     }
 
-    DATA_DIR.mkdir(parents=True, exist_ok=True)
-    with open(OUT_FILE, 'w', encoding='utf-8') as f:
-        json.dump(output, f, ensure_ascii=False, indent=2)
-    print(f"  ✓ 已寫入")
+    if write_json(OUT_FILE, output):
+        print(f"  ✓ 已寫入")
+    else:
+        print(f"  ✓ 內容未變，沿用既有檔案")
 
     # 摘要
     print(f"\n{'=' * 60}")
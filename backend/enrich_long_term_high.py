@@ -27,6 +27,7 @@ from kline_history_manager import (
     get_stats,
 )
 from long_term_high_calc import calc_metrics
+from json_export import write_json
 
 SCRIPT_DIR = Path(__file__).parent
 DATA_DIR = SCRIPT_DIR / 'data'
@@ -180,9 +181,10 @@ def main():
     print(f"\n[3/3] 寫回 {NH_FILE.name}...")
     nh_data['stocks'] = stocks
     nh_data['lt_enriched_at'] = datetime.now().isoformat()
-    with open(NH_FILE, 'w', encoding='utf-8') as f:
-        json.dump(nh_data, f, ensure_ascii=False, indent=2)
-    print(f"  ✓ 已寫入")
+    if write_json(NH_FILE, nh_data, volatile=('updated_at', 'lt_enriched_at')):
+        print(f"  ✓ 已寫入")
+    else:
+        print(f"  ✓ 內容未變動，沿用原檔")
 
     # 摘要
     print(f"\n{'=' * 60}")
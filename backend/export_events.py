@@ -0,0 +1,122 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+匯出檔更新推播
+=================================
+run_daily 的每個步驟都經 json_export.write_json 寫檔，內容有變時 export_manifest.json
+裡該檔的 version 會 +1。這裡在 watchlist_server 內起一條執行緒盯 manifest
+（每秒一次 stat，不管有幾個前端連線），版本有變就發事件給所有
+/api/events（Server-Sent Events）連線，前端只重載受影響的面板。
+
+事件格式（SSE data 欄位）:
+    {"id": 12, "file": "macd_signal_stocks.json", "panel": "macd_signal_stocks",
+     "version": 5, "hash": "...", "path": "hashed/...", "updated_at": "..."}
+
+使用方式:
+    events = ExportEvents()
+    events.start()
+    last_id = events.last_id
+    for event in events.wait(last_id, timeout=15): ...
+"""
+import json
+import threading
+import time
+from collections import deque
+from pathlib import Path
+
+from json_export import MANIFEST_NAME, load_manifest
+
+DATA_DIR = Path(__file__).parent / 'data'
+POLL_INTERVAL = 1.0
+HISTORY_SIZE = 100     # 斷線重連（Last-Event-ID）時可補發的事件數
+
+
+def format_sse(event):
+    """事件轉成 SSE 文字格式"""
+    data = json.dumps(event, ensure_ascii=False)
+    return f"id: {event['id']}\nevent: export\ndata: {data}\n\n".encode('utf-8')
+
+
+class ExportEvents:
+    """盯 export_manifest.json，版本有變就發事件"""
+
+    def __init__(self, data_dir=DATA_DIR, interval=POLL_INTERVAL):
+        self.data_dir = Path(data_dir)
+        self.manifest_path = self.data_dir / MANIFEST_NAME
+        self.interval = interval
+        self._cond = threading.Condition()
+        self._events = deque(maxlen=HISTORY_SIZE)
+        self._last_id = 0
+        self._versions = None
+        self._stat = None
+        self._thread = None
+
+    @property
+    def last_id(self):
+        with self._cond:
+            return self._last_id
+
+    def start(self):
+        """背景執行緒開始盯 manifest（重複呼叫無作用）"""
+        if self._thread is None:
+            self.poll()   # 先記下目前版本當基準，啟動時不發事件
+            self._thread = threading.Thread(target=self._run, name='export-events', daemon=True)
+            self._thread.start()
+
+    def _run(self):
+        while True:
+            time.sleep(self.interval)
+            try:
+                self.poll()
+            except Exception as e:
+                print(f'[export_events] 讀取 manifest 失敗: {e}')
+
+    def poll(self):
+        """
+        檢查 manifest 一次；有檔案版本變動就發事件
+
+        Returns: 這次發出的事件數
+        """
+        try:
+            st = self.manifest_path.stat()
+            stat = (st.st_mtime_ns, st.st_size)
+        except OSError:
+            stat = None
+        if stat == self._stat and self._versions is not None:
+            return 0
+        self._stat = stat
+
+        files = load_manifest(self.data_dir)['files']
+        versions = {name: entry.get('version') for name, entry in files.items()}
+        previous, self._versions = self._versions, versions
+        if previous is None:
+            return 0
+        changed = [name for name, version in versions.items() if previous.get(name) != version]
+        for name in sorted(changed):
+            self.publish(name, files[name])
+        return len(changed)
+
+    def publish(self, name, entry):
+        """發一個檔案更新事件給所有等待中的連線"""
+        with self._cond:
+            self._last_id += 1
+            self._events.append({
+                'id': self._last_id,
+                'file': name,
+                'panel': Path(name).stem,
+                'version': entry.get('version'),
+                'hash': entry.get('hash'),
+                'path': entry.get('path'),
+                'updated_at': entry.get('updated_at'),
+            })
+            self._cond.notify_all()
+
+    def wait(self, last_id, timeout):
+        """
+        等 last_id 之後的事件，最多 timeout 秒
+
+        Returns: 事件 list（逾時回傳空 list；太舊的已從緩衝區掉出，只補得到還在的）
+        """
+        with self._cond:
+            self._cond.wait_for(lambda: self._last_id > last_id, timeout)
+            return [e for e in self._events if e['id'] > last_id]
@@ -6,6 +6,8 @@ import json
 import requests
 from datetime import datetime
 
+from json_export import write_json
+
 NAME_MAP = {
     '水泥': '水泥工業',
     '塑膠': '塑膠工業',
@@ -98,8 +100,7 @@ def main():
         'industries': industries_dict
     }
     
-    with open('data/industry_heatmap.json', 'w', encoding='utf-8') as f:
-        json.dump(output, f, ensure_ascii=False, indent=2)
+    write_json('data/industry_heatmap.json', output)
     
     print(f"✓ 已轉換產業熱力圖為前端格式")
     print(f"  產業數: {len(industries_dict)}")
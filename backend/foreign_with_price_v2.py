@@ -3,10 +3,15 @@
 使用 Table 8 的個股資料
 """
 import requests
-from datetime import datetime, timedelta
+from datetime import datetime
 import json
 import sqlite3
 
+import numpy as np
+
+from trading_day import recent_trading_days
+from twse_json import fetch, parse_mi_index_quotes
+
 print("=== 收集外資買賣超 + 漲跌幅 ===\n")
 
 conn = sqlite3.connect('data/market_data.db')
@@ -17,12 +22,13 @@ conn.close()
 
 headers = {'User-Agent': 'Mozilla/5.0'}
 
-# 找到有資料的日期
+# 找到有資料的日期: 由交易日曆決定,不逐日往回試
+# 最新交易日的 T86 尚未公布時 (FMTQIK 收盤後就有),才退到前一交易日
 target_date = None
 foreign_data = None
 
-for days_ago in range(10):
-    date = (datetime.now() - timedelta(days=days_ago)).strftime('%Y%m%d')
+for day in recent_trading_days(2):
+    date = day.strftime('%Y%m%d')
     
     url = f"https://www.twse.com.tw/rwd/zh/fund/T86?date={date}&selectType=ALL&response=json"
     
@@ -49,40 +55,25 @@ price_url = f"https://www.twse.com.tw/rwd/zh/afterTrading/MI_INDEX?date={target_
 stock_prices = {}
 
 try:
-    resp = requests.get(price_url, headers=headers, timeout=30)
-    data = resp.json()
+    # 串流解析 Table 8，只取需要的欄位（漲跌價差已依漲跌欄帶正負號）
+    meta, quotes = fetch(price_url, parse_mi_index_quotes,
+                         fields=['code', 'close', 'change', 'prev_close'],
+                         headers=headers, timeout=30)
     
-    if data.get('stat') == 'OK' and 'tables' in data:
-        # 找到 Table 8（每日收盤行情）
-        for table in data['tables']:
-            if '每日收盤行情' in table.get('title', ''):
-                print(f"✓ 找到收盤行情表格")
-                
-                for row in table.get('data', []):
-                    if len(row) >= 11:
-                        code = row[0].strip()
-                        
-                        # 只要 4 位數字的股票代碼
-                        if len(code) == 4 and code.isdigit():
-                            try:
-                                # 收盤價在第 8 欄（索引 8）
-                                close_price = row[8].replace(',', '').strip()
-                                # 漲跌價差在第 10 欄（索引 10）
-                                price_diff = row[10].replace(',', '').strip()
-                                
-                                if close_price and price_diff and close_price != '--' and price_diff != '--':
-                                    close = float(close_price)
-                                    diff = float(price_diff)
-                                    
-                                    # 計算漲跌幅
-                                    if close > 0:
-                                        change_pct = (diff / (close - diff)) * 100
-                                        stock_prices[code] = round(change_pct, 2)
-                            except:
-                                pass
-                
-                print(f"✓ 已取得 {len(stock_prices)} 檔股票漲跌幅")
-                break
+    if meta.get('stat') == 'OK' and len(quotes['code']):
+        print(f"✓ 找到收盤行情表格")
+        
+        codes = quotes['code']
+        prev_close = quotes['prev_close']
+        # 只要 4 位數字的股票代碼，且收盤價/漲跌都有值
+        mask = ((np.char.str_len(codes) == 4) & np.char.isdigit(codes)
+                & (quotes['close'] > 0) & (prev_close > 0))
+        
+        # 計算漲跌幅
+        change_pct = np.round(quotes['change'][mask] / prev_close[mask] * 100, 2)
+        stock_prices = dict(zip(codes[mask].tolist(), change_pct.tolist()))
+        
+        print(f"✓ 已取得 {len(stock_prices)} 檔股票漲跌幅")
 except Exception as e:
     print(f"✗ 無法取得股價資料: {e}")
 
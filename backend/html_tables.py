@@ -0,0 +1,91 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+HTML 表格/標題/連結快速擷取 (lxml)
+=================================
+各爬蟲原本為了讀一個表格或一個 <title> 就建整棵 BeautifulSoup 樹（有些還用純 Python
+的 html.parser），大頁面（MOPS、期交所）解析時間遠大於網路時間。這裡改用 lxml 的 C
+解析器 + XPath 直接取需要的節點；只要 <title> 時用正則，完全不建樹。
+
+- 儲存格文字與 BeautifulSoup 的 get_text(strip=True) 一致（每段文字各自 strip 後相接）
+- 輸入一律是 HTML 字串（resp.text）
+
+使用方式:
+    from html_tables import extract_tables, extract_title, extract_links, class_xpath
+
+    tables = extract_tables(resp.text)                                  # 每個 <table> 的儲存格文字
+    rows = extract_tables(resp.text, class_xpath('table', 'hasBorder'), cells=('td',))[0]
+    title = extract_title(resp.text)
+    links = extract_links(resp.text, r'/stock/\\d+$')                    # [(href, text), ...]
+"""
+import html
+import re
+
+import lxml.html
+
+TITLE_RE = re.compile(r'<title[^>]*>(.*?)</title>', re.S | re.I)
+XML_DECL_RE = re.compile(r'^\s*<\?xml[^>]*\?>')
+
+
+def parse(text):
+    """HTML 字串 → lxml 根節點（空字串回傳 None）"""
+    if not text or not text.strip():
+        return None
+    # lxml 不接受帶 encoding 宣告的 str
+    return lxml.html.fromstring(XML_DECL_RE.sub('', text, count=1))
+
+
+def class_xpath(tag, cls):
+    """含某個 class 的節點 XPath（同 BeautifulSoup 的 find(tag, {'class': cls})）"""
+    return f'//{tag}[contains(concat(" ", normalize-space(@class), " "), " {cls} ")]'
+
+
+def node_text(node):
+    """節點文字，同 BeautifulSoup get_text(strip=True)"""
+    return ''.join(s.strip() for s in node.itertext())
+
+
+def table_rows(table, cells=('td', 'th')):
+    """表格節點 → 每列儲存格文字的 list（含巢狀表格的列，同 find_all('tr')）"""
+    cell_xpath = '|'.join(f'./{c}' for c in cells)
+    return [[node_text(c) for c in tr.xpath(cell_xpath)] for tr in table.iter('tr')]
+
+
+def extract_tables(text, xpath='//table', cells=('td', 'th')):
+    """
+    擷取符合 xpath 的所有表格
+
+    Returns: [table, ...]，table = [[cell, ...], ...]；解析失敗回傳 []
+    """
+    root = parse(text)
+    if root is None:
+        return []
+    return [table_rows(t, cells) for t in root.xpath(xpath)]
+
+
+def extract_title(text):
+    """只取 <title> 文字（正則，不解析整頁），沒有則回傳 None"""
+    m = TITLE_RE.search(text or '')
+    if not m:
+        return None
+    return html.unescape(m.group(1)).strip()
+
+
+def extract_links(text, href_pattern=None):
+    """
+    擷取 <a href> 連結
+
+    href_pattern: 選用的正則（re.search），只回傳 href 符合的連結
+    Returns: [(href, text), ...]，依出現順序
+    """
+    root = parse(text)
+    if root is None:
+        return []
+    pattern = re.compile(href_pattern) if isinstance(href_pattern, str) else href_pattern
+    links = []
+    for a in root.iter('a'):
+        href = a.get('href')
+        if href is None or (pattern is not None and not pattern.search(href)):
+            continue
+        links.append((href, node_text(a)))
+    return links
@@ -0,0 +1,259 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+增量指標狀態 v1.0
+=================================
+每檔股票在 K 線庫旁存一份指標狀態，每天只要把新的一根 K 棒推進去，
+不必用 80~720 天的資料從頭重算 EMA12/EMA26/訊號線/KD。
+
+設計原則:
+- 狀態檔: data/kline_history/{code}.state.json（跟 {code}.csv 放一起）
+- 內容:
+    ema_fast / ema_slow   EMA12 / EMA26 的最後值（DIF 無法反推，要分開存）
+    tail                  最近 TAIL_BARS 根的 OHLCV + ma20/ma60/dif/macd/osc/k/d
+                          同時當作 MA20/MA60、60 日 OSC 分位數、240 日新高等
+                          滾動視窗的緩衝區
+- 推進一根: EMA/KD 遞迴 O(1)，均線只看緩衝區最後 60 根，與歷史長度無關
+- EMA 起始值用 seed='first'（同 pandas ewm(adjust=False)），從 K 線庫第一筆開始算
+- 歷史被修正（Yahoo 回補/調整、盤中資料被收盤價覆蓋）或日期對不上時，
+  自動從完整 K 線重算
+
+使用方式:
+    from indicator_state import update_state, state_arrays
+
+    state = update_state('2330')        # 讀 K 線庫、推進到最新並存檔
+    arrays = state_arrays(state)         # {'close': ndarray, 'osc': ndarray, ...}
+"""
+import json
+import math
+
+import numpy as np
+
+from indicators import as_array, sma, ema, macd, kd
+from kline_history_manager import KLINE_DIR, load_kline_csv
+
+# ============================================================
+# 設定
+# ============================================================
+STATE_VERSION = 1
+
+# 緩衝區長度：回檔掃描器要「最近 30 天內創 240 日新高」→ 240 + 30
+TAIL_BARS = 270
+
+# 推進前要比對的重疊 K 棒數（偵測歷史被修正）
+REVISION_CHECK_BARS = 5
+
+FAST_PERIOD = 12
+SLOW_PERIOD = 26
+SIGNAL_PERIOD = 9
+KD_PERIOD = 9
+
+OHLCV_FIELDS = ['open', 'high', 'low', 'close', 'volume']
+INDICATOR_FIELDS = ['ma20', 'ma60', 'dif', 'macd', 'osc', 'k', 'd']
+TAIL_FIELDS = ['date'] + OHLCV_FIELDS + INDICATOR_FIELDS
+
+
+# ============================================================
+# 讀寫
+# ============================================================
+def get_state_path(stock_code):
+    """取得某檔股票的狀態檔路徑"""
+    return KLINE_DIR / f"{stock_code}.state.json"
+
+
+def load_state(stock_code):
+    """讀狀態檔，不存在、損毀或版本不符則回傳 None"""
+    path = get_state_path(stock_code)
+    if not path.exists():
+        return None
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            state = json.load(f)
+    except Exception:
+        return None
+    if state.get('version') != STATE_VERSION:
+        return None
+    return state
+
+
+def save_state(stock_code, state):
+    """寫狀態檔（先寫暫存檔再改名，中斷不會留下半個檔案）"""
+    path = get_state_path(stock_code)
+    tmp = path.with_suffix('.tmp')
+    try:
+        with open(tmp, 'w', encoding='utf-8') as f:
+            json.dump(state, f, separators=(',', ':'))
+        tmp.replace(path)
+        return True
+    except Exception as e:
+        print(f"    ⚠ 寫入 {path.name} 失敗: {e}")
+        return False
+
+
+# ============================================================
+# 完整重算 / 單根推進
+# ============================================================
+def build_state(klines):
+    """從完整 K 線（由舊到新）重算指標狀態"""
+    if not klines:
+        return None
+
+    closes = as_array(klines, 'close')
+    series = {
+        'ma20': sma(closes, 20),
+        'ma60': sma(closes, 60),
+    }
+    series['dif'], series['macd'], series['osc'] = macd(
+        closes, FAST_PERIOD, SLOW_PERIOD, SIGNAL_PERIOD, seed='first')
+    series['k'], series['d'] = kd(as_array(klines, 'high'), as_array(klines, 'low'),
+                                  closes, period=KD_PERIOD)
+
+    tail_klines = klines[-TAIL_BARS:]
+    tail = {'date': [k['date'] for k in tail_klines]}
+    for field in OHLCV_FIELDS:
+        tail[field] = [float(k[field]) for k in tail_klines]
+    for field in INDICATOR_FIELDS:
+        tail[field] = [float(v) for v in series[field][-TAIL_BARS:]]
+
+    return {
+        'version': STATE_VERSION,
+        'date': klines[-1]['date'],
+        'count': len(klines),
+        'ema_fast': float(ema(closes, FAST_PERIOD)[-1]),
+        'ema_slow': float(ema(closes, SLOW_PERIOD)[-1]),
+        'tail': tail,
+    }
+
+
+def _mean_last(values, n):
+    """最後 n 筆平均，不足 n 筆為 NaN"""
+    if len(values) < n:
+        return math.nan
+    return sum(values[-n:]) / n
+
+
+def advance_state(state, bar):
+    """把一根新 K 棒推進狀態（原地修改），工作量與歷史長度無關"""
+    tail = state['tail']
+    tail['date'].append(bar['date'])
+    for field in OHLCV_FIELDS:
+        tail[field].append(float(bar[field]))
+    close = tail['close'][-1]
+
+    # 均線：只看緩衝區最後 20 / 60 根
+    tail['ma20'].append(_mean_last(tail['close'], 20))
+    tail['ma60'].append(_mean_last(tail['close'], 60))
+
+    # MACD：EMA 遞迴
+    a_fast = 2.0 / (FAST_PERIOD + 1)
+    a_slow = 2.0 / (SLOW_PERIOD + 1)
+    a_signal = 2.0 / (SIGNAL_PERIOD + 1)
+    state['ema_fast'] = a_fast * close + (1 - a_fast) * state['ema_fast']
+    state['ema_slow'] = a_slow * close + (1 - a_slow) * state['ema_slow']
+    dif = state['ema_fast'] - state['ema_slow']
+    signal_line = a_signal * dif + (1 - a_signal) * tail['macd'][-1]
+    tail['dif'].append(dif)
+    tail['macd'].append(signal_line)
+    tail['osc'].append(dif - signal_line)
+
+    # KD：RSV 無法計算時沿用前值
+    k, d = tail['k'][-1], tail['d'][-1]
+    if len(tail['close']) >= KD_PERIOD:
+        low_n = min(tail['low'][-KD_PERIOD:])
+        high_n = max(tail['high'][-KD_PERIOD:])
+        if high_n != low_n:
+            rsv = (close - low_n) / (high_n - low_n) * 100
+            k = (2 / 3) * k + (1 / 3) * rsv
+            d = (2 / 3) * d + (1 / 3) * k
+    tail['k'].append(k)
+    tail['d'].append(d)
+
+    # 緩衝區只留最近 TAIL_BARS 根
+    if len(tail['date']) > TAIL_BARS:
+        for field in TAIL_FIELDS:
+            del tail[field][:-TAIL_BARS]
+
+    state['date'] = bar['date']
+    state['count'] += 1
+    return state
+
+
+def _find_date(klines, date_str):
+    """從尾端往前找 date_str 的位置（新 K 棒只有幾根，通常一兩步就找到）"""
+    for i in range(len(klines) - 1, -1, -1):
+        d = klines[i]['date']
+        if d == date_str:
+            return i
+        if d < date_str:
+            return None
+    return None
+
+
+def _is_revised(state, klines, pos):
+    """比對狀態緩衝區最後幾根與 K 線是否一致"""
+    tail = state['tail']
+    n = min(REVISION_CHECK_BARS, len(tail['date']), pos + 1)
+    for j in range(1, n + 1):
+        bar = klines[pos - n + j]
+        idx = len(tail['date']) - n + j - 1
+        if bar['date'] != tail['date'][idx]:
+            return True
+        for field in OHLCV_FIELDS:
+            if abs(float(bar[field]) - tail[field][idx]) > 1e-6:
+                return True
+    return False
+
+
+def update_state(stock_code, klines=None, save=True):
+    """
+    把某檔股票的指標狀態更新到 K 線最後一根
+
+    klines: K 線庫的完整歷史（預設讀 load_kline_csv）
+    - 沒有狀態 / 歷史被修正或補齊 / 日期對不上 → 完整重算
+    - 否則只推進新增的 K 棒
+
+    Returns: state dict，沒有 K 線則回傳 None
+    """
+    if klines is None:
+        klines = load_kline_csv(stock_code)
+    if not klines:
+        return None
+
+    state = load_state(stock_code)
+    pos = _find_date(klines, state['date']) if state else None
+
+    # 前面的歷史被補齊（筆數對不上）也要重算
+    if (state is None or pos is None or state['count'] != pos + 1
+            or _is_revised(state, klines, pos)):
+        state = build_state(klines)
+        changed = True
+    else:
+        new_bars = klines[pos + 1:]
+        for bar in new_bars:
+            advance_state(state, bar)
+        changed = bool(new_bars)
+
+    if save and changed:
+        save_state(stock_code, state)
+    return state
+
+
+# ============================================================
+# 給掃描器用的檢視
+# ============================================================
+def state_arrays(state):
+    """緩衝區 → {欄位: ndarray}（date 保持 list of str）"""
+    tail = state['tail']
+    arrays = {field: np.array(tail[field], dtype=np.float64)
+              for field in OHLCV_FIELDS + INDICATOR_FIELDS}
+    arrays['date'] = list(tail['date'])
+    return arrays
+
+
+def state_frame(state):
+    """緩衝區 → pandas DataFrame（索引為日期），欄位同 add_indicators 的輸出"""
+    import pandas as pd
+
+    arrays = state_arrays(state)
+    dates = pd.to_datetime(arrays.pop('date'))
+    return pd.DataFrame(arrays, index=dates)
@@ -0,0 +1,229 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+技術指標共用函式庫 v1.0
+=================================
+所有掃描器共用的 NumPy 向量化指標：EMA / SMA / MACD / KD / 滾動分位數 /
+滾動最大最小值 / 量比。
+
+設計原則:
+- 輸入可以是 ndarray、pandas Series、數字 list，或既有的 K 線 list of dict
+  （kline_history_manager / fetch_kline 回傳的格式），用 field 指定欄位
+- 輸出一律是 float64 ndarray，長度與輸入相同；暖機期（資料不足）填 NaN
+- EMA 有兩種起始值慣例，用 seed 參數切換:
+    'first' → 第一筆當起始值（同 pandas ewm(adjust=False)，回測/回檔掃描器用）
+    'sma'   → 前 period 筆的 SMA 當起始值（macd_signal_scanner 原本的算法）
+
+使用方式:
+    from indicators import as_array, sma, macd, kd
+
+    closes = as_array(klines, 'close')
+    ma20 = sma(closes, 20)
+    dif, signal, hist = macd(closes, seed='sma')
+    k, d = kd(as_array(klines, 'high'), as_array(klines, 'low'), closes)
+"""
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+
+
+# ============================================================
+# 輸入轉換
+# ============================================================
+def as_array(data, field='close'):
+    """
+    把各種輸入轉成 float64 ndarray
+
+    data: ndarray / pandas Series / list of number / list of K 線 dict
+    field: data 是 K 線 dict 時要取的欄位
+    """
+    if isinstance(data, np.ndarray):
+        return data.astype(np.float64, copy=False)
+    if hasattr(data, 'to_numpy'):
+        return data.to_numpy(dtype=np.float64)
+    data = list(data)
+    if data and isinstance(data[0], dict):
+        return np.array([k[field] for k in data], dtype=np.float64)
+    return np.array(data, dtype=np.float64)
+
+
+def _first_valid(x):
+    """第一個非 NaN 的位置，全部 NaN 回傳 len(x)"""
+    valid = np.flatnonzero(~np.isnan(x))
+    return int(valid[0]) if len(valid) else len(x)
+
+
+def _windows(x, window):
+    """回傳 (n - window + 1, window) 的滑動視窗（不複製資料）"""
+    return sliding_window_view(x, window)
+
+
+def _rolling(x, window, reducer):
+    """共用的滾動計算：暖機期 NaN，之後每個視窗套 reducer(axis=1)"""
+    x = as_array(x)
+    out = np.full(len(x), np.nan)
+    if window <= 0 or len(x) < window:
+        return out
+    out[window - 1:] = reducer(_windows(x, window))
+    return out
+
+
+# ============================================================
+# 遞迴平滑（EMA / KD 共用核心）
+# ============================================================
+def _ema_filter(x, alpha, y0):
+    """
+    y[i] = alpha * x[i] + (1 - alpha) * y[i-1]，y[-1] = y0
+
+    用閉式解分段向量化：段內 y[j] = w^(j+1) * (y0 + alpha * Σ x[k] / w^(k+1))，
+    段長依 w 調整，讓 w^-段長 不超過 e^200 以免溢位。
+    """
+    n = len(x)
+    out = np.empty(n)
+    if n == 0:
+        return out
+    w = 1.0 - alpha
+    if w <= 0:
+        out[:] = x
+        return out
+
+    block = max(1, int(200.0 / -np.log(w)))
+    prev = float(y0)
+    for start in range(0, n, block):
+        seg = x[start:start + block]
+        pw = w ** np.arange(1, len(seg) + 1)
+        out[start:start + len(seg)] = pw * (prev + alpha * np.cumsum(seg / pw))
+        prev = out[start + len(seg) - 1]
+    return out
+
+
+def _ffill_from(values, valid, fill):
+    """valid 為 False 的位置沿用前一個 valid 的值，開頭沒有則填 fill"""
+    idx = np.where(valid, np.arange(len(valid)), -1)
+    np.maximum.accumulate(idx, out=idx)
+    return np.where(idx >= 0, values[np.maximum(idx, 0)], fill)
+
+
+# ============================================================
+# 均線 / EMA / MACD
+# ============================================================
+def sma(values, period):
+    """簡單移動平均"""
+    return _rolling(values, period, lambda w: w.mean(axis=1))
+
+
+def ema(values, period, seed='first'):
+    """
+    指數移動平均，alpha = 2 / (period + 1)
+
+    seed='first': 第一筆有效值當起點（同 pandas ewm(span=period, adjust=False)）
+    seed='sma':   前 period 筆有效值的平均當起點，之前填 NaN
+    開頭的 NaN 會被跳過（方便對 MACD 的 DIF 再做 EMA）
+    """
+    x = as_array(values)
+    out = np.full(len(x), np.nan)
+    start = _first_valid(x)
+    alpha = 2.0 / (period + 1)
+
+    if seed == 'sma':
+        first = start + period - 1
+        if first >= len(x):
+            return out
+        out[first] = x[start:first + 1].mean()
+    elif seed == 'first':
+        first = start
+        if first >= len(x):
+            return out
+        out[first] = x[first]
+    else:
+        raise ValueError(f"未知的 seed: {seed}")
+
+    out[first + 1:] = _ema_filter(x[first + 1:], alpha, out[first])
+    return out
+
+
+def macd(closes, fast=12, slow=26, signal=9, seed='first'):
+    """
+    計算 MACD
+
+    回傳: (dif, signal_line, histogram)，histogram = dif - signal_line（即 OSC）
+    """
+    closes = as_array(closes)
+    dif = ema(closes, fast, seed) - ema(closes, slow, seed)
+    signal_line = ema(dif, signal, seed)
+    return dif, signal_line, dif - signal_line
+
+
+# ============================================================
+# KD
+# ============================================================
+def kd(highs, lows, closes, period=9, k_init=50.0, d_init=50.0):
+    """
+    KD 指標（period 日 RSV、1/3 平滑）
+
+    K[i] = 2/3 * K[i-1] + 1/3 * RSV[i]，D[i] = 2/3 * D[i-1] + 1/3 * K[i]
+    第一根固定為 (k_init, d_init)；RSV 無法計算（暖機期、最高=最低）時 K/D 沿用前值。
+    """
+    highs, lows, closes = as_array(highs), as_array(lows), as_array(closes)
+    n = len(closes)
+    if n == 0:
+        return np.empty(0), np.empty(0)
+
+    low_n = rolling_min(lows, period)
+    high_n = rolling_max(highs, period)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        rsv = (closes - low_n) / (high_n - low_n) * 100
+
+    valid = ~np.isnan(rsv)
+    valid[0] = False
+
+    k_full = np.full(n, np.nan)
+    k_full[valid] = _ema_filter(rsv[valid], 1.0 / 3, k_init)
+    k = _ffill_from(k_full, valid, k_init)
+
+    d_full = np.full(n, np.nan)
+    d_full[valid] = _ema_filter(k[valid], 1.0 / 3, d_init)
+    d = _ffill_from(d_full, valid, d_init)
+    return k, d
+
+
+# ============================================================
+# 滾動統計
+# ============================================================
+def rolling_max(values, window):
+    """滾動最大值（視窗內有 NaN 則為 NaN）"""
+    return _rolling(values, window, lambda w: w.max(axis=1))
+
+
+def rolling_min(values, window):
+    """滾動最小值（視窗內有 NaN 則為 NaN）"""
+    return _rolling(values, window, lambda w: w.min(axis=1))
+
+
+def rolling_quantile(values, window, q):
+    """滾動分位數（線性內插，同 pandas rolling().quantile()）"""
+    return _rolling(values, window, lambda w: np.quantile(w, q, axis=1))
+
+
+# ============================================================
+# 量能 / 漲跌
+# ============================================================
+def volume_ratio(volumes, short=5, long=20):
+    """
+    量比 = 近 short 日均量 / 近 long 日均量
+
+    short=1 即「今日量 / long 日均量」；長均量為 0 時為 NaN
+    """
+    short_ma = sma(volumes, short)
+    long_ma = sma(volumes, long)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return np.where(long_ma > 0, short_ma / long_ma, np.nan)
+
+
+def pct_change(values, periods=1):
+    """periods 日漲跌幅（%），前 periods 筆為 NaN"""
+    x = as_array(values)
+    out = np.full(len(x), np.nan)
+    if len(x) > periods:
+        with np.errstate(divide='ignore', invalid='ignore'):
+            out[periods:] = (x[periods:] - x[:-periods]) / x[:-periods] * 100
+    return out
@@ -4,9 +4,11 @@
 """
 import requests
 import json
-from datetime import datetime, timedelta
+from datetime import datetime
 import sqlite3
 
+from trading_day import recent_trading_days
+
 def get_stock_master():
     """從資料庫讀取股票主檔"""
     conn = sqlite3.connect('data/market_data.db')
@@ -35,12 +37,12 @@ def collect_industry_foreign_flow():
     # 2. 取得外資買賣超資料
     print("\n[2/4] 取得外資買賣超...")
     
-    # 嘗試最近幾天
+    # 由交易日曆決定日期;最新交易日的 T86 尚未公布時才退到前一交易日
     foreign_data = None
     target_date = None
     
-    for days_ago in range(10):
-        date = (datetime.now() - timedelta(days=days_ago)).strftime('%Y%m%d')
+    for day in recent_trading_days(2):
+        date = day.strftime('%Y%m%d')
         
         url = f"https://www.twse.com.tw/rwd/zh/fund/T86?date={date}&selectType=ALL&response=json"
         headers = {'User-Agent': 'Mozilla/5.0'}
@@ -1,9 +1,13 @@
 #!/usr/bin/env python3
-import requests
 import json
 from collections import defaultdict
 from datetime import datetime, timedelta
 
+import numpy as np
+
+from trading_day import recent_trading_days
+from twse_json import fetch, parse_stock_day_all, parse_tpex_daily_close
+
 # 產業分類對照表
 # 從資料庫讀取產業分類
 _stock_industry_cache = None
@@ -33,42 +37,10 @@ def get_industry_by_code(code, name):
     return stock_map.get(code, "其他")
 
 def find_trading_dates():
-    """找到最近兩個有資料的交易日（使用 FMTQIK 月成交資訊）"""
-    import time
-    today = datetime.now()
-    trading_days = []
-    
+    """找到最近兩個有資料的交易日（交易日曆快取的 FMTQIK 月成交資訊）"""
     print("尋找最近的交易日...")
     
-    # 搜尋最近兩個月的交易日
-    for month_offset in range(3):
-        check_date = today - timedelta(days=30 * month_offset)
-        date_str = check_date.strftime('%Y%m%d')
-        
-        url = f"https://www.twse.com.tw/rwd/zh/afterTrading/FMTQIK?date={date_str}&response=json"
-        try:
-            if month_offset > 0:
-                time.sleep(1)
-            resp = requests.get(url, timeout=10)
-            data = resp.json()
-            if data.get('stat') == 'OK' and 'data' in data:
-                for row in data['data']:
-                    # 民國日期轉西元: 115/02/23 -> 20260223
-                    roc_date = row[0].strip()
-                    parts = roc_date.split('/')
-                    if len(parts) == 3:
-                        y = int(parts[0]) + 1911
-                        m = int(parts[1])
-                        d = int(parts[2])
-                        western = f"{y}{m:02d}{d:02d}"
-                        # 只取今天以前（含今天）的
-                        if western <= today.strftime('%Y%m%d'):
-                            trading_days.append(western)
-        except Exception as e:
-            print(f"  ✗ 取得月資料錯誤: {e}")
-    
-    # 排序取最近兩天
-    trading_days = sorted(set(trading_days), reverse=True)
+    trading_days = [d.strftime('%Y%m%d') for d in recent_trading_days(2)]
     
     if len(trading_days) >= 2:
         print(f"✓ 今日交易日: {trading_days[0]}")
@@ -81,43 +53,43 @@ def find_trading_dates():
         print("✗ 無法找到交易日")
         return None, None
 
-def get_all_stocks_amount(date_str):
-    """取得指定日期所有股票的成交金額"""
-    amounts = {}
-    
-    # 上市
+def _common_stock_mask(codes):
+    """4 碼數字、非 00 開頭 (ETF) 的一般股"""
+    return (np.char.str_len(codes) == 4) & np.char.isdigit(codes) & ~np.char.startswith(codes, '00')
+
+def fetch_twse_quotes(date_str):
+    """STOCK_DAY_ALL 串流解析 (代號/名稱/成交金額/收盤/漲跌)，失敗回傳 None"""
     url = f"https://www.twse.com.tw/rwd/zh/afterTrading/STOCK_DAY_ALL?date={date_str}&response=json"
     try:
-        response = requests.get(url, timeout=30)
-        data = response.json()
-        if data.get('stat') == 'OK':
-            for row in data['data']:
-                code = row[0].strip()
-                if code.isdigit() and len(code) == 4 and not code.startswith('00'):
-                    amount_str = row[3].replace(',', '')
-                    if amount_str not in ['--', '']:
-                        amounts[code] = float(amount_str) / 100000000
+        meta, quotes = fetch(url, parse_stock_day_all,
+                             fields=['code', 'name', 'value', 'close', 'change'], timeout=30)
     except Exception as e:
         print(f"✗ 上市資料錯誤: {e}")
+        return None
+    return quotes if meta.get('stat') == 'OK' else None
+
+def get_all_stocks_amount(date_str, twse_quotes=None):
+    """取得指定日期所有股票的成交金額（已抓過的上市行情可由 twse_quotes 傳入）"""
+    amounts = {}
+    
+    # 上市
+    quotes = twse_quotes if twse_quotes is not None else fetch_twse_quotes(date_str)
+    if quotes is not None:
+        mask = _common_stock_mask(quotes['code']) & ~np.isnan(quotes['value'])
+        amounts.update(zip(quotes['code'][mask].tolist(), (quotes['value'][mask] / 100000000).tolist()))
     
     # 上櫃 - 只有今天的資料
     if date_str == datetime.now().strftime('%Y%m%d') or \
        date_str == (datetime.now() - timedelta(days=1)).strftime('%Y%m%d'):
         try:
             otc_url = "https://www.tpex.org.tw/openapi/v1/tpex_mainboard_daily_close_quotes"
-            response = requests.get(otc_url, timeout=30)
-            otc_data = response.json()
+            _, otc = fetch(otc_url, parse_tpex_daily_close, fields=['date', 'code', 'value'], timeout=30)
             
             dt = datetime.strptime(date_str, '%Y%m%d')
             roc_date = f"{dt.year - 1911:03d}{dt.month:02d}{dt.day:02d}"
             
-            for item in otc_data:
-                if item.get('Date') == roc_date:
-                    code = item['SecuritiesCompanyCode'].strip()
-                    if code.isdigit() and len(code) == 4 and not code.startswith('00'):
-                        amount_str = item.get('TransactionAmount', '0').replace(',', '')
-                        if amount_str:
-                            amounts[code] = float(amount_str) / 100000000
+            mask = (otc['date'] == roc_date) & _common_stock_mask(otc['code']) & ~np.isnan(otc['value'])
+            amounts.update(zip(otc['code'][mask].tolist(), (otc['value'][mask] / 100000000).tolist()))
         except:
             pass
     
@@ -135,17 +107,21 @@ def collect_industry_heatmap():
     
     print(f"\n比較日期: {today} vs {yesterday}")
     
-    # 取得兩天的資料
-    today_amounts = get_all_stocks_amount(today)
+    # 取得兩天的資料（今天的上市行情後面算漲跌幅還要用，只抓一次）
+    today_quotes = fetch_twse_quotes(today)
+    if today_quotes is None:
+        print("使用備用方案")
+        return collect_from_turnover_data()
+    today_amounts = get_all_stocks_amount(today, today_quotes)
     yesterday_amounts = get_all_stocks_amount(yesterday)
     
     print(f"✓ 今天: {len(today_amounts)} 檔")
     print(f"✓ 昨天: {len(yesterday_amounts)} 檔")
     
-    # 取得今天的漲跌幅
-    url = f"https://www.twse.com.tw/rwd/zh/afterTrading/STOCK_DAY_ALL?date={today}&response=json"
-    response = requests.get(url, timeout=30)
-    data = response.json()
+    # 今天的漲跌幅（收盤、漲跌缺值或不比價的略過）
+    prev_close = today_quotes['close'] - today_quotes['change']
+    mask = _common_stock_mask(today_quotes['code']) & ~np.isnan(prev_close) & (prev_close != 0)
+    change_pcts = today_quotes['change'][mask] / prev_close[mask] * 100
     
     # 統計各產業
     industry_data = defaultdict(lambda: {
@@ -154,46 +130,28 @@ def collect_industry_heatmap():
     })
     
     # 處理上市
-    for row in data['data']:
-        try:
-            code = row[0].strip()
-            name = row[1].strip()
-            
-            if not code.isdigit() or len(code) != 4 or code.startswith('00'):
-                continue
-            
-            close_str = row[7].replace(',', '')
-            change_str = row[8].replace(',', '')
-            
-            if close_str in ['--', ''] or change_str in ['--', '', 'X']:
-                continue
-            
-            close_price = float(close_str)
-            change_value = float(change_str.replace('+', ''))
-            change_pct = (change_value / (close_price - change_value)) * 100
-            
-            # 計算資金流向
-            amount_today = today_amounts.get(code, 0)
-            amount_yesterday = yesterday_amounts.get(code, 0)
-            real_flow = amount_today - amount_yesterday
-            
-            industry = get_industry_by_code(code, name)
-            
-            industry_data[industry]['stocks'].append({
-                'code': code, 'name': name, 'change_pct': change_pct,
-                'amount': amount_today, 'real_flow': real_flow
-            })
-            industry_data[industry]['total_change'] += change_pct
-            industry_data[industry]['count'] += 1
-            industry_data[industry]['total_amount'] += amount_today
-            
-            if real_flow > 0:
-                industry_data[industry]['money_in'] += real_flow
-            else:
-                industry_data[industry]['money_out'] += abs(real_flow)
-                
-        except (IndexError, ValueError, ZeroDivisionError):
-            continue
+    for code, name, change_pct in zip(today_quotes['code'][mask].tolist(),
+                                      today_quotes['name'][mask].tolist(),
+                                      change_pcts.tolist()):
+        # 計算資金流向
+        amount_today = today_amounts.get(code, 0)
+        amount_yesterday = yesterday_amounts.get(code, 0)
+        real_flow = amount_today - amount_yesterday
+        
+        industry = get_industry_by_code(code, name)
+        
+        industry_data[industry]['stocks'].append({
+            'code': code, 'name': name, 'change_pct': change_pct,
+            'amount': amount_today, 'real_flow': real_flow
+        })
+        industry_data[industry]['total_change'] += change_pct
+        industry_data[industry]['count'] += 1
+        industry_data[industry]['total_amount'] += amount_today
+        
+        if real_flow > 0:
+            industry_data[industry]['money_in'] += real_flow
+        else:
+            industry_data[industry]['money_out'] += abs(real_flow)
     
     print(f"✓ 處理完成")
     
@@ -1,15 +1,23 @@
 #!/usr/bin/env python3
 """
-內部人持股異動收集器 v1.1
+內部人持股異動收集器 v1.2
 資料源: https://mopsov.twse.com.tw/mops/web/ajax_stapap1
+
+v1.2: SESSION_POOL_SIZE 個獨立 session 併發查詢 (各自 cookie 暖機、各自間隔),
+      MOPS 擋下時該 session 間隔加倍並重建; 進度寫入 checkpoint, 當天中斷後重跑會接續
+v1.3: 每檔每月的持股存進 market_data.db 的 insider_holdings, 已確認的月份不再查;
+      申報期限 (次月 15 日) 前抓到的算未確認, 之後每天重查直到確認;
+      查無資料 (ETF、下市) 也存成空結果, 期限後一樣確認, 不會每天重查
 """
 import requests
-from bs4 import BeautifulSoup
-import json, os, sys
+import json, os, sys, threading, queue, sqlite3
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from datetime import datetime, timedelta
-from time import sleep
+from time import sleep, monotonic
 from pathlib import Path
 
+from html_tables import extract_tables, class_xpath
+
 SCRIPT_DIR = Path(__file__).parent
 DATA_DIR = SCRIPT_DIR / "data"
 DATA_DIR.mkdir(exist_ok=True)
@@ -17,6 +25,8 @@ WATCHLIST_PATH = SCRIPT_DIR.parent / "watchlist_notion.json"
 if not WATCHLIST_PATH.exists():
     WATCHLIST_PATH = SCRIPT_DIR / "../watchlist_notion.json"
 OUTPUT_PATH = DATA_DIR / "insider_trading.json"
+DB_PATH = DATA_DIR / "market_data.db"
+CHECKPOINT_PATH = DATA_DIR / "insider_trading_progress.json"
 
 MOPS_BASE = "https://mopsov.twse.com.tw"
 MOPS_PAGE = f"{MOPS_BASE}/mops/web/stapap1"
@@ -27,21 +37,61 @@ HEADERS = {
     "Accept-Language": "zh-TW,zh;q=0.9,en-US;q=0.8,en;q=0.7",
 }
 EXTRA_STOCKS = ["2449","1560","4979","1503","2454","4772"]
-REQUEST_DELAY = 5
-_session = None
+REQUEST_DELAY = 5        # 每個 session 兩次請求的最小間隔 (秒)
+MAX_REQUEST_DELAY = 60   # 被擋時間隔加倍的上限
+SESSION_POOL_SIZE = 3
+FILING_DEADLINE_DAY = 15  # 內部人持股次月 15 日前申報完畢
+THROTTLE_MARKERS = ("\u9801\u9762\u7121\u6cd5\u57f7\u884c", "THE PAGE CANNOT")
+
+class MopsSession:
+    """一個獨立的 MOPS session: 自己的 cookie、自己的請求間隔, 被擋時退避並重建"""
+    def __init__(self, name="s0"):
+        self.name = name
+        self.delay = REQUEST_DELAY
+        self._next = 0.0
+        self.session = None
+
+    def warm_up(self):
+        self.session = requests.Session()
+        self.session.headers.update(HEADERS)
+        try:
+            self.session.get(MOPS_PAGE, timeout=15)
+            print(f"  [{self.name}] session ok, cookie: {dict(self.session.cookies)}")
+        except Exception as e:
+            print(f"  [{self.name}] session fail: {e}")
+        self._next = monotonic() + self.delay
+
+    def _pace(self):
+        wait = self._next - monotonic()
+        if wait > 0: sleep(wait)
+        self._next = monotonic() + self.delay
+
+    def post(self, payload, retries=2):
+        """送出查詢; 被擋 (頁面無法執行 / 429 / 503) 時間隔加倍、重建 session 後重試"""
+        if self.session is None: self.warm_up()
+        for attempt in range(retries + 1):
+            self._pace()
+            resp = self.session.post(MOPS_AJAX, data=payload, timeout=30)
+            resp.encoding = "utf-8"
+            throttled = resp.status_code in (429, 503) or any(m in resp.text for m in THROTTLE_MARKERS)
+            if not throttled:
+                # 順利時慢慢把間隔降回預設
+                self.delay = max(REQUEST_DELAY, self.delay * 0.8)
+                return resp
+            self.delay = min(self.delay * 2, MAX_REQUEST_DELAY)
+            print(f"  [{self.name}] throttled, backoff {self.delay:.0f}s")
+            sleep(self.delay)
+            self.warm_up()
+        return None
+
+_default_session = None
 
 def get_session():
-    global _session
-    if _session is not None:
-        return _session
-    _session = requests.Session()
-    _session.headers.update(HEADERS)
-    try:
-        r = _session.get(MOPS_PAGE, timeout=15)
-        print(f"  session ok, cookie: {dict(_session.cookies)}")
-    except Exception as e:
-        print(f"  session fail: {e}")
-    return _session
+    global _default_session
+    if _default_session is None:
+        _default_session = MopsSession()
+        _default_session.warm_up()
+    return _default_session
 
 def load_watchlist_codes():
     codes = set(EXTRA_STOCKS)
@@ -60,8 +110,9 @@ def parse_int(s):
     try: return int(s)
     except: return 0
 
-def fetch_insider_holdings(stock_id, roc_year, month):
-    session = get_session()
+def fetch_insider_holdings(stock_id, roc_year, month, mops=None):
+    """回傳該月內部人持股 list; 查無資料回傳空 list, 連線失敗或被擋回傳 None"""
+    mops = mops or get_session()
     payload = {
         "encodeURIComponent": "1", "step": "1", "firstin": "1", "off": "1",
         "keyword4": "", "code1": "", "TYPEK2": "", "checkbtn": "",
@@ -70,31 +121,18 @@ def fetch_insider_holdings(stock_id, roc_year, month):
         "year": str(roc_year), "month": str(month).zfill(2),
     }
     try:
-        resp = session.post(MOPS_AJAX, data=payload, timeout=30)
-        resp.encoding = "utf-8"
+        resp = mops.post(payload)
     except Exception as e:
         print(f"    net err {stock_id}: {e}")
         return None
-    if "\u9801\u9762\u7121\u6cd5\u57f7\u884c" in resp.text or "THE PAGE CANNOT" in resp.text:
-        global _session
-        _session = None
-        sleep(10)
-        session = get_session()
-        try:
-            resp = session.post(MOPS_AJAX, data=payload, timeout=30)
-            resp.encoding = "utf-8"
-            if "THE PAGE CANNOT" in resp.text:
-                return None
-        except:
-            return None
-    soup = BeautifulSoup(resp.text, "html.parser")
-    table = soup.find("table", {"class": "hasBorder"})
-    if not table: return None
-    rows = table.find_all("tr")
-    if len(rows) < 3: return None
+    if resp is None:
+        return None
+    tables = extract_tables(resp.text, class_xpath("table", "hasBorder"), cells=("td",))
+    if not tables: return []
+    rows = tables[0]
+    if len(rows) < 3: return []
     records = []
-    for tr in rows[2:]:
-        cells = [td.get_text(strip=True) for td in tr.find_all("td")]
+    for cells in rows[2:]:
         if len(cells) < 6: continue
         if cells[0] == "\u8077\u7a31" or not cells[0]: continue
         try:
@@ -142,12 +180,72 @@ def get_stock_name(stock_id):
         return row[0] if row else stock_id
     except: return stock_id
 
+def init_cache():
+    conn = sqlite3.connect(str(DB_PATH))
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS insider_holdings (
+            stock_id TEXT NOT NULL,
+            roc_year INTEGER NOT NULL,
+            month INTEGER NOT NULL,
+            records TEXT NOT NULL,
+            confirmed INTEGER NOT NULL DEFAULT 0,
+            fetched_at TEXT,
+            PRIMARY KEY (stock_id, roc_year, month)
+        )
+    """)
+    conn.commit()
+    conn.close()
+
+def is_final(roc_year, month, fetched):
+    """申報期限過後抓到的月份不會再變 (查無資料的空結果也一樣)"""
+    y, m = roc_year + 1911, month + 1
+    if m > 12: y, m = y + 1, 1
+    return fetched.date() > datetime(y, m, FILING_DEADLINE_DAY).date()
+
+def load_cached_month(stock_id, roc_year, month):
+    """回傳 (records, confirmed, fetched_at), 沒有快取回傳 None"""
+    conn = sqlite3.connect(str(DB_PATH))
+    row = conn.execute(
+        "SELECT records, confirmed, fetched_at FROM insider_holdings WHERE stock_id=? AND roc_year=? AND month=?",
+        (str(stock_id), roc_year, month)).fetchone()
+    conn.close()
+    if not row: return None
+    return json.loads(row[0]), bool(row[1]), datetime.fromisoformat(row[2])
+
+def save_cached_month(stock_id, roc_year, month, records, fetched=None):
+    fetched = fetched or datetime.now()
+    conn = sqlite3.connect(str(DB_PATH))
+    conn.execute(
+        "INSERT OR REPLACE INTO insider_holdings (stock_id, roc_year, month, records, confirmed, fetched_at) "
+        "VALUES (?, ?, ?, ?, ?, ?)",
+        (str(stock_id), roc_year, month, json.dumps(records, ensure_ascii=False),
+         int(is_final(roc_year, month, fetched)), fetched.isoformat(timespec="seconds")))
+    conn.commit()
+    conn.close()
+
+def load_checkpoint(target, run_date=None):
+    """讀取同一天、同一個目標月份中斷的進度 (別天或別月份的舊進度直接丟棄,
+    避免未確認月份的結果被舊進度凍結)"""
+    run_date = run_date or datetime.now().strftime("%Y-%m-%d")
+    try:
+        with open(CHECKPOINT_PATH, "r", encoding="utf-8") as f:
+            data = json.load(f)
+        if data.get("target_month") == target and data.get("run_date") == run_date:
+            return data
+    except Exception:
+        pass
+    return {"target_month": target, "run_date": run_date, "done": {}}
+
+def save_checkpoint(progress):
+    tmp = CHECKPOINT_PATH.with_suffix(".tmp")
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(progress, f, ensure_ascii=False)
+    tmp.replace(CHECKPOINT_PATH)
+
 def main(target_year=None, target_month=None):
     print("=" * 50)
-    print("insider v1.1")
+    print("insider v1.3")
     print("=" * 50)
-    print("\nSession...")
-    get_session()
     if target_year and target_month:
         roc_year, month = int(target_year), int(target_month)
     else:
@@ -159,26 +257,71 @@ def main(target_year=None, target_month=None):
     print(f"target: {ad_year}/{month:02d}, compare: {prev_year+1911}/{prev_month:02d}")
     codes = load_watchlist_codes()
     print(f"stocks: {len(codes)}")
-    all_changes, success, fail = [], 0, 0
-    for i, sid in enumerate(codes):
+
+    target = f"{ad_year}/{month:02d}"
+    progress = load_checkpoint(target)
+    lock = threading.Lock()
+    init_cache()
+    todo = [sid for sid in codes if sid not in progress["done"]]
+    if len(todo) < len(codes):
+        print(f"resume: {len(codes) - len(todo)} done, {len(todo)} left")
+
+    # session 第一次真的要查 MOPS 時才暖機 (全部命中快取就完全不連線)
+    pool = queue.Queue()
+    for i in range(min(SESSION_POOL_SIZE, max(len(todo), 1))):
+        pool.put(MopsSession(f"s{i}"))
+    stats = {"cached": 0, "fetched": 0}
+
+    def fetch_month(sid, y, m, mops):
+        """已確認的月份 (或今天已查過的未確認月份) 直接用快取"""
+        cached = load_cached_month(sid, y, m)
+        if cached:
+            records, confirmed, fetched_at = cached
+            if confirmed or fetched_at.date() == datetime.now().date():
+                with lock: stats["cached"] += 1
+                return records
+        records = fetch_insider_holdings(sid, y, m, mops)
+        with lock: stats["fetched"] += 1
+        if records is not None:
+            save_cached_month(sid, y, m, records)
+        elif cached:
+            return cached[0]
+        return records
+
+    def process(sid):
         sname = get_stock_name(sid)
-        print(f"\n[{i+1}/{len(codes)}] {sid} {sname}")
-        curr = fetch_insider_holdings(sid, roc_year, month)
-        sleep(REQUEST_DELAY)
-        if curr is None:
-            print(f"  no data"); fail += 1; continue
-        print(f"  found {len(curr)} insiders")
-        prev = fetch_insider_holdings(sid, prev_year, prev_month)
-        sleep(REQUEST_DELAY)
-        changes = calc_changes(sid, sname, curr, prev)
-        if changes:
-            all_changes.extend(changes)
+        mops = pool.get()
+        try:
+            curr = fetch_month(sid, roc_year, month, mops)
+            if not curr:
+                return sid, sname, None, []
+            prev = fetch_month(sid, prev_year, prev_month, mops)
+        finally:
+            pool.put(mops)
+        return sid, sname, curr, calc_changes(sid, sname, curr, prev)
+
+    with ThreadPoolExecutor(max_workers=pool.qsize()) as ex:
+        futures = [ex.submit(process, sid) for sid in todo]
+        for n, fut in enumerate(as_completed(futures), 1):
+            sid, sname, curr, changes = fut.result()
+            print(f"\n[{n}/{len(todo)}] {sid} {sname}")
+            if curr is None:
+                # 失敗的不記進度, 中斷後接續時會再試
+                print(f"  no data"); continue
+            print(f"  found {len(curr)} insiders")
             for c in changes:
                 sign = "BUY" if c["change_lots"] > 0 else "SELL"
                 print(f"  {sign} {c['title']} {c['name']}: {c['change_lots']:+d}")
-        else:
-            print(f"  no change")
-        success += 1
+            if not changes:
+                print(f"  no change")
+            with lock:
+                progress["done"][sid] = changes
+                save_checkpoint(progress)
+
+    print(f"\nmonths: {stats['cached']} cached, {stats['fetched']} fetched from MOPS")
+    all_changes = [c for sid in codes for c in progress["done"].get(sid, [])]
+    success = sum(1 for sid in codes if sid in progress["done"])
+    fail = len(codes) - success
     buyers = sorted([c for c in all_changes if c["change_lots"] > 0], key=lambda x: x["change_lots"], reverse=True)
     sellers = sorted([c for c in all_changes if c["change_lots"] < 0], key=lambda x: x["change_lots"])
     output = {
@@ -191,6 +334,9 @@ def main(target_year=None, target_month=None):
     }
     with open(OUTPUT_PATH, "w", encoding="utf-8") as f:
         json.dump(output, f, ensure_ascii=False, indent=2)
+    # 跑完就清掉進度; 查不到資料的代號 (ETF、下市) 下次照樣重試, 不靠 checkpoint
+    if CHECKPOINT_PATH.exists():
+        CHECKPOINT_PATH.unlink()
     print(f"\nDone! {len(all_changes)} changes ({len(buyers)} buy / {len(sellers)} sell)")
     print(f"Output: {OUTPUT_PATH}")
     return output
@@ -0,0 +1,221 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+前端 JSON 輸出共用寫檔器
+=================================
+各收集器原本每次都把整份結果 json.dump(indent=2) 重寫一次，不管內容有沒有變，
+前端每次刷新也只能全部重新下載。這裡統一：
+
+- 精簡序列化（有裝 orjson 就用 orjson，否則標準 json，無縮排）
+- 內容雜湊（不含 updated_at 這類每次都會變的欄位）沒變就不寫檔
+- 暫存檔 + os.replace 原子寫入
+- 同目錄的 export_manifest.json 記錄每個檔案的 hash / version，前端輪詢它就知道哪些檔要重抓
+- 預先壓縮：每個檔旁邊放 .json.gz（有裝 brotli 再加 .json.br），nginx gzip_static 直接送
+- 內容雜湊檔名：hashed/<名稱>.<hash>.json（含壓縮檔），manifest 的 path 指向它，
+  一旦寫出就不再覆寫，網址內容永遠不變，可以給很長的快取時間；只保留最近 KEEP_VERSIONS 版
+
+使用方式:
+    from json_export import write_json
+
+    write_json(DATA_DIR / 'turnover_analysis.json', output)        # 回傳 True 表示有寫檔
+    write_json(path, output, volatile=('updated_at', 'lt_enriched_at'))
+    write_json(history_path, output, manifest=False)                # 不列入 manifest
+"""
+import gzip
+import hashlib
+import json
+import os
+import re
+import threading
+from contextlib import contextmanager
+from datetime import datetime
+from pathlib import Path
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+try:
+    import fcntl
+except ImportError:   # Windows: 只有同行程內的鎖
+    fcntl = None
+
+MANIFEST_NAME = 'export_manifest.json'
+VOLATILE_KEYS = ('updated_at',)
+HASH_LENGTH = 16
+HASHED_DIR = 'hashed'
+KEEP_VERSIONS = 2     # 舊版多留一份，避免前端剛讀完 manifest 檔案就被刪
+
+_manifest_lock = threading.Lock()
+
+
+def _numpy_default(default):
+    """標準 json 的 default：numpy 純量/陣列轉成 Python 型別（同 orjson 的 OPT_SERIALIZE_NUMPY）"""
+    def convert(obj):
+        if hasattr(obj, 'tolist'):
+            return obj.tolist()
+        if default is not None:
+            return default(obj)
+        raise TypeError(f'Object of type {type(obj).__name__} is not JSON serializable')
+    return convert
+
+
+def dumps(data, default=None):
+    """精簡序列化成 UTF-8 bytes"""
+    if orjson is not None:
+        return orjson.dumps(data, default=default,
+                            option=orjson.OPT_NON_STR_KEYS | orjson.OPT_SERIALIZE_NUMPY)
+    return json.dumps(data, ensure_ascii=False, separators=(',', ':'),
+                      default=_numpy_default(default)).encode('utf-8')
+
+
+def content_hash(data, volatile=VOLATILE_KEYS, default=None):
+    """內容雜湊：忽略最上層的 volatile 欄位（例如 updated_at）"""
+    if isinstance(data, dict) and volatile:
+        data = {k: v for k, v in data.items() if k not in volatile}
+    return hashlib.sha256(dumps(data, default)).hexdigest()[:HASH_LENGTH]
+
+
+def atomic_write(path, payload):
+    """bytes 寫到暫存檔再 os.replace"""
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_name(path.name + '.tmp')
+    with open(tmp, 'wb') as f:
+        f.write(payload)
+    os.replace(tmp, path)
+
+
+def encodings():
+    """目前會預先產生的壓縮格式（副檔名）"""
+    return ['gz', 'br'] if brotli is not None else ['gz']
+
+
+def write_compressed(path, payload):
+    """在 path 旁邊寫出 .gz / .br 壓縮檔"""
+    path = Path(path)
+    # mtime=0: 內容相同壓出來的 bytes 也相同
+    atomic_write(path.with_name(path.name + '.gz'), gzip.compress(payload, 9, mtime=0))
+    if brotli is not None:
+        atomic_write(path.with_name(path.name + '.br'), brotli.compress(payload))
+
+
+def hashed_path(path, digest):
+    """data/x.json → data/hashed/x.<digest>.json"""
+    path = Path(path)
+    return path.parent / HASHED_DIR / f'{path.stem}.{digest}{path.suffix}'
+
+
+def _siblings(path):
+    return [path] + [path.with_name(f'{path.name}.{ext}') for ext in encodings()]
+
+
+def _published(path, entry):
+    """manifest 記錄的原檔、雜湊檔與壓縮檔都還在"""
+    if not entry.get('path') or entry.get('encodings') != encodings():
+        return False
+    files = _siblings(path) + _siblings(path.parent / entry['path'])
+    return all(f.exists() for f in files) and path.stat().st_size == entry.get('size')
+
+
+def _prune_hashed(path, keep):
+    """刪掉同名檔較舊的雜湊版本（連同壓縮檔）"""
+    path = Path(path)
+    pattern = re.compile(rf'{re.escape(path.stem)}\.[0-9a-f]{{{HASH_LENGTH}}}{re.escape(path.suffix)}')
+    versions = sorted((p for p in path.parent.joinpath(HASHED_DIR).glob(f'{path.stem}.*{path.suffix}')
+                       if pattern.fullmatch(p.name)),
+                      key=lambda p: p.stat().st_mtime_ns, reverse=True)
+    for old in versions[keep:]:
+        for f in _siblings(old):
+            f.unlink(missing_ok=True)
+
+
+def publish(path, payload, digest):
+    """寫出原檔、雜湊檔名副本與各自的壓縮檔，回傳相對於 path 目錄的雜湊檔路徑"""
+    path = Path(path)
+    target = hashed_path(path, digest)
+    atomic_write(path, payload)
+    write_compressed(path, payload)
+    if target.exists():
+        # 雜湊檔名的網址以 immutable 快取：已存在就絕不覆寫（payload 可能只差 updated_at），
+        # 缺的壓縮檔以既有內容補上；更新 mtime 免得被當成舊版刪掉
+        if not all(f.exists() for f in _siblings(target)):
+            write_compressed(target, target.read_bytes())
+        os.utime(target)
+    else:
+        atomic_write(target, payload)
+        write_compressed(target, payload)
+    _prune_hashed(path, KEEP_VERSIONS)
+    return target.relative_to(path.parent).as_posix()
+
+
+@contextmanager
+def _locked(manifest_path):
+    """manifest 讀改寫期間的鎖（run_daily 的步驟可能是不同行程）"""
+    with _manifest_lock:
+        if fcntl is None:
+            yield
+            return
+        manifest_path.parent.mkdir(parents=True, exist_ok=True)
+        with open(manifest_path.with_name(manifest_path.name + '.lock'), 'w') as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock, fcntl.LOCK_UN)
+
+
+def load_manifest(directory):
+    """讀某個目錄的 manifest，沒有或壞掉回傳空的"""
+    path = Path(directory) / MANIFEST_NAME
+    try:
+        with open(path, encoding='utf-8') as f:
+            manifest = json.load(f)
+        if isinstance(manifest.get('files'), dict):
+            return manifest
+    except (OSError, ValueError):
+        pass
+    return {'files': {}}
+
+
+def write_json(path, data, volatile=VOLATILE_KEYS, manifest=True, default=None):
+    """
+    寫出前端 JSON；內容（忽略 volatile 欄位）與上次相同就不寫
+
+    manifest: 是否記錄到同目錄的 export_manifest.json 並產生壓縮檔與雜湊檔名副本
+              （False 時每次都寫，只保證原子寫入，例如每日歷史檔）
+    Returns: True 表示有寫檔，False 表示內容沒變、沿用舊檔
+    """
+    path = Path(path)
+    payload = dumps(data, default)
+    if not manifest:
+        atomic_write(path, payload)
+        return True
+
+    digest = content_hash(data, volatile, default)
+    manifest_path = path.parent / MANIFEST_NAME
+    now = datetime.now().isoformat(timespec='seconds')
+    with _locked(manifest_path):
+        current = load_manifest(path.parent)
+        entry = current['files'].get(path.name, {})
+        unchanged = entry.get('hash') == digest and _published(path, entry)
+        if not unchanged:
+            entry = {
+                'hash': digest,
+                'version': entry.get('version', 0) + 1,
+                'size': len(payload),
+                'path': publish(path, payload, digest),
+                'encodings': encodings(),
+                'updated_at': now,
+            }
+        entry['checked_at'] = now
+        current['files'][path.name] = entry
+        current['updated_at'] = now
+        atomic_write(manifest_path, dumps(current))
+    return not unchanged
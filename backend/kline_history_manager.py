@@ -37,6 +37,9 @@ KLINE_DIR = SCRIPT_DIR / 'data' / 'kline_history'
 KLINE_DIR.mkdir(parents=True, exist_ok=True)
 
 DEFAULT_YEARS = 10
+# Yahoo 的 Ny 大約從 N*365 天前開始，首筆還會落在假日後；涵蓋檢查容許這麼多天的差距，
+# 免得剛抓好的 N 年資料又被判成「涵蓋不夠」而每次全抓
+COVERAGE_SLACK_DAYS = 30
 SLEEP_BETWEEN_FETCH = 0.15  # 秒，跟 new_high_screener.py 一致
 
 # CSV 欄位順序
@@ -100,13 +103,14 @@ def _parse_yahoo_chart(json_data):
     return unique
 
 
-def fetch_kline_yahoo(stock_code, period='10y'):
+def fetch_kline_yahoo(stock_code, period='10y', limiter=None):
     """
     從 Yahoo Finance 抓 K 線（用 query1 REST API，跟既有 new_high_screener.py 一致）
 
     Args:
         stock_code: 股票代號
         period: '1y', '2y', '5y', '10y', 'max' 等 Yahoo range 參數
+        limiter: 選用的 rate_limiter.HostRateLimiter（多執行緒併發抓時限速）
 
     Returns: list of dict，按日期由舊到新排序，失敗回傳 []
     """
@@ -115,6 +119,8 @@ def fetch_kline_yahoo(stock_code, period='10y'):
         url = (f'https://query1.finance.yahoo.com/v8/finance/chart/'
                f'{stock_code}{suffix}?interval=1d&range={period}')
         try:
+            if limiter is not None:
+                limiter.wait(url)
             r = requests.get(url, headers=YAHOO_HEADERS, timeout=20)
             if r.status_code != 200:
                 continue
@@ -218,10 +224,13 @@ def days_since(date_str):
         return 9999
 
 
-def needs_refresh(stock_code, years=DEFAULT_YEARS, max_stale_days=3):
+def needs_refresh(stock_code, years=DEFAULT_YEARS, max_stale_days=3, latest=None):
     """
     判斷是否需要補資料
 
+    latest: 最近交易日（YYYY-MM-DD，trading_day.latest_trading_day()）；有給就以它為基準
+            算落後天數，週末/假日不會被當成過期。沒給則以今天（日曆天）為基準
+
     Returns: 'fresh' (不需要), 'stale' (要補增量), 'missing' (要全抓)
     """
     path = get_csv_path(stock_code)
@@ -234,20 +243,28 @@ def needs_refresh(stock_code, years=DEFAULT_YEARS, max_stale_days=3):
 
     # 檢查涵蓋年限：第一筆要夠舊
     first_date = klines[0]['date']
-    target_oldest = (datetime.now() - timedelta(days=years * 365 + 30)).strftime('%Y-%m-%d')
+    target_oldest = (datetime.now() - timedelta(days=years * 365 - COVERAGE_SLACK_DAYS)).strftime('%Y-%m-%d')
     if first_date > target_oldest:
         # 第一筆太新 → 需要重抓更久的歷史
         return 'missing'
 
     # 檢查最後一筆夠新
     last_date = klines[-1]['date']
-    if days_since(last_date) > max_stale_days:
+    if latest is not None:
+        latest = str(latest)[:10]
+        if last_date >= latest:
+            return 'fresh'
+        behind = days_since(last_date) - days_since(latest)
+    else:
+        behind = days_since(last_date)
+    if behind > max_stale_days:
         return 'stale'
 
     return 'fresh'
 
 
-def ensure_kline_data(stock_code, years=DEFAULT_YEARS, verbose=True):
+def ensure_kline_data(stock_code, years=DEFAULT_YEARS, verbose=True, max_stale_days=3,
+                      limiter=None, latest=None):
     """
     確保某檔股票有完整的 N 年 K 線資料
     - 完全沒檔 → 全抓
@@ -255,9 +272,13 @@ def ensure_kline_data(stock_code, years=DEFAULT_YEARS, verbose=True):
     - 太久沒更新 → 抓 1 個月併入
     - 已是新的 → 跳過
 
+    max_stale_days: 最後一筆距今超過幾天算太久（每日掃描器要當日資料用 0）
+    limiter: 選用的 rate_limiter.HostRateLimiter，傳給 fetch_kline_yahoo
+    latest: 最近交易日，見 needs_refresh
+
     Returns: dict 含 status('fresh'/'updated'/'created'/'failed') 和 days_count
     """
-    status = needs_refresh(stock_code, years=years)
+    status = needs_refresh(stock_code, years=years, max_stale_days=max_stale_days, latest=latest)
 
     if status == 'fresh':
         klines = load_kline_csv(stock_code)
@@ -270,7 +291,7 @@ def ensure_kline_data(stock_code, years=DEFAULT_YEARS, verbose=True):
         if verbose:
             print(f"    📥 {stock_code}: 首次抓取 {years} 年資料...", end=' ', flush=True)
         period = f'{years}y' if years <= 10 else 'max'
-        klines = fetch_kline_yahoo(stock_code, period=period)
+        klines = fetch_kline_yahoo(stock_code, period=period, limiter=limiter)
         if not klines:
             if verbose:
                 print(f"失敗")
@@ -285,7 +306,7 @@ def ensure_kline_data(stock_code, years=DEFAULT_YEARS, verbose=True):
         # 增量補齊：抓近 3 個月併入舊資料
         if verbose:
             print(f"    🔄 {stock_code}: 補齊近期資料...", end=' ', flush=True)
-        new_klines = fetch_kline_yahoo(stock_code, period='3mo')
+        new_klines = fetch_kline_yahoo(stock_code, period='3mo', limiter=limiter)
         if not new_klines:
             if verbose:
                 print(f"失敗")
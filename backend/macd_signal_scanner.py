@@ -17,9 +17,19 @@ import json
 import os
 import time
 import traceback
-from datetime import datetime, timedelta
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import datetime
 from pathlib import Path
 
+import numpy as np
+
+from indicators import as_array, sma, macd, volume_ratio
+from indicator_state import update_state, state_arrays
+from json_export import write_json
+from kline_history_manager import ensure_kline_data, load_kline_csv
+from rate_limiter import HostRateLimiter
+import trading_day
+
 # ============================================================
 # 設定
 # ============================================================
@@ -38,78 +48,132 @@ HISTOGRAM_SHRINK_DAYS = 3      # 連續幾天柱狀體在縮小
 
 # K線天數
 KLINE_DAYS = 80  # 需要足夠天數計算 MACD(26) + Signal(9) + 判斷趨勢
+TWSE_MONTHS = 5  # TWSE 備援抓近幾個月（含當月）
+TWSE_CACHE_DIR = DATA_DIR / 'twse_stock_day_cache'  # 已收盤月份的 STOCK_DAY 快取（永不過期）
+
+# 併發下載：執行緒數 + 每個 host 的最小請求間隔（取代逐檔 sleep）
+FETCH_WORKERS = 8
+YFINANCE_HOST = 'query2.finance.yahoo.com'
+LIMITER = HostRateLimiter({
+    'www.twse.com.tw': 0.5,
+    'query1.finance.yahoo.com': 0.1,
+    YFINANCE_HOST: 0.1,
+})
 
 # ============================================================
 # K 線資料抓取（使用 TWSE API，不需要額外套件）
 # ============================================================
-def fetch_kline_twse(stock_code, days=80):
+def _recent_months(n, today=None):
+    """由當月往回 n 個月: [(year, month), ...]"""
+    today = today or datetime.now()
+    year, month = today.year, today.month
+    months = []
+    for _ in range(n):
+        months.append((year, month))
+        month -= 1
+        if month == 0:
+            year, month = year - 1, 12
+    return months
+
+
+def _month_cache_path(stock_code, year, month):
+    return TWSE_CACHE_DIR / stock_code / f"{year}{month:02d}.json"
+
+
+def _load_month_cache(stock_code, year, month):
+    """讀已收盤月份的快取，沒有則回傳 None"""
+    path = _month_cache_path(stock_code, year, month)
+    if not path.exists():
+        return None
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except Exception:
+        return None
+
+
+def _save_month_cache(stock_code, year, month, klines):
+    path = _month_cache_path(stock_code, year, month)
+    try:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = path.with_suffix('.tmp')
+        with open(tmp, 'w', encoding='utf-8') as f:
+            json.dump(klines, f, ensure_ascii=False, separators=(',', ':'))
+        tmp.replace(path)
+    except Exception as e:
+        print(f"    ⚠ 寫入 {stock_code} {year}{month:02d} 快取失敗: {e}")
+
+
+def _fetch_twse_month(stock_code, year, month):
     """
-    從 TWSE API 抓取個股日K線
-    回傳 list of dict: [{'date', 'open', 'high', 'low', 'close', 'volume'}, ...]
+    抓單一月份的 STOCK_DAY
+    回傳 list of dict；查無資料或失敗回傳 None
     """
-    import requests
-    
-    klines = []
     headers = {'User-Agent': 'Mozilla/5.0'}
+    date_str = f"{year}{month:02d}01"
+    url = f"https://www.twse.com.tw/rwd/zh/afterTrading/STOCK_DAY?date={date_str}&stockNo={stock_code}&response=json"
     
-    # 需要抓多個月份的資料
-    today = datetime.now()
-    months_to_fetch = 5  # 抓近5個月確保有足夠資料
+    try:
+        resp = LIMITER.get(url, headers=headers, timeout=15)
+        data = resp.json()
+    except Exception as e:
+        print(f"    ⚠ 抓取 {stock_code} {date_str} 失敗: {e}")
+        return None
     
-    for m in range(months_to_fetch):
-        # 從上個月開始往回抓，避免當月無資料
-        target = today.replace(day=1) - timedelta(days=30 * m + 1)
-        date_str = target.strftime('%Y%m01')
-        
-        url = f"https://www.twse.com.tw/rwd/zh/afterTrading/STOCK_DAY?date={date_str}&stockNo={stock_code}&response=json"
-        
+    if data.get('stat') != 'OK' or not data.get('data'):
+        return None
+    
+    klines = []
+    for row in data['data']:
         try:
-            resp = requests.get(url, headers=headers, timeout=15)
-            data = resp.json()
-            
-            if data.get('stat') != 'OK' or not data.get('data'):
-                continue
-            
-            for row in data['data']:
-                try:
-                    # 民國轉西元
-                    date_parts = row[0].split('/')
-                    year = int(date_parts[0]) + 1911
-                    date_str_formatted = f"{year}/{date_parts[1]}/{date_parts[2]}"
-                    
-                    volume = int(row[1].replace(',', ''))
-                    open_price = float(row[3].replace(',', ''))
-                    high_price = float(row[4].replace(',', ''))
-                    low_price = float(row[5].replace(',', ''))
-                    close_price = float(row[6].replace(',', ''))
-                    
-                    klines.append({
-                        'date': date_str_formatted,
-                        'open': open_price,
-                        'high': high_price,
-                        'low': low_price,
-                        'close': close_price,
-                        'volume': volume
-                    })
-                except (ValueError, IndexError):
-                    continue
-            
-            time.sleep(0.5)  # 避免被封
-            
-        except Exception as e:
-            print(f"    ⚠ 抓取 {stock_code} {date_str} 失敗: {e}")
+            # 民國轉西元
+            date_parts = row[0].split('/')
+            year_ad = int(date_parts[0]) + 1911
+            klines.append({
+                'date': f"{year_ad}/{date_parts[1]}/{date_parts[2]}",
+                'open': float(row[3].replace(',', '')),
+                'high': float(row[4].replace(',', '')),
+                'low': float(row[5].replace(',', '')),
+                'close': float(row[6].replace(',', '')),
+                'volume': int(row[1].replace(',', ''))
+            })
+        except (ValueError, IndexError):
             continue
+    return klines
+
+
+def fetch_kline_twse(stock_code, days=80, existing=None):
+    """
+    從 TWSE API 抓取個股日K線
+    - existing: 已有的 K 線（例如 K 線庫的資料），最後一筆所在月份之前的月份不再處理
+    - 已收盤的月份資料不會再變，第一次抓到就永久存在 TWSE_CACHE_DIR；
+      只有當月每次重抓，所以通常每檔最多 1 個請求
+    回傳 list of dict: [{'date', 'open', 'high', 'low', 'close', 'volume'}, ...]
+    """
+    # 日期統一成 YYYY/MM/DD，後抓到的覆蓋舊的
+    merged = {}
+    for k in existing or []:
+        date_key = k['date'].replace('-', '/')
+        merged[date_key] = dict(k, date=date_key)
+    last_month = max(merged)[:7] if merged else ''  # 'YYYY/MM'
+    
+    # 需要抓多個月份的資料（含當月）
+    current = _recent_months(1)[0]
+    for year, month in _recent_months(TWSE_MONTHS):
+        if f"{year}/{month:02d}" < last_month:
+            continue  # 已有資料的月份
+        
+        is_closed = (year, month) != current
+        klines = _load_month_cache(stock_code, year, month) if is_closed else None
+        if klines is None:
+            klines = _fetch_twse_month(stock_code, year, month)
+            if klines and is_closed:
+                _save_month_cache(stock_code, year, month, klines)
+        
+        for k in klines or []:
+            merged[k['date']] = k
     
-    # 去重並按日期排序
-    seen = set()
-    unique_klines = []
-    for k in klines:
-        if k['date'] not in seen:
-            seen.add(k['date'])
-            unique_klines.append(k)
-    
-    unique_klines.sort(key=lambda x: x['date'])
-    return unique_klines
+    return [merged[d] for d in sorted(merged)]
 
 
 def fetch_kline_yahoo(stock_code, days=80):
@@ -123,6 +187,7 @@ def fetch_kline_yahoo(stock_code, days=80):
         df = None
         for suffix in ['.TW', '.TWO']:
             try:
+                LIMITER.wait(YFINANCE_HOST)
                 ticker = yf.Ticker(f"{stock_code}{suffix}")
                 df = ticker.history(period=f"{days}d")
                 if not df.empty:
@@ -150,73 +215,41 @@ def fetch_kline_yahoo(stock_code, days=80):
         return []
 
 
-def fetch_kline(stock_code, days=80):
-    """優先用 Yahoo (穩定)，失敗用 TWSE"""
+def fetch_kline(stock_code, days=80, existing=None):
+    """優先用 Yahoo (穩定)，失敗用 TWSE（existing 的月份不重抓）"""
     klines = fetch_kline_yahoo(stock_code, days)
     if len(klines) < 35:
-        print(f"    Yahoo 資料不足({len(klines)}筆)，嘗試 TWSE...")
-        klines = fetch_kline_twse(stock_code, days)
+        print(f"    {stock_code} Yahoo 資料不足({len(klines)}筆)，嘗試 TWSE...")
+        klines = fetch_kline_twse(stock_code, days, existing=existing)
     return klines
 
 
-# ============================================================
-# 技術指標計算
-# ============================================================
-def calc_ema(prices, period):
-    """計算 EMA"""
-    if len(prices) < period:
-        return []
-    
-    ema = [0.0] * len(prices)
-    multiplier = 2.0 / (period + 1)
-    
-    # 初始值用 SMA
-    sma = sum(prices[:period]) / period
-    ema[period - 1] = sma
-    
-    for i in range(period, len(prices)):
-        ema[i] = (prices[i] - ema[i - 1]) * multiplier + ema[i - 1]
-    
-    return ema
-
-
-def calc_macd(closes, fast=12, slow=26, signal=9):
+def load_store_state(stock_code, latest=None):
     """
-    計算 MACD
-    回傳: dif[], macd_signal[], histogram[]
-    """
-    ema_fast = calc_ema(closes, fast)
-    ema_slow = calc_ema(closes, slow)
-    
-    # DIF = EMA(fast) - EMA(slow)
-    dif = [0.0] * len(closes)
-    for i in range(slow - 1, len(closes)):
-        dif[i] = ema_fast[i] - ema_slow[i]
-    
-    # MACD Signal = EMA(DIF, signal)
-    dif_valid = dif[slow - 1:]
-    macd_signal_raw = calc_ema(dif_valid, signal)
-    
-    macd_signal = [0.0] * len(closes)
-    histogram = [0.0] * len(closes)
-    
-    start_idx = slow - 1
-    for i in range(len(macd_signal_raw)):
-        macd_signal[start_idx + i] = macd_signal_raw[i]
-        histogram[start_idx + i] = dif[start_idx + i] - macd_signal_raw[i]
+    透過 K 線庫（kline_history_manager）補到最近交易日並推進增量指標狀態
+    K 線庫沒有這檔時會先建 1 年資料，之後每天只補增量；已到 latest 就不連網
     
-    return dif, macd_signal, histogram
+    回傳: indicator_state 的 state；補資料失敗回傳 None
+    """
+    result = ensure_kline_data(stock_code, years=1, verbose=False,
+                               max_stale_days=0, limiter=LIMITER, latest=latest)
+    if result['status'] == 'failed':
+        return None
+    return update_state(stock_code)
 
 
-def calc_ma(prices, period):
-    """計算簡單移動平均"""
-    if len(prices) < period:
-        return []
+def load_stock_data(stock_code, latest=None):
+    """
+    下載階段（在執行緒池裡跑）：取得單檔分析所需資料
     
-    ma = [0.0] * len(prices)
-    for i in range(period - 1, len(prices)):
-        ma[i] = sum(prices[i - period + 1:i + 1]) / period
-    return ma
+    latest: 最近交易日（YYYY-MM-DD），None 表示交易日曆取不到
+    回傳: ('state', state) 或 ('klines', klines)
+    """
+    state = load_store_state(stock_code, latest)
+    if state is not None and state['count'] >= 40:
+        return 'state', state
+    # K 線庫補不到 → yfinance / TWSE，TWSE 只抓 K 線庫還沒有的月份
+    return 'klines', fetch_kline(stock_code, KLINE_DAYS, existing=load_kline_csv(stock_code))
 
 
 # ============================================================
@@ -231,13 +264,50 @@ def analyze_stock(stock_code, stock_name, klines):
     if len(klines) < 40:
         return None
     
-    closes = [k['close'] for k in klines]
-    volumes = [k['volume'] for k in klines]
-    current_price = closes[-1]
+    closes = as_array(klines, 'close')
+    dif, macd_signal, histogram = macd(closes, FAST_PERIOD, SLOW_PERIOD, SIGNAL_PERIOD, seed='sma')
+    series = {
+        'close': closes,
+        'volume': as_array(klines, 'volume'),
+        'ma20': sma(closes, 20),
+        'dif': dif,
+        'macd': macd_signal,
+        'histogram': histogram,
+    }
+    return _analyze_series(stock_code, stock_name, series, klines[-1]['date'])
+
+
+def analyze_stock_state(stock_code, stock_name, state):
+    """
+    同 analyze_stock，但直接用 indicator_state 的增量指標（不重算 MACD）
+    
+    state 的 EMA 從 K 線庫第一筆開始遞迴，與 80 日 SMA 起始值的差異可忽略
+    """
+    if state is None or state['count'] < 40:
+        return None
+    
+    arrays = state_arrays(state)
+    series = {
+        'close': arrays['close'],
+        'volume': arrays['volume'],
+        'ma20': arrays['ma20'],
+        'dif': arrays['dif'],
+        'macd': arrays['macd'],
+        'histogram': arrays['osc'],
+    }
+    # K 線庫日期是 YYYY-MM-DD，輸出維持 YYYY/MM/DD
+    return _analyze_series(stock_code, stock_name, series, state['date'].replace('-', '/'))
+
+
+def _analyze_series(stock_code, stock_name, series, date):
+    """依指標序列判斷訊號（analyze_stock / analyze_stock_state 共用）"""
+    closes = series['close']
+    volumes = series['volume']
+    current_price = float(closes[-1])
     
     # ---- 1. 多頭判斷：股價在 MA20 之上 ----
-    ma20 = calc_ma(closes, 20)
-    if not ma20 or ma20[-1] == 0:
+    ma20 = series['ma20']
+    if np.isnan(ma20[-1]) or ma20[-1] == 0:
         return None
     
     if current_price < ma20[-1]:
@@ -247,28 +317,26 @@ def analyze_stock(stock_code, stock_name, klines):
     if len(volumes) < 20:
         return None
     
-    vol_5 = sum(volumes[-5:]) / 5
-    vol_20 = sum(volumes[-20:]) / 20
-    
-    if vol_20 == 0:
+    # 近5日均量 / 近20日均量（20日均量為 0 時是 NaN）
+    vol_ratio = float(volume_ratio(volumes, 5, 20)[-1])
+    if np.isnan(vol_ratio):
         return None
     
-    vol_ratio = vol_5 / vol_20
     is_volume_shrink = vol_ratio < VOLUME_SHRINK_RATIO
     
     if not is_volume_shrink:
         return None  # 沒有量縮，跳過
     
-    # ---- 3. MACD 計算 ----
-    dif, macd_signal, histogram = calc_macd(closes, FAST_PERIOD, SLOW_PERIOD, SIGNAL_PERIOD)
+    # ---- 3. MACD ----
+    dif, macd_signal, histogram = series['dif'], series['macd'], series['histogram']
     
     valid_start = SLOW_PERIOD + SIGNAL_PERIOD - 1
     if len(closes) <= valid_start:
         return None
     
-    current_dif = dif[-1]
-    current_macd = macd_signal[-1]
-    current_hist = histogram[-1]
+    current_dif = float(dif[-1])
+    current_macd = float(macd_signal[-1])
+    current_hist = float(histogram[-1])
     
     # ---- 4. MACD 柱狀體縮小（有機會翻紅/金叉）----
     # 柱狀體為負且在縮小中（絕對值減小）
@@ -337,7 +405,7 @@ def analyze_stock(stock_code, stock_name, klines):
         'code': stock_code,
         'name': stock_name,
         'price': current_price,
-        'ma20': round(ma20[-1], 2),
+        'ma20': round(float(ma20[-1]), 2),
         'dif': round(current_dif, 4),
         'macd': round(current_macd, 4),
         'histogram': round(current_hist, 4),
@@ -347,9 +415,9 @@ def analyze_stock(stock_code, stock_name, klines):
         'stage': stage,
         'cross_status': cross_status,
         'signal_strength': calc_signal_strength(
-            vol_ratio, dif_pct, current_hist, histogram[-2] if len(histogram) >= 2 else 0
+            vol_ratio, dif_pct, current_hist, float(histogram[-2]) if len(histogram) >= 2 else 0
         ),
-        'date': klines[-1]['date']
+        'date': date
     }
 
 
@@ -549,9 +617,25 @@ def main():
     total = len(stocks)
     print(f"  → 合計 {total} 檔不重複股票\n")
     
-    # 2. 逐檔分析
-    print(f"[2/3] 逐檔抓取K線並分析 MACD 訊號...")
-    print(f"  （預估需要 {total * 2} ~ {total * 3} 秒）\n")
+    # 2. 併發下載（每個 host 各自限速），再逐檔分析
+    print(f"[2/3] 併發抓取K線（{FETCH_WORKERS} 執行緒）並分析 MACD 訊號...")
+    t0 = time.time()
+    try:
+        latest = trading_day.latest_trading_day()
+    except Exception:
+        latest = None
+    latest = latest.strftime('%Y-%m-%d') if latest else None
+    loaded = {}
+    with ThreadPoolExecutor(max_workers=FETCH_WORKERS) as ex:
+        futures = {ex.submit(load_stock_data, code, latest): code for code in stocks}
+        for fut in as_completed(futures):
+            code = futures[fut]
+            try:
+                loaded[code] = fut.result()
+            except Exception as e:
+                loaded[code] = e
+    from_store = sum(1 for v in loaded.values() if isinstance(v, tuple) and v[0] == 'state')
+    print(f"  → 下載完成 {time.time() - t0:.1f} 秒（K 線庫 {from_store} 檔 / 其他來源 {total - from_store} 檔）\n")
     
     signals = []
     errors = []
@@ -564,13 +648,21 @@ def main():
         print(f"  {progress} {code} {name} ({source})...", end=' ', flush=True)
         
         try:
-            klines = fetch_kline(code, KLINE_DAYS)
+            data = loaded[code]
+            if isinstance(data, Exception):
+                raise data
             
-            if len(klines) < 35:
-                print(f"資料不足({len(klines)}筆)")
-                continue
-            
-            result = analyze_stock(code, name, klines)
+            kind, payload = data
+            if kind == 'state':
+                result = analyze_stock_state(code, name, payload)
+            else:
+                klines = payload
+                
+                if len(klines) < 35:
+                    print(f"資料不足({len(klines)}筆)")
+                    continue
+                
+                result = analyze_stock(code, name, klines)
             
             if result:
                 result['source'] = source
@@ -579,9 +671,6 @@ def main():
             else:
                 print("—")
             
-            # 控制請求頻率，避免被封
-            time.sleep(0.3)
-            
         except Exception as e:
             print(f"✗ 錯誤: {e}")
             errors.append({'code': code, 'name': name, 'error': str(e)})
@@ -637,14 +726,12 @@ def main():
     except Exception:
         pass
     output_path = DATA_DIR / 'macd_signal_stocks.json'
-    with open(output_path, 'w', encoding='utf-8') as f:
-        json.dump(output, f, ensure_ascii=False, indent=2)
+    write_json(output_path, output)
 
     # 保存歷史檔案（保留3天）
     scan_date_str = output["scan_date"].replace("-", "")
     history_path = DATA_DIR / f"macd_signal_{scan_date_str}.json"
-    with open(history_path, "w", encoding="utf-8") as f:
-        json.dump(output, f, ensure_ascii=False, indent=2)
+    write_json(history_path, output, manifest=False)
     
     # 清理超過3天的歷史檔案
     import glob
@@ -4,145 +4,173 @@
 market_data.json 產生器 v2
 從 data/market_data.db 整合融資、期貨、市場廣度、情緒指數，輸出給前端
 情緒指數 v2: 7 指標 (價格動能/市場廣度/新高低比 + 融資/期貨/外資/PCR)
+每日情緒指數存 sentiment_history 表（export 時增量補寫；python3 market_data_exporter.py --backfill 全部重算）
 """
 
+import argparse
 import json
 import sqlite3
 from datetime import datetime
 from pathlib import Path
 
+import numpy as np
+import pandas as pd
+
+from json_export import write_json
+
 DB_PATH = Path(__file__).parent / 'data' / 'market_data.db'
 OUTPUT = Path(__file__).parent / 'data' / 'market_data.json'
 
+SNAPSHOT_DAYS = 60    # 價格動能 MA60 需要的天數
+HISTORY_DAYS = 15     # 輸出給前端的融資/期貨歷史筆數
+# market_breadth 多讀一些列，taiex_close 有缺值時仍湊得到 SNAPSHOT_DAYS 個收盤價
+BREADTH_ROWS = SNAPSHOT_DAYS * 2
+
+# 快取鍵: 各輸入表的 (最新日期, 最大 id)；INSERT OR REPLACE 改寫當日資料也會換 id
+SOURCE_TABLES = ('margin_data', 'futures_data', 'market_breadth', 'limit_updown')
+# 輸出格式版本，欄位有增減就 +1，舊格式的檔案不沿用（2: 加 history.sentiment）
+OUTPUT_FORMAT = 2
+
+# 分數級距: [(門檻, 分數), ...] 由高到低，都沒達到用 default
+MARGIN_BANDS = [(70, 90), (65, 75), (60, 60), (55, 45), (50, 30)]
+MARGIN_DEFAULT = 15
+FUTURES_BANDS = [(1.15, 85), (1.05, 70), (0.95, 50), (0.85, 30)]
+FUTURES_DEFAULT = 15
+FOREIGN_BANDS = [(20000, 85), (5000, 70), (-5000, 50), (-20000, 30)]   # 嚴格大於
+FOREIGN_DEFAULT = 15
+PCR_BANDS = [(1.5, 25), (1.2, 40), (0.8, 55), (0.5, 70)]
+PCR_DEFAULT = 85
+BREADTH_BANDS = [(70, 85), (60, 70), (40, 50), (30, 30)]
+BREADTH_DEFAULT = 15
+LIMIT_BANDS = [(80, 85), (65, 70), (40, 50), (20, 30)]
+LIMIT_DEFAULT = 15
+
+# 7 指標權重（價格類 45% + 籌碼類 55%），順序即加總順序
+COMPONENT_WEIGHTS = {
+    'momentum': 0.20, 'breadth': 0.15, 'strength': 0.10,
+    'margin': 0.15, 'futures': 0.15, 'foreign': 0.10, 'pcr': 0.15,
+}
+
+# 情緒指數歷史表；增量更新時往回多讀的日曆天數（湊滿 MA60 需要的收盤價）
+HISTORY_TABLE = 'sentiment_history'
+HISTORY_LOOKBACK_DAYS = 150
+
 
 def get_conn():
     return sqlite3.connect(str(DB_PATH))
 
 
-def get_latest_margin(conn):
-    row = conn.execute(
-        'SELECT date, margin_ratio, margin_balance FROM margin_data ORDER BY date DESC LIMIT 1'
-    ).fetchone()
-    if not row:
-        return None
-    return {'date': row[0], 'ratio': row[1], 'balance': row[2]}
-
-
-def get_margin_history(conn, limit=60):
-    rows = conn.execute(
-        'SELECT date, margin_ratio, margin_balance FROM margin_data ORDER BY date DESC LIMIT ?',
-        (limit,)
-    ).fetchall()
-    return [{'date': r[0], 'ratio': r[1], 'balance': r[2]} for r in reversed(rows)]
-
-
-def get_latest_futures(conn):
-    row = conn.execute(
-        '''SELECT date, long_short_ratio, foreign_net, trust_net, dealer_net,
-                  retail_long, retail_short, retail_net, retail_ratio, pcr_volume
-           FROM futures_data ORDER BY date DESC LIMIT 1'''
-    ).fetchone()
-    if not row:
-        return None
-    return {
-        'date': row[0], 'ratio': row[1],
-        'foreign_net': row[2], 'trust_net': row[3], 'dealer_net': row[4],
-        'retail_long': row[5], 'retail_short': row[6],
-        'retail_net': row[7], 'retail_ratio': row[8], 'pcr_volume': row[9],
-    }
-
-
-def get_futures_history(conn, limit=60):
-    rows = conn.execute(
-        'SELECT date, long_short_ratio, foreign_net FROM futures_data ORDER BY date DESC LIMIT ?',
-        (limit,)
-    ).fetchall()
-    return [{'date': r[0], 'ratio': r[1], 'foreign_net': r[2]} for r in reversed(rows)]
+def band_score(value, bands, default, strict=False):
+    """依級距給分（strict=True 用 >，否則 >=）"""
+    for threshold, score in bands:
+        if (value > threshold) if strict else (value >= threshold):
+            return score
+    return default
 
 
-# ===== 新增: 市場廣度相關讀取 =====
+# ===== 快照讀取: 每張表一次 SQL =====
 
-def get_latest_breadth(conn):
-    """讀取最新市場廣度資料"""
-    row = conn.execute(
-        '''SELECT date, taiex_close, up_count, down_count, unchanged, up_ratio, up_limit, down_limit
-           FROM market_breadth ORDER BY date DESC LIMIT 1'''
-    ).fetchone()
-    if not row:
+def get_data_dates(conn):
+    """各輸入表的 [最新日期, 最大 id]（一次查詢），表不存在回傳 None"""
+    selects = ', '.join(
+        f'(SELECT MAX(date) FROM {t}), (SELECT MAX(id) FROM {t})' for t in SOURCE_TABLES
+    )
+    try:
+        row = conn.execute(f'SELECT {selects}').fetchone()
+    except sqlite3.Error:
         return None
-    return {
-        'date': row[0], 'close': row[1],
-        'up_count': row[2], 'down_count': row[3],
-        'unchanged': row[4], 'up_ratio': row[5],
-        'up_limit': row[6], 'down_limit': row[7],
-    }
-
-
-def get_price_history(conn, limit=60):
-    """讀取大盤收盤價歷史 (算 MA 用)"""
-    rows = conn.execute(
-        'SELECT date, taiex_close FROM market_breadth WHERE taiex_close IS NOT NULL ORDER BY date DESC LIMIT ?',
-        (limit,)
-    ).fetchall()
-    return [{'date': r[0], 'close': r[1]} for r in rows]  # 注意: DESC, [0]=最新
-
-
-def get_latest_limit_counts(conn, date_str=None):
-    """從 limit_updown 表讀漲跌停家數"""
+    return {t: [row[i * 2], row[i * 2 + 1]] for i, t in enumerate(SOURCE_TABLES)}
+
+
+def _read_recent(conn, sql, limit):
+    """ORDER BY date DESC LIMIT 的查詢 → 由舊到新的 rows"""
+    return conn.execute(sql, (limit,)).fetchall()[::-1]
+
+
+def load_snapshot(conn, days=SNAPSHOT_DAYS):
+    """
+    一次讀齊情緒指數與輸出需要的資料（每張表一次 SQL）
+
+    Returns: dict
+      margin / futures / breadth: 由舊到新的 dict list
+      closes: 最近 days 個非空的加權收盤價 (np.ndarray, [0]=最新)
+      limits: {date: (漲停家數, 跌停家數)}
+    """
+    margin = [
+        {'date': r[0], 'ratio': r[1], 'balance': r[2]}
+        for r in _read_recent(conn, 'SELECT date, margin_ratio, margin_balance '
+                                    'FROM margin_data ORDER BY date DESC LIMIT ?', HISTORY_DAYS)
+    ]
+    futures = [
+        {
+            'date': r[0], 'ratio': r[1],
+            'foreign_net': r[2], 'trust_net': r[3], 'dealer_net': r[4],
+            'retail_long': r[5], 'retail_short': r[6],
+            'retail_net': r[7], 'retail_ratio': r[8], 'pcr_volume': r[9],
+        }
+        for r in _read_recent(conn, """SELECT date, long_short_ratio, foreign_net, trust_net, dealer_net,
+                                              retail_long, retail_short, retail_net, retail_ratio, pcr_volume
+                                       FROM futures_data ORDER BY date DESC LIMIT ?""", HISTORY_DAYS)
+    ]
+    breadth = [
+        {
+            'date': r[0], 'close': r[1],
+            'up_count': r[2], 'down_count': r[3],
+            'unchanged': r[4], 'up_ratio': r[5],
+            'up_limit': r[6], 'down_limit': r[7],
+        }
+        for r in _read_recent(conn, """SELECT date, taiex_close, up_count, down_count, unchanged,
+                                              up_ratio, up_limit, down_limit
+                                       FROM market_breadth ORDER BY date DESC LIMIT ?""", BREADTH_ROWS)
+    ]
+    closes = np.array([b['close'] for b in reversed(breadth) if b['close'] is not None][:days],
+                      dtype=float)
+
+    limits = {}
     try:
-        if date_str:
-            up = conn.execute(
-                "SELECT COUNT(*) FROM limit_updown WHERE date=? AND type='limit_up'",
-                (date_str,)
-            ).fetchone()[0]
-            down = conn.execute(
-                "SELECT COUNT(*) FROM limit_updown WHERE date=? AND type='limit_down'",
-                (date_str,)
-            ).fetchone()[0]
-        else:
-            # 取最新日期
-            row = conn.execute(
-                "SELECT date FROM limit_updown ORDER BY date DESC LIMIT 1"
-            ).fetchone()
-            if not row:
-                return None
-            date_str = row[0]
-            up = conn.execute(
-                "SELECT COUNT(*) FROM limit_updown WHERE date=? AND type='limit_up'",
-                (date_str,)
-            ).fetchone()[0]
-            down = conn.execute(
-                "SELECT COUNT(*) FROM limit_updown WHERE date=? AND type='limit_down'",
-                (date_str,)
-            ).fetchone()[0]
-        return {'date': date_str, 'up_limit': up, 'down_limit': down}
-    except Exception:
+        since = breadth[0]['date'] if breadth else ''
+        for date, up, down in conn.execute(
+            """SELECT date, SUM(type='limit_up'), SUM(type='limit_down')
+               FROM limit_updown WHERE date >= ? GROUP BY date""", (since,)
+        ):
+            limits[date] = (up, down)
+    except sqlite3.Error:
+        pass
+
+    return {'margin': margin, 'futures': futures, 'breadth': breadth,
+            'closes': closes, 'limits': limits}
+
+
+def latest_limit_counts(snapshot, date_str=None):
+    """快照裡某日（預設最新一日）的漲跌停家數"""
+    limits = snapshot['limits']
+    if not limits:
         return None
+    if date_str is None:
+        date_str = max(limits)
+    up, down = limits.get(date_str, (0, 0))
+    return {'date': date_str, 'up_limit': up, 'down_limit': down}
 
 
 # ===== 情緒指數 v2 =====
 
-def calc_momentum_score(conn, breadth):
-    """價格動能評分 (MA位置 + MA20乖離率)"""
+def calc_momentum_score(breadth, closes):
+    """價格動能評分 (MA位置 + MA20乖離率)；closes: 收盤價陣列，[0]=最新"""
     if not breadth or not breadth.get('close'):
         return None
     
     close = breadth['close']
-    prices = get_price_history(conn, 60)
-    
-    if len(prices) < 5:
+    if len(closes) < 5:
         return None
     
-    closes = [p['close'] for p in prices]  # [0]=最新, DESC
-    
     # 計算 MA
-    ma20 = sum(closes[:20]) / min(len(closes), 20) if len(closes) >= 5 else close
-    ma60 = sum(closes[:60]) / min(len(closes), 60) if len(closes) >= 20 else ma20
+    ma20 = float(closes[:20].mean())
+    ma60 = float(closes[:60].mean()) if len(closes) >= 20 else ma20
     
     # MA20 方向: 比較今天 MA20 vs 5天前 MA20
     ma20_rising = True
     if len(closes) >= 25:
-        ma20_5d_ago = sum(closes[5:25]) / 20
+        ma20_5d_ago = float(closes[5:25].mean())
         ma20_rising = ma20 > ma20_5d_ago
     
     # MA20 乖離率
@@ -179,19 +207,8 @@ def calc_breadth_score(breadth):
         return None
     
     r = breadth['up_ratio']
-    if r >= 70:
-        score = 85
-    elif r >= 60:
-        score = 70
-    elif r >= 40:
-        score = 50
-    elif r >= 30:
-        score = 30
-    else:
-        score = 15
-    
     return {
-        'score': score,
+        'score': band_score(r, BREADTH_BANDS, BREADTH_DEFAULT),
         'up_count': breadth.get('up_count'),
         'down_count': breadth.get('down_count'),
         'up_ratio': round(r, 1),
@@ -213,148 +230,94 @@ def calc_highlowlimit_score(breadth, limit_data):
         up_limit = limit_data.get('up_limit', 0)
         down_limit = limit_data.get('down_limit', 0)
     
-    if up_limit == 0 and down_limit == 0:
-        return None
-    
     # 評分邏輯: 用比值判斷
     total = up_limit + down_limit
     if total == 0:
         return None
-    up_pct = up_limit / total * 100 if total > 0 else 50
-    
-    if up_pct >= 80:
-        score = 85
-    elif up_pct >= 65:
-        score = 70
-    elif up_pct >= 40:
-        score = 50
-    elif up_pct >= 20:
-        score = 30
-    else:
-        score = 15
+    up_pct = up_limit / total * 100
     
     return {
-        'score': score,
+        'score': band_score(up_pct, LIMIT_BANDS, LIMIT_DEFAULT),
         'up_limit': up_limit,
         'down_limit': down_limit,
     }
 
 
-def calc_sentiment(margin, futures, conn):
-    """計算台股情緒指數 v2 (0-100), 7 指標"""
+def calc_sentiment(snapshot):
+    """計算台股情緒指數 v2 (0-100), 7 指標；全部從 load_snapshot 的快照算"""
+    margin = snapshot['margin'][-1] if snapshot['margin'] else None
+    futures = snapshot['futures'][-1] if snapshot['futures'] else None
+    breadth = snapshot['breadth'][-1] if snapshot['breadth'] else None
     components = {}
     weights_used = 0
     
     # ===== 價格類 (45%) =====
     
     # 1. 價格動能 (20%)
-    breadth = get_latest_breadth(conn)
-    momentum = calc_momentum_score(conn, breadth)
+    momentum = calc_momentum_score(breadth, snapshot['closes'])
     if momentum:
         components['momentum'] = {
-            'score': momentum['score'], 'weight': 0.20, 'desc': '價格動能',
+            'score': momentum['score'], 'weight': COMPONENT_WEIGHTS['momentum'], 'desc': '價格動能',
             'detail': f"收盤{momentum['close']:.0f} MA20={momentum['ma20']:.0f} 乖離{momentum['deviation']:+.1f}%"
         }
-        weights_used += 0.20
+        weights_used += COMPONENT_WEIGHTS['momentum']
     
     # 2. 市場廣度 (15%)
     breadth_score = calc_breadth_score(breadth)
     if breadth_score:
         components['breadth'] = {
-            'score': breadth_score['score'], 'weight': 0.15, 'desc': '市場廣度',
+            'score': breadth_score['score'], 'weight': COMPONENT_WEIGHTS['breadth'], 'desc': '市場廣度',
             'detail': f"漲{breadth_score['up_count']} 跌{breadth_score['down_count']} 比率{breadth_score['up_ratio']}%"
         }
-        weights_used += 0.15
+        weights_used += COMPONENT_WEIGHTS['breadth']
     
     # 3. 新高低比 (10%)
-    limit_data = get_latest_limit_counts(conn, breadth['date'] if breadth else None)
+    limit_data = latest_limit_counts(snapshot, breadth['date'] if breadth else None)
     hl_score = calc_highlowlimit_score(breadth, limit_data)
     if hl_score:
         components['strength'] = {
-            'score': hl_score['score'], 'weight': 0.10, 'desc': '新高低比',
+            'score': hl_score['score'], 'weight': COMPONENT_WEIGHTS['strength'], 'desc': '新高低比',
             'detail': f"漲停{hl_score['up_limit']} 跌停{hl_score['down_limit']}"
         }
-        weights_used += 0.10
+        weights_used += COMPONENT_WEIGHTS['strength']
     
     # ===== 籌碼類 (55%) =====
     
     # 4. 融資使用率 (15%)
     if margin and margin.get('ratio'):
         r = margin['ratio']
-        if r >= 70:
-            score = 90
-        elif r >= 65:
-            score = 75
-        elif r >= 60:
-            score = 60
-        elif r >= 55:
-            score = 45
-        elif r >= 50:
-            score = 30
-        else:
-            score = 15
         components['margin'] = {
-            'score': score, 'weight': 0.15, 'desc': '融資使用率',
-            'detail': f"{r:.1f}%"
+            'score': band_score(r, MARGIN_BANDS, MARGIN_DEFAULT), 'weight': COMPONENT_WEIGHTS['margin'],
+            'desc': '融資使用率', 'detail': f"{r:.1f}%"
         }
-        weights_used += 0.15
+        weights_used += COMPONENT_WEIGHTS['margin']
 
     # 5. 期貨多空比 (15%)
     if futures and futures.get('ratio'):
         r = futures['ratio']
-        if r >= 1.15:
-            score = 85
-        elif r >= 1.05:
-            score = 70
-        elif r >= 0.95:
-            score = 50
-        elif r >= 0.85:
-            score = 30
-        else:
-            score = 15
         components['futures'] = {
-            'score': score, 'weight': 0.15, 'desc': '期貨多空比',
-            'detail': f"{r:.2f}"
+            'score': band_score(r, FUTURES_BANDS, FUTURES_DEFAULT), 'weight': COMPONENT_WEIGHTS['futures'],
+            'desc': '期貨多空比', 'detail': f"{r:.2f}"
         }
-        weights_used += 0.15
+        weights_used += COMPONENT_WEIGHTS['futures']
 
     # 6. 外資淨部位 (10%)
     if futures and futures.get('foreign_net') is not None:
         fn = futures['foreign_net']
-        if fn > 20000:
-            score = 85
-        elif fn > 5000:
-            score = 70
-        elif fn > -5000:
-            score = 50
-        elif fn > -20000:
-            score = 30
-        else:
-            score = 15
         components['foreign'] = {
-            'score': score, 'weight': 0.10, 'desc': '外資淨部位',
-            'detail': f"{fn:+,.0f}"
+            'score': band_score(fn, FOREIGN_BANDS, FOREIGN_DEFAULT, strict=True), 'weight': COMPONENT_WEIGHTS['foreign'],
+            'desc': '外資淨部位', 'detail': f"{fn:+,.0f}"
         }
-        weights_used += 0.10
+        weights_used += COMPONENT_WEIGHTS['foreign']
 
     # 7. PCR (15%)
     if futures and futures.get('pcr_volume'):
         pcr = futures['pcr_volume']
-        if pcr >= 1.5:
-            score = 25
-        elif pcr >= 1.2:
-            score = 40
-        elif pcr >= 0.8:
-            score = 55
-        elif pcr >= 0.5:
-            score = 70
-        else:
-            score = 85
         components['pcr'] = {
-            'score': score, 'weight': 0.15, 'desc': 'Put/Call比',
-            'detail': f"{pcr:.2f}"
+            'score': band_score(pcr, PCR_BANDS, PCR_DEFAULT), 'weight': COMPONENT_WEIGHTS['pcr'],
+            'desc': 'Put/Call比', 'detail': f"{pcr:.2f}"
         }
-        weights_used += 0.15
+        weights_used += COMPONENT_WEIGHTS['pcr']
 
     if weights_used == 0:
         return None
@@ -363,25 +326,218 @@ def calc_sentiment(margin, futures, conn):
     total = sum(c['score'] * c['weight'] for c in components.values())
     score = round(total / weights_used)
 
-    if score >= 75:
-        rating = '極度貪婪'
-    elif score >= 60:
-        rating = '貪婪'
-    elif score >= 45:
-        rating = '中性'
-    elif score >= 30:
-        rating = '恐懼'
-    else:
-        rating = '極度恐懼'
-
     return {
         'score': score,
-        'rating': rating,
+        'rating': sentiment_rating(score),
         'components': components,
         'available_weight': round(weights_used, 2),
     }
 
 
+def sentiment_rating(score):
+    if score >= 75:
+        return '極度貪婪'
+    elif score >= 60:
+        return '貪婪'
+    elif score >= 45:
+        return '中性'
+    elif score >= 30:
+        return '恐懼'
+    return '極度恐懼'
+
+
+# ===== 情緒指數歷史 (向量化) =====
+
+def band_scores(values, bands, default, strict=False):
+    """band_score 的陣列版"""
+    values = np.asarray(values, dtype=float)
+    conds = [(values > t) if strict else (values >= t) for t, _ in bands]
+    return np.select(conds, [s for _, s in bands], default).astype(float)
+
+
+def _truthy(values):
+    """同 dict.get(...) 的真假判斷: 非空且非 0"""
+    values = np.asarray(values, dtype=float)
+    return ~np.isnan(values) & (values != 0)
+
+
+def load_history_frames(conn, since=None):
+    """讀齊四張輸入表（since 之後），每張表一次 SQL → DataFrame"""
+    where = 'WHERE date >= ?' if since else ''
+    params = (since,) if since else ()
+
+    def read(sql):
+        return pd.read_sql_query(sql.format(where=where), conn, params=params)
+
+    margin = read('SELECT date, margin_ratio FROM margin_data {where} ORDER BY date')
+    futures = read('SELECT date, long_short_ratio, foreign_net, pcr_volume '
+                   'FROM futures_data {where} ORDER BY date')
+    breadth = read('SELECT date, taiex_close, up_ratio, up_limit, down_limit '
+                   'FROM market_breadth {where} ORDER BY date')
+    try:
+        limits = read("SELECT date, SUM(type='limit_up') AS up_limit, "
+                      "SUM(type='limit_down') AS down_limit "
+                      "FROM limit_updown {where} GROUP BY date ORDER BY date")
+    except Exception:
+        limits = pd.DataFrame(columns=['date', 'up_limit', 'down_limit'])
+    return {'margin': margin, 'futures': futures, 'breadth': breadth, 'limits': limits}
+
+
+def momentum_scores(closes):
+    """
+    calc_momentum_score 的陣列版
+
+    closes: 非空收盤價，由舊到新；第 i 個分數只看 closes[:i+1] 的最後 SNAPSHOT_DAYS 個
+    Returns: 分數陣列（資料不足 5 天為 NaN）
+    """
+    c = pd.Series(np.asarray(closes, dtype=float))
+    n = np.arange(1, len(c) + 1)
+    ma20 = c.rolling(20, min_periods=1).mean().to_numpy()
+    ma60 = np.where(n >= 20, c.rolling(SNAPSHOT_DAYS, min_periods=1).mean().to_numpy(), ma20)
+    ma20_5d_ago = c.shift(5).rolling(20).mean().to_numpy()
+    rising = np.where(n >= 25, ma20 > ma20_5d_ago, True)
+    c = c.to_numpy()
+    with np.errstate(divide='ignore', invalid='ignore'):
+        deviation = np.where(ma20 > 0, (c - ma20) / ma20 * 100, 0)
+    base = np.select([(c > ma20) & rising, (c > ma20) & ~rising, c > ma60], [75, 60, 40], 20)
+    score = np.round(np.clip(base + np.clip(deviation * 3, -15, 15), 5, 95))
+    return np.where((n >= 5) & (c != 0), score, np.nan)
+
+
+def compute_sentiment_history(frames):
+    """
+    一次算出每個歷史日期的台股情緒指數（與 calc_sentiment 同邏輯）
+
+    日期軸是四張輸入表日期的聯集；每個日期 D 都用「D 當天或之前最新的一筆」各表資料，
+    等同當天跑 export() 的結果。
+    Returns: DataFrame（index 為日期字串），欄位: score, rating, available_weight, 7 個指標分數
+    """
+    margin, futures, breadth, limits = (frames[k] for k in ('margin', 'futures', 'breadth', 'limits'))
+    dates = sorted(set(margin['date']) | set(futures['date']) | set(breadth['date']) | set(limits['date']))
+    if not dates:
+        return pd.DataFrame()
+
+    def asof(df):
+        return df.set_index('date').reindex(dates, method='ffill') if len(df) else \
+            pd.DataFrame(index=dates, columns=df.columns.drop('date'), dtype=float)
+
+    m = asof(margin)
+    f = asof(futures)
+    b = asof(breadth.assign(breadth_date=breadth['date']))
+    lim = limits.set_index('date')
+    comp = {}
+
+    # 1. 價格動能: 最新一筆 breadth 有收盤價時，用到當天為止的收盤價序列
+    with_close = breadth[breadth['taiex_close'].notna()]
+    mom = pd.Series(momentum_scores(with_close['taiex_close']), index=with_close['date'].to_numpy())
+    comp['momentum'] = np.where(_truthy(b['taiex_close']),
+                                mom.reindex(b['breadth_date']).to_numpy(dtype=float), np.nan)
+
+    # 2. 市場廣度
+    up_ratio = b['up_ratio'].to_numpy(dtype=float)
+    comp['breadth'] = np.where(np.isnan(up_ratio), np.nan,
+                               band_scores(up_ratio, BREADTH_BANDS, BREADTH_DEFAULT))
+
+    # 3. 新高低比: breadth 的漲停數 > 0 時用 breadth，否則用 limit_updown（breadth 當日；沒有 breadth 用最新一日）
+    from_breadth = _truthy(b['up_limit'])
+    limit_day = b['breadth_date'].where(b['breadth_date'].notna(),
+                                        pd.Series(lim.index, index=lim.index).reindex(dates, method='ffill'))
+    lim_at = lim.reindex(limit_day.to_numpy())
+    up = np.where(from_breadth, b['up_limit'], lim_at['up_limit'].fillna(0)).astype(float)
+    down = np.where(from_breadth, b['down_limit'].fillna(0), lim_at['down_limit'].fillna(0)).astype(float)
+    total = up + down
+    with np.errstate(divide='ignore', invalid='ignore'):
+        up_pct = up / total * 100
+    comp['strength'] = np.where(total > 0, band_scores(up_pct, LIMIT_BANDS, LIMIT_DEFAULT), np.nan)
+
+    # 4~7. 融資 / 期貨 / 外資 / PCR
+    ratio = m['margin_ratio'].to_numpy(dtype=float)
+    comp['margin'] = np.where(_truthy(ratio), band_scores(ratio, MARGIN_BANDS, MARGIN_DEFAULT), np.nan)
+    ratio = f['long_short_ratio'].to_numpy(dtype=float)
+    comp['futures'] = np.where(_truthy(ratio), band_scores(ratio, FUTURES_BANDS, FUTURES_DEFAULT), np.nan)
+    fn = f['foreign_net'].to_numpy(dtype=float)
+    comp['foreign'] = np.where(np.isnan(fn), np.nan,
+                               band_scores(fn, FOREIGN_BANDS, FOREIGN_DEFAULT, strict=True))
+    pcr = f['pcr_volume'].to_numpy(dtype=float)
+    comp['pcr'] = np.where(_truthy(pcr), band_scores(pcr, PCR_BANDS, PCR_DEFAULT), np.nan)
+
+    # 加權平均 (動態正規化)，加總順序同 calc_sentiment
+    total = np.zeros(len(dates))
+    weights = np.zeros(len(dates))
+    for key, weight in COMPONENT_WEIGHTS.items():
+        ok = ~np.isnan(comp[key])
+        total = np.where(ok, total + np.nan_to_num(comp[key]) * weight, total)
+        weights = np.where(ok, weights + weight, weights)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        score = np.where(weights > 0, np.round(total / weights), np.nan)
+
+    out = pd.DataFrame(comp, index=dates)
+    out.insert(0, 'score', score)
+    out.insert(1, 'rating', [sentiment_rating(v) if not np.isnan(v) else None for v in score])
+    out.insert(2, 'available_weight', np.round(weights, 2))
+    return out[out['score'].notna()]
+
+
+def ensure_history_table(conn):
+    conn.execute(f'''
+        CREATE TABLE IF NOT EXISTS {HISTORY_TABLE} (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            date TEXT NOT NULL UNIQUE,
+            score INTEGER,
+            rating TEXT,
+            available_weight REAL,
+            {', '.join(f'{k}_score INTEGER' for k in COMPONENT_WEIGHTS)},
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+
+
+def update_sentiment_history(conn, full=False):
+    """
+    補寫 sentiment_history
+
+    full=True 或表是空的: 全部歷史一次算完重寫
+    否則: 從表裡最後一天（含，當天資料可能後補）往後算，只讀回溯 HISTORY_LOOKBACK_DAYS 天的輸入
+    Returns: 寫入筆數
+    """
+    ensure_history_table(conn)
+    last = None if full else conn.execute(f'SELECT MAX(date) FROM {HISTORY_TABLE}').fetchone()[0]
+    since = None
+    if last:
+        since = (datetime.strptime(last, '%Y-%m-%d') - pd.Timedelta(days=HISTORY_LOOKBACK_DAYS)
+                 ).strftime('%Y-%m-%d')
+
+    history = compute_sentiment_history(load_history_frames(conn, since))
+    if last:
+        history = history[history.index >= last]
+    if history.empty:
+        return 0
+
+    columns = ['score', 'rating', 'available_weight'] + list(COMPONENT_WEIGHTS)
+    db_columns = columns[:3] + [f'{k}_score' for k in COMPONENT_WEIGHTS]
+    rows = [
+        (date, *(None if isinstance(v, float) and np.isnan(v) else
+                 (int(v) if isinstance(v, float) and col != 'available_weight' else v)
+                 for col, v in zip(columns, values)))
+        for date, values in zip(history.index, history[columns].itertuples(index=False))
+    ]
+    conn.executemany(
+        f'INSERT OR REPLACE INTO {HISTORY_TABLE} (date, {", ".join(db_columns)}) '
+        f'VALUES ({", ".join("?" * (len(columns) + 1))})', rows)
+    conn.commit()
+    return len(rows)
+
+
+def get_sentiment_history(conn, limit=SNAPSHOT_DAYS):
+    """最近 limit 天的情緒指數（由舊到新），給前端畫圖"""
+    try:
+        rows = _read_recent(conn, f'SELECT date, score, rating FROM {HISTORY_TABLE} '
+                                  f'ORDER BY date DESC LIMIT ?', limit)
+    except sqlite3.Error:
+        return []
+    return [{'date': r[0], 'score': r[1], 'rating': r[2]} for r in rows]
+
+
 def get_us_fear_greed():
     """即時抓取美股恐懼貪婪指數"""
     try:
@@ -402,18 +558,65 @@ def get_us_fear_greed():
     return {'score': None, 'rating': 'N/A', 'previous_close': None}
 
 
-def export():
+def load_cached_output(data_dates):
+    """上次輸出的格式版本、輸入資料日期都與這次相同 → 回傳上次的輸出，否則 None"""
+    if data_dates is None or not OUTPUT.exists():
+        return None
+    try:
+        with open(OUTPUT, encoding='utf-8') as f:
+            cached = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if cached.get('format') != OUTPUT_FORMAT or cached.get('data_dates') != data_dates:
+        return None
+    return cached
+
+
+def refresh_us_sentiment(cached):
+    """
+    沿用上次輸出時只重抓美股恐懼貪婪指數（台股休市美股照常交易時會變）
+
+    抓取失敗保留上次的值。Returns: 是否有寫檔
+    """
+    us_sentiment = get_us_fear_greed()
+    if us_sentiment.get('score') is None:
+        return False
+    cached['sentiment']['us'] = us_sentiment
+    cached['updated_at'] = datetime.now().isoformat()
+    return write_json(OUTPUT, cached)
+
+
+def export(force=False):
     print("=" * 50)
     print("market_data.json 產生器 v2")
     print("=" * 50)
 
     conn = get_conn()
+    data_dates = get_data_dates(conn)
+    cached = None if force else load_cached_output(data_dates)
+    if cached is not None:
+        conn.close()
+        print(f"  輸入資料未變動（{', '.join(f'{t}={d[0]}' for t, d in data_dates.items())}），"
+              f"沿用 {OUTPUT.name}")
+        if refresh_us_sentiment(cached):
+            print(f"  美股指數有更新: {cached['sentiment']['us']['score']}")
+        return True
+
+    snapshot = load_snapshot(conn)
+    try:
+        written = update_sentiment_history(conn)
+        print(f"  情緒歷史: 更新 {written} 天")
+    except Exception as e:
+        print(f"  ⚠ 情緒歷史更新失敗: {e}")
+    sentiment_hist = get_sentiment_history(conn)
+    conn.close()
 
-    margin = get_latest_margin(conn)
-    futures = get_latest_futures(conn)
-    margin_hist = get_margin_history(conn, 15)
-    futures_hist = get_futures_history(conn, 15)
-    breadth = get_latest_breadth(conn)
+    margin_hist = snapshot['margin']
+    futures_hist = [{'date': f['date'], 'ratio': f['ratio'], 'foreign_net': f['foreign_net']}
+                    for f in snapshot['futures']]
+    margin = margin_hist[-1] if margin_hist else None
+    futures = snapshot['futures'][-1] if snapshot['futures'] else None
+    breadth = snapshot['breadth'][-1] if snapshot['breadth'] else None
 
     print(f"  融資: {margin['date'] if margin else 'N/A'} ratio={margin['ratio'] if margin else 'N/A'}")
     print(f"  期貨: {futures['date'] if futures else 'N/A'} ratio={futures['ratio'] if futures else 'N/A'}")
@@ -421,7 +624,7 @@ def export():
     print(f"  融資歷史: {len(margin_hist)} 筆")
     print(f"  期貨歷史: {len(futures_hist)} 筆")
 
-    tw_sentiment = calc_sentiment(margin, futures, conn)
+    tw_sentiment = calc_sentiment(snapshot)
     us_sentiment = get_us_fear_greed()
 
     output = {
@@ -437,14 +640,14 @@ def export():
         'history': {
             'margin': margin_hist,
             'futures': futures_hist,
+            'sentiment': sentiment_hist,
         },
+        'data_dates': data_dates,
+        'format': OUTPUT_FORMAT,
         'updated_at': datetime.now().isoformat(),
     }
 
-    with open(OUTPUT, 'w', encoding='utf-8') as f:
-        json.dump(output, f, ensure_ascii=False, indent=2)
-
-    conn.close()
+    write_json(OUTPUT, output)
 
     score_str = f"{tw_sentiment['score']} ({tw_sentiment['rating']})" if tw_sentiment else 'N/A'
     print(f"\n✓ 已輸出: {OUTPUT}")
@@ -456,5 +659,22 @@ def export():
     return True
 
 
+def backfill_history():
+    """一次重算所有歷史日期的情緒指數，寫入 sentiment_history"""
+    conn = get_conn()
+    written = update_sentiment_history(conn, full=True)
+    first, last = conn.execute(f'SELECT MIN(date), MAX(date) FROM {HISTORY_TABLE}').fetchone()
+    conn.close()
+    print(f"✓ 情緒歷史回補 {written} 天（{first} ~ {last}）")
+
+
 if __name__ == '__main__':
-    export()
+    parser = argparse.ArgumentParser(description='產生 market_data.json')
+    parser.add_argument('--force', action='store_true', help='輸入資料沒變也重算')
+    parser.add_argument('--backfill', action='store_true',
+                        help='重算全部歷史情緒指數到 sentiment_history 後結束')
+    args = parser.parse_args()
+    if args.backfill:
+        backfill_history()
+    else:
+        export(force=args.force)
@@ -8,7 +8,6 @@
 """
 
 import requests
-import json
 import time
 import os
 import sys
@@ -16,6 +15,8 @@ from datetime import datetime
 from io import StringIO
 import csv
 
+from json_export import write_json
+
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 DATA_DIR = os.path.join(BASE_DIR, 'data')
 OUT_PATH = os.path.join(DATA_DIR, 'new_high_stocks.json')
@@ -325,8 +326,7 @@ def main():
         'stocks': new_high_stocks,
     }
     
-    with open(OUT_PATH, 'w', encoding='utf-8') as f:
-        json.dump(output, f, ensure_ascii=False, indent=2)
+    write_json(OUT_PATH, output)
     
     elapsed = time.time() - start_time
     print(f'\n✓ 完成（耗時 {elapsed:.1f}s）')
@@ -10,6 +10,10 @@ TSWE 訊號診斷工具
 
 2. 跨日掃描：看過去 N 天每天的訊號數變化
    python3 pullback_signal_diagnose.py scan --days-back 14
+
+3. 批次條件矩陣：從 K 線庫一次算出區間內每檔 × 每天 × 每個條件的通過狀態，
+   存成 NPZ，並印出每天的漏斗（哪個條件刷掉最多候選股）
+   python3 pullback_signal_diagnose.py matrix --start 2026-04-01 --end 2026-04-30
 """
 
 import sys
@@ -19,6 +23,7 @@ from pathlib import Path
 from datetime import datetime, timedelta
 from concurrent.futures import ThreadPoolExecutor, as_completed
 
+import numpy as np
 import pandas as pd
 
 sys.path.insert(0, str(Path(__file__).resolve().parent))
@@ -26,6 +31,23 @@ from backtest_pullback_strategy import (
     fetch_yahoo, fetch_twii, add_indicators, detect_signals
 )
 from stock_universe import get_universe
+from kline_history_manager import KLINE_DIR, load_kline_csv
+
+DATA_DIR = Path(__file__).resolve().parent / "data"
+
+# 矩陣的條件軸（v1 沒有 cond2a / cond2b）
+MATRIX_CONDITIONS = {
+    "v1": ["cond1", "cond2", "cond3", "cond4", "cond5", "signal"],
+    "v2_F": ["cond1", "cond2a", "cond2b", "cond2", "cond3", "cond4", "cond5", "signal"],
+}
+# 漏斗順序：先過大盤與個股結構，再看進場時機
+FUNNEL_ORDER = ["cond5", "cond1", "cond4", "cond2", "cond3"]
+COND_LABELS = {
+    "cond1": "多頭結構", "cond2": "MACD 條件", "cond3": "KD 金叉",
+    "cond4": "240 日新高", "cond5": "大盤多頭",
+}
+# 指標暖機：240 日新高 + MA60 需要的歷史（日曆天）
+WARMUP_DAYS = 420
 
 logging.basicConfig(level=logging.INFO, format='%(message)s')
 log = logging.getLogger(__name__)
@@ -231,6 +253,155 @@ def cmd_scan(args):
     return 0
 
 
+def load_store_df(code: str, since=None):
+    """K 線庫 CSV → DataFrame（索引是日期），只留 since 之後的 K 棒；沒有資料回傳 None"""
+    klines = load_kline_csv(code)
+    if not klines:
+        return None
+    df = pd.DataFrame(klines)
+    df.index = pd.to_datetime(df.pop("date"))
+    if since is not None:
+        df = df[df.index >= since]
+    return df
+
+
+def condition_matrix(codes: list, dates, market_df, strategy: str = "v2_F"):
+    """
+    對每檔（K 線庫）算一次指標與條件，對齊到 dates。
+
+    Returns: (codes, passed, valid)
+      passed: bool[code, date, condition]，condition 依 MATRIX_CONDITIONS[strategy]
+      valid:  bool[code, date]，該檔當天有 K 棒
+      沒有 K 線庫資料或不足 80 根的股票不列入 codes（同 diagnose_one_stock）
+    """
+    conditions = MATRIX_CONDITIONS[strategy]
+    since = dates[0] - timedelta(days=WARMUP_DAYS)
+    kept, passed, valid = [], [], []
+    for code in codes:
+        df = load_store_df(code, since)
+        if df is None or len(df) < 80:
+            continue
+        df = add_indicators(df)
+        df = detect_signals(
+            df,
+            require_recent_high=True,
+            high_lookback=240,
+            high_within_days=30,
+            market_df=market_df,
+            strategy=strategy,
+        )
+        aligned = df[conditions].reindex(dates)
+        has_bar = aligned.notna().all(axis=1).to_numpy()
+        kept.append(code)
+        passed.append(aligned.fillna(False).to_numpy(dtype=bool))
+        valid.append(has_bar)
+
+    n = len(dates)
+    if not kept:
+        return [], np.zeros((0, n, len(conditions)), bool), np.zeros((0, n), bool)
+    return kept, np.stack(passed), np.stack(valid)
+
+
+def funnel_counts(passed, valid, conditions: list):
+    """
+    每天的漏斗與「唯一卡關」統計
+
+    Returns: (funnel, blockers)
+      funnel:   int[date, 1 + len(FUNNEL_ORDER)]，第 0 欄是有資料的檔數，之後逐條件累積通過數
+      blockers: int[date, len(FUNNEL_ORDER)]，其他條件都過、只差這一個的檔數
+    """
+    idx = [conditions.index(c) for c in FUNNEL_ORDER]
+    cond = passed[:, :, idx] & valid[:, :, None]          # code × date × 漏斗條件
+    cum = np.logical_and.accumulate(cond, axis=2)
+    funnel = np.concatenate([valid.sum(axis=0)[:, None], cum.sum(axis=0)], axis=1)
+
+    fail_count = (~cond & valid[:, :, None]).sum(axis=2)
+    blockers = ((~cond) & (fail_count == 1)[:, :, None] & valid[:, :, None]).sum(axis=0)
+    return funnel, blockers
+
+
+def cmd_matrix(args):
+    """模式 3：批次條件矩陣（K 線庫、不抓個股）"""
+    start = pd.to_datetime(args.start)
+    end = pd.to_datetime(args.end) if args.end else None
+
+    if args.all_store:
+        codes = sorted(p.stem for p in KLINE_DIR.glob("*.csv"))
+    else:
+        universe = get_universe(verbose=False)
+        universe = [u for u in universe if u["source_count"] >= args.min_sources]
+        if args.max_stocks > 0:
+            universe = universe[:args.max_stocks]
+        codes = [u["code"] for u in universe]
+    log.info(f"股票：{len(codes)} 檔（K 線庫）、策略：{args.strategy}")
+
+    log.info("抓加權指數...")
+    span = max((pd.Timestamp.now().normalize() - start).days, 0)
+    market_df = fetch_twii(span + 180)
+    in_range = market_df.index >= start
+    if end is not None:
+        in_range &= market_df.index <= end
+    dates = market_df.index[in_range]
+    if len(dates) == 0:
+        log.error("區間內沒有交易日資料")
+        return 1
+    log.info(f"日期範圍：{dates[0].date()} ~ {dates[-1].date()}（{len(dates)} 個交易日）")
+
+    conditions = MATRIX_CONDITIONS[args.strategy]
+    codes, passed, valid = condition_matrix(codes, dates, market_df, args.strategy)
+    if not codes:
+        log.error("K 線庫沒有可分析的資料")
+        return 1
+    log.info(f"K 線庫有資料：{len(codes)} 檔")
+
+    funnel, blockers = funnel_counts(passed, valid, conditions)
+    date_strs = np.array([d.strftime("%Y-%m-%d") for d in dates])
+
+    out = Path(args.out) if args.out else (
+        DATA_DIR / f"pullback_diagnose_{date_strs[0]}_{date_strs[-1]}.npz")
+    np.savez_compressed(
+        out,
+        codes=np.array(codes),
+        dates=date_strs,
+        conditions=np.array(conditions),
+        passed=passed,
+        valid=valid,
+        funnel_stages=np.array(["valid"] + FUNNEL_ORDER),
+        funnel=funnel,
+        blockers=blockers,
+    )
+    log.info(f"✓ 條件矩陣寫入：{out}（{passed.shape[0]} 檔 × {passed.shape[1]} 天 × "
+             f"{passed.shape[2]} 條件）")
+
+    # 每日漏斗
+    print()
+    print("=" * 78)
+    print("📊 每日漏斗（逐條件累積通過數）")
+    print("=" * 78)
+    header = "".join(f"{'→' + c:>10}" for c in FUNNEL_ORDER)
+    print(f"{'日期':<12}{'有資料':>8}{header}")
+    print("-" * 78)
+    for i, date_str in enumerate(date_strs):
+        print(f"{date_str:<12}{funnel[i][0]:>8}" + "".join(f"{v:>10}" for v in funnel[i][1:]))
+
+    # 區間彙總：哪個條件刷掉最多
+    fail_total = [(~passed[:, :, conditions.index(c)] & valid).sum() for c in FUNNEL_ORDER]
+    sole_total = blockers.sum(axis=0)
+    stock_days = int(valid.sum())
+    print()
+    print("=" * 78)
+    print(f"🚧 區間彙總（{stock_days} 檔日）")
+    print("=" * 78)
+    print(f"{'條件':<20}{'未通過':>10}{'未通過率':>10}{'唯一卡關':>10}")
+    print("-" * 50)
+    for c, fails, sole in sorted(zip(FUNNEL_ORDER, fail_total, sole_total), key=lambda t: -t[1]):
+        label = f"{c} ({COND_LABELS[c]})"
+        print(f"{label:<20}{fails:>10}{fails / stock_days * 100:>9.1f}%{sole:>10}")
+    print(f"\n★ 訊號：{int(funnel[:, -1].sum())} 檔日")
+
+    return 0
+
+
 def main():
     parser = argparse.ArgumentParser()
     sub = parser.add_subparsers(dest="cmd", required=True)
@@ -248,12 +419,24 @@ def main():
     p2.add_argument("--min-sources", type=int, default=2)
     p2.add_argument("--max-stocks", type=int, default=80)
 
+    p3 = sub.add_parser("matrix", help="批次條件矩陣（K 線庫）")
+    p3.add_argument("--start", required=True, help="YYYY-MM-DD")
+    p3.add_argument("--end", help="YYYY-MM-DD（預設到最後可用資料）")
+    p3.add_argument("--strategy", choices=["v1", "v2_F"], default="v2_F")
+    p3.add_argument("--min-sources", type=int, default=2)
+    p3.add_argument("--max-stocks", type=int, default=80)
+    p3.add_argument("--all-store", action="store_true",
+                    help="不看 universe、K 線庫有的股票全部算")
+    p3.add_argument("--out", help="NPZ 輸出路徑（預設 data/pullback_diagnose_{start}_{end}.npz）")
+
     args = parser.parse_args()
 
     if args.cmd == "decompose":
         return cmd_decompose(args)
     elif args.cmd == "scan":
         return cmd_scan(args)
+    elif args.cmd == "matrix":
+        return cmd_matrix(args)
 
 
 if __name__ == "__main__":
@@ -29,6 +29,7 @@ from datetime import datetime, timedelta
 from concurrent.futures import ThreadPoolExecutor, as_completed
 from collections import defaultdict
 
+import numpy as np
 import pandas as pd
 
 sys.path.insert(0, str(Path(__file__).resolve().parent))
@@ -41,9 +42,16 @@ logging.basicConfig(level=logging.INFO, format='%(message)s')
 log = logging.getLogger(__name__)
 
 
-def find_signals_for_stock(stock: dict, market_df, start_date: str, end_date: str,
-                           strategy: str = "v2_F"):
-    """找出單檔股票在 [start, end] 範圍內所有觸發訊號的日期"""
+HOLD_DAYS = (5, 10, 15, 20)
+
+
+def review_stock(stock: dict, market_df, start_date: str, end_date: str,
+                 strategy: str = "v2_F"):
+    """
+    單檔股票：抓一次 K 線 → 算指標 → 找 [start, end] 內的訊號 → 同一份 K 線算報酬
+
+    Returns: 訊號 list（有下一根 K 線的已含進場與各持有期報酬），抓不到資料時為空
+    """
     code = stock["code"]
     name = stock.get("name", "")
     try:
@@ -59,55 +67,84 @@ def find_signals_for_stock(stock: dict, market_df, start_date: str, end_date: st
             market_df=market_df,
             strategy=strategy,
         )
-
-        start_ts = pd.to_datetime(start_date)
-        end_ts = pd.to_datetime(end_date)
-        in_range = df[(df.index >= start_ts) & (df.index <= end_ts)]
-
-        signals = []
-        for idx, row in in_range[in_range["signal"]].iterrows():
-            signals.append({
-                "code": code,
-                "name": name,
-                "signal_date": idx.strftime("%Y-%m-%d"),
-                "close_at_signal": float(row["close"]),
-                "osc": float(row["osc"]),
-                "k": float(row["k"]),
-            })
-        return signals
-    except Exception as e:
+    except Exception:
         return []
 
+    start_ts = pd.to_datetime(start_date)
+    end_ts = pd.to_datetime(end_date)
+    in_range = (df.index >= start_ts) & (df.index <= end_ts) & df["signal"].to_numpy(dtype=bool)
+    positions = np.flatnonzero(in_range)
+
+    signals = []
+    for pos, ret_data in zip(positions, calculate_returns_batch(df, positions)):
+        row = df.iloc[pos]
+        signals.append({
+            "code": code,
+            "name": name,
+            "signal_date": df.index[pos].strftime("%Y-%m-%d"),
+            "close_at_signal": float(row["close"]),
+            "osc": float(row["osc"]),
+            "k": float(row["k"]),
+            **(ret_data or {}),
+        })
+    return signals
+
+
+def calculate_returns_batch(df: pd.DataFrame, positions, hold_days=HOLD_DAYS):
+    """
+    一次算同一檔所有訊號在不同持有期的報酬
+
+    positions: 訊號在 df 中的列位置；隔日開盤進場，持有 n 天後以收盤價計
+    Returns: 與 positions 對應的 list，訊號後沒有下一根 K 線時為 None
+    """
+    positions = np.asarray(positions, dtype=int)
+    n = len(df)
+    if not len(positions) or n == 0:
+        return [None] * len(positions)
+
+    opens = df["open"].to_numpy(dtype=float)
+    closes = df["close"].to_numpy(dtype=float)
+    dates = df.index.strftime("%Y-%m-%d").to_numpy()
+
+    entry = positions + 1
+    has_entry = entry < n
+    entry_c = np.minimum(entry, n - 1)
+    entry_price = opens[entry_c]
+    latest_price = closes[-1]
+    latest_ret = (latest_price - entry_price) / entry_price * 100
+
+    exits = {}
+    for days in hold_days:
+        exit_idx = entry + days
+        valid = exit_idx < n
+        exit_c = np.minimum(exit_idx, n - 1)
+        exits[days] = (valid, (closes[exit_c] - entry_price) / entry_price * 100, dates[exit_c])
+
+    results = []
+    for i in range(len(positions)):
+        if not has_entry[i]:
+            results.append(None)
+            continue
+        result = {
+            "entry_date": dates[entry[i]],
+            "entry_price": float(entry_price[i]),
+            "latest_close": float(latest_price),
+            "latest_ret": float(latest_ret[i]),
+            "days_elapsed": int(n - entry[i]),
+        }
+        for days, (valid, rets, exit_dates) in exits.items():
+            result[f"ret_{days}d"] = ({"ret": float(rets[i]), "exit_date": exit_dates[i]}
+                                      if valid[i] else None)
+        results.append(result)
+    return results
 
-def calculate_returns(signal: dict, full_df: pd.DataFrame, today: pd.Timestamp):
-    """計算單筆訊號在不同持有期的報酬"""
+
+def calculate_returns(signal: dict, full_df: pd.DataFrame, today: pd.Timestamp = None):
+    """計算單筆訊號在不同持有期的報酬（calculate_returns_batch 的單筆版）"""
     signal_ts = pd.to_datetime(signal["signal_date"])
-    future = full_df[full_df.index > signal_ts]
-    if len(future) < 1:
-        return None
-
-    entry_price = future.iloc[0]["open"]
-    entry_date = future.iloc[0].name
-    latest_price = future.iloc[-1]["close"]
-
-    def get_ret_at(n_days):
-        if len(future) > n_days:
-            exit_price = future.iloc[n_days]["close"]
-            ret = (exit_price - entry_price) / entry_price * 100
-            return {"ret": ret, "exit_date": future.iloc[n_days].name.strftime("%Y-%m-%d")}
-        return None
-
-    return {
-        "entry_date": entry_date.strftime("%Y-%m-%d"),
-        "entry_price": entry_price,
-        "latest_close": latest_price,
-        "latest_ret": (latest_price - entry_price) / entry_price * 100,
-        "days_elapsed": len(future),
-        "ret_5d": get_ret_at(5),
-        "ret_10d": get_ret_at(10),
-        "ret_15d": get_ret_at(15),
-        "ret_20d": get_ret_at(20),
-    }
+    # 訊號日之後的第一根 = 進場日；以「訊號日前最後一根」當訊號位置
+    pos = int(full_df.index.searchsorted(signal_ts, side="right")) - 1
+    return calculate_returns_batch(full_df, [pos])[0]
 
 
 def main():
@@ -145,17 +182,16 @@ def main():
     log.info("抓加權指數...")
     market_df = fetch_twii(720)
 
-    # 3. 並行掃描所有股票、找該區間所有訊號
-    log.info("掃描中（找訊號）...")
+    # 3. 並行掃描所有股票：每檔抓一次 K 線，找訊號 + 算報酬都在同一個 worker
+    log.info("掃描中（找訊號 + 計算報酬）...")
     all_signals = []
     with ThreadPoolExecutor(max_workers=4) as ex:
         futures = {
-            ex.submit(find_signals_for_stock, u, market_df, args.start, args.end, args.strategy): u
+            ex.submit(review_stock, u, market_df, args.start, args.end, args.strategy): u
             for u in universe
         }
         for fut in as_completed(futures):
-            signals = fut.result()
-            all_signals.extend(signals)
+            all_signals.extend(fut.result())
 
     if not all_signals:
         log.warning(f"區間內無任何訊號")
@@ -165,29 +201,8 @@ def main():
     all_signals.sort(key=lambda s: (s["signal_date"], s["code"]))
     log.info(f"找到 {len(all_signals)} 個訊號")
 
-    # 4. 對每筆訊號算報酬
-    log.info("計算報酬中...")
-    today_ts = pd.Timestamp.today().normalize()
-
-    # 為避免重抓資料，cache 每檔股票的完整 K 線
-    stock_cache = {}
-
-    def get_full_df(code):
-        if code not in stock_cache:
-            try:
-                stock_cache[code] = fetch_yahoo(code, 720)
-            except Exception:
-                stock_cache[code] = None
-        return stock_cache[code]
-
-    enriched = []
-    for sig in all_signals:
-        full_df = get_full_df(sig["code"])
-        if full_df is None or len(full_df) == 0:
-            continue
-        ret_data = calculate_returns(sig, full_df, today_ts)
-        if ret_data:
-            enriched.append({**sig, **ret_data})
+    # 4. 還沒有進場日（訊號在最後一根 K 線）的不列入報酬統計
+    enriched = [s for s in all_signals if "entry_date" in s]
 
     # 5. 印明細表
     if args.detail or len(enriched) <= 30:
@@ -17,6 +17,7 @@ TSWE 多頭回檔買點訊號掃描器
   python3 pullback_signal_scanner.py            # 自動跑、有訊號才通知
   python3 pullback_signal_scanner.py --dry-run  # 不寫 Notion、不發 Discord
   python3 pullback_signal_scanner.py --force-notify  # 強制發通知（即使 0 訊號）
+  python3 pullback_signal_scanner.py --replay-from 2026-04-01  # 重播區間內每天的訊號
 """
 
 import os
@@ -26,6 +27,8 @@ import argparse
 import logging
 from datetime import datetime
 from pathlib import Path
+
+import numpy as np
 from concurrent.futures import ThreadPoolExecutor, as_completed
 
 # 載入 .env
@@ -41,6 +44,9 @@ from backtest_pullback_strategy import (
     fetch_yahoo, fetch_twii, add_indicators, detect_signals
 )
 from stock_universe import get_universe
+from indicator_state import update_state, state_frame
+from kline_history_manager import ensure_kline_data, get_csv_path
+from json_export import write_json
 
 # 通知模組（同 research_report 用法）
 try:
@@ -114,10 +120,13 @@ def save_notified_log(log_data: dict):
         json.dump(log_data, f, ensure_ascii=False, indent=2)
 
 
-def annotate_day_count(signals: list, today_str: str, prune_days: int = 7) -> tuple[list, list]:
+def annotate_day_count(signals: list, today_str: str, prune_days: int = 7,
+                       log_data: dict = None) -> tuple[list, list]:
     """
     對訊號清單加上 day_count 欄位、並更新 notified log。
 
+    log_data: 傳入時直接在這個 dict 上累積、不讀寫 NOTIFIED_LOG_FILE（重播模式用）
+
     回傳：(updated_signals, new_signals)
       updated_signals: 全部訊號（含 day_count）、給 dashboard 顯示
       new_signals: 只有 D1 的訊號、給 Discord 通知（去重）
@@ -129,7 +138,9 @@ def annotate_day_count(signals: list, today_str: str, prune_days: int = 7) -> tu
       - 超過 prune_days 沒看到的紀錄：清掉
     """
     today_dt = pd.to_datetime(today_str).date()
-    log_data = load_notified_log()
+    persist = log_data is None
+    if persist:
+        log_data = load_notified_log()
     new_signals = []  # D1
 
     today_codes = set()
@@ -176,7 +187,8 @@ def annotate_day_count(signals: list, today_str: str, prune_days: int = 7) -> tu
         except Exception:
             pass
 
-    save_notified_log(log_data)
+    if persist:
+        save_notified_log(log_data)
 
     log.info(f"day_count: D1 (新) = {len(new_signals)}、"
              f"D2+ (已通知過) = {len(signals) - len(new_signals)}、"
@@ -188,6 +200,22 @@ def annotate_day_count(signals: list, today_str: str, prune_days: int = 7) -> tu
 # ═══════════════════════════════════════════════════════════
 # Part 1: 掃描每檔股票
 # ═══════════════════════════════════════════════════════════
+def load_store_frame(code: str):
+    """
+    K 線庫已有這檔時：補到當日、推進增量指標，回傳最近 TAIL_BARS 根的指標 DataFrame
+    （欄位同 add_indicators 輸出）。K 線庫沒有或補資料失敗回傳 None。
+    """
+    if not get_csv_path(code).exists():
+        return None
+    result = ensure_kline_data(code, years=2, verbose=False, max_stale_days=0)
+    if result["status"] == "failed":
+        return None
+    state = update_state(code)
+    if state is None:
+        return None
+    return state_frame(state)
+
+
 def scan_one_stock(stock: dict, market_df, days: int = 365,
                    strategy: str = "v2_F",
                    as_of: str = None) -> dict | None:
@@ -198,13 +226,17 @@ def scan_one_stock(stock: dict, market_df, days: int = 365,
     as_of: 'YYYY-MM-DD' 字串。None 代表用最後一天的資料。
     """
     code = stock["code"]
-    name = stock.get("name", "")
     try:
-        df = fetch_yahoo(code, days)
-        if len(df) < 80:
+        # 只看最新一天且 K 線庫有這檔 → 用增量指標狀態，不重抓、不重算
+        df = load_store_frame(code) if not as_of else None
+        if df is None:
+            df = fetch_yahoo(code, days)
+            if len(df) < 80:
+                return None
+            df = add_indicators(df)
+        elif len(df) < 80:
             return None
 
-        df = add_indicators(df)
         df = detect_signals(
             df,
             require_recent_high=True,
@@ -225,35 +257,74 @@ def scan_one_stock(stock: dict, market_df, days: int = 365,
         if not df["signal"].iloc[-1]:
             return None
 
-        # 抓最後一天的細節做訊號描述
-        last = df.iloc[-1]
-
-        # 計算 5 日漲跌（如果可能）
-        change_5d_pct = None
-        if len(df) >= 6:
-            prev_close = df["close"].iloc[-6]
-            change_5d_pct = round(float((last["close"] - prev_close) / prev_close * 100), 2)
-
-        return {
-            "code": code,
-            "name": name,
-            "close": round(float(last["close"]), 2),
-            "ma20": round(float(last["ma20"]), 2),
-            "ma60": round(float(last["ma60"]), 2),
-            "osc": round(float(last["osc"]), 3),
-            "k": round(float(last["k"]), 1),
-            "d": round(float(last["d"]), 1),
-            "change_5d_pct": change_5d_pct,
-            "above_ma60": bool(last["close"] > last["ma60"]),
-            "sources": stock.get("sources", []),
-            "source_count": stock.get("source_count", 0),
-            "signal_date": last.name.strftime("%Y-%m-%d"),
-        }
+        return signal_record(stock, df, len(df) - 1)
     except Exception as e:
         log.warning(f"  {code} 掃描失敗：{e}")
         return None
 
 
+def signal_record(stock: dict, df, pos: int) -> dict:
+    """把 df 第 pos 根（觸發訊號的那天）整理成訊號 dict"""
+    last = df.iloc[pos]
+
+    # 計算 5 日漲跌（如果可能）
+    change_5d_pct = None
+    if pos >= 5:
+        prev_close = df["close"].iloc[pos - 5]
+        change_5d_pct = round(float((last["close"] - prev_close) / prev_close * 100), 2)
+
+    return {
+        "code": stock["code"],
+        "name": stock.get("name", ""),
+        "close": round(float(last["close"]), 2),
+        "ma20": round(float(last["ma20"]), 2),
+        "ma60": round(float(last["ma60"]), 2),
+        "osc": round(float(last["osc"]), 3),
+        "k": round(float(last["k"]), 1),
+        "d": round(float(last["d"]), 1),
+        "change_5d_pct": change_5d_pct,
+        "above_ma60": bool(last["close"] > last["ma60"]),
+        "sources": stock.get("sources", []),
+        "source_count": stock.get("source_count", 0),
+        "signal_date": last.name.strftime("%Y-%m-%d"),
+    }
+
+
+def replay_one_stock(stock: dict, market_df, start, end=None, days: int = 365,
+                     strategy: str = "v2_F") -> dict:
+    """
+    重播單檔股票在 [start, end] 區間每一天的訊號狀態。
+
+    detect_signals 是因果的（每根只看自己與之前的資料），所以整段算一次，
+    第 i 根的 signal 就等於「截到第 i 天再跑 scan_one_stock(as_of=...)」的結果。
+    回傳：{date_str: 訊號 dict}，只含觸發的日子；失敗回傳 {}
+    """
+    code = stock["code"]
+    try:
+        df = fetch_yahoo(code, days)
+        if len(df) < 80:
+            return {}
+        df = add_indicators(df)
+        df = detect_signals(
+            df,
+            require_recent_high=True,
+            high_lookback=240,
+            high_within_days=30,
+            market_df=market_df,
+            strategy=strategy,
+        )
+
+        mask = df["signal"].to_numpy(dtype=bool) & (df.index >= start)
+        if end is not None:
+            mask &= df.index <= end
+        mask[:79] = False   # 同 as_of 模式：截斷後不足 80 根不算
+        return {df.index[pos].strftime("%Y-%m-%d"): signal_record(stock, df, pos)
+                for pos in np.flatnonzero(mask)}
+    except Exception as e:
+        log.warning(f"  {code} 重播失敗：{e}")
+        return {}
+
+
 # ═══════════════════════════════════════════════════════════
 # Part 2: Notion 寫入（重用研究報告的 daily 頁邏輯）
 # ═══════════════════════════════════════════════════════════
@@ -520,6 +591,91 @@ def send_signal_notification(signals: list, scan_meta: dict, notion_url: str):
 # ═══════════════════════════════════════════════════════════
 # Part 5: 主流程
 # ═══════════════════════════════════════════════════════════
+def save_latest(latest_data: dict) -> bool:
+    """寫 latest.json（經共用寫檔器記錄到 export_manifest，dashboard 的雷達面板會收到推播）"""
+    return write_json(LATEST_FILE, latest_data)
+
+
+def run_replay(args, universe: list) -> int:
+    """
+    重播模式：每檔只抓一次、算一次指標，產出區間內每個交易日的訊號日曆。
+
+    - 每天寫 pullback_signal_{date}.json（格式同 latest.json）
+    - 日曆總表寫 pullback_signal_calendar.json：{date: [code, ...]}
+    - day_count 依日期順序餵給 annotate_day_count，用區間內自己的紀錄累積
+      （從 --replay-from 開始算），不動 notified log、latest.json、Notion、Discord
+    """
+    start = pd.to_datetime(args.replay_from)
+    end = pd.to_datetime(args.replay_to) if args.replay_to else None
+    span = max((pd.Timestamp.now().normalize() - start).days, 0)
+
+    # 資料長度 = 原本的 lookback + 重播區間，讓區間第一天也有完整歷史
+    log.info("抓加權指數...")
+    market_df = fetch_twii(180 + span)
+    in_range = market_df.index >= start
+    if end is not None:
+        in_range &= market_df.index <= end
+    dates = market_df.index[in_range]
+    if len(dates) == 0:
+        log.error(f"--replay-from {args.replay_from} 區間內沒有加權指數資料、無法重播")
+        return 1
+    log.info(f"重播 {dates[0].date()} ~ {dates[-1].date()}，共 {len(dates)} 個交易日"
+             f"（策略：{args.strategy}）")
+
+    order = {u["code"]: i for i, u in enumerate(universe)}
+    calendar = {d.strftime("%Y-%m-%d"): [] for d in dates}
+    with ThreadPoolExecutor(max_workers=args.workers) as ex:
+        futures = [
+            ex.submit(replay_one_stock, u, market_df, start, end, 365 + span, args.strategy)
+            for u in universe
+        ]
+        for fut in as_completed(futures):
+            for date_str, sig in fut.result().items():
+                if date_str in calendar:
+                    calendar[date_str].append(sig)
+
+    notified = {}
+    for d in dates:
+        today_str = d.strftime("%Y-%m-%d")
+        signals = sorted(calendar[today_str], key=lambda s: order[s["code"]])
+        signals, new_signals = annotate_day_count(signals, today_str, log_data=notified)
+        calendar[today_str] = signals
+
+        row = market_df.loc[d]
+        codes = " ".join(f"{s['code']}(D{s['day_count']})" for s in signals) or "—"
+        log.info(f"  {today_str} {len(signals):>3} 個訊號（新 {len(new_signals)}）：{codes}")
+        if args.dry_run:
+            continue
+
+        write_json(DATA_DIR / f"pullback_signal_{today_str}.json", {
+            "date": today_str,
+            "strategy": args.strategy,
+            "scanned_count": len(universe),
+            "signal_count": len(signals),
+            "signals": signals,
+            "market_bullish": bool(row["bullish"]),
+            "market_close": float(row["close"]),
+            "market_ma60": float(row["ma60"]),
+            "notion_url": "",
+            "updated_at": datetime.now().isoformat(timespec='seconds'),
+        }, manifest=False)
+
+    if args.dry_run:
+        log.info("[dry-run] 不寫檔")
+        return 0
+
+    write_json(DATA_DIR / "pullback_signal_calendar.json", {
+        "start": dates[0].strftime("%Y-%m-%d"),
+        "end": dates[-1].strftime("%Y-%m-%d"),
+        "strategy": args.strategy,
+        "scanned_count": len(universe),
+        "calendar": {date_str: [s["code"] for s in sigs] for date_str, sigs in calendar.items()},
+        "updated_at": datetime.now().isoformat(timespec='seconds'),
+    }, manifest=False)
+    log.info(f"✓ 重播完成：寫入 {len(dates)} 個 pullback_signal_{{date}}.json + 日曆總表")
+    return 0
+
+
 def main():
     parser = argparse.ArgumentParser()
     parser.add_argument("--dry-run", action="store_true",
@@ -537,6 +693,11 @@ def main():
                              "注意：用此參數時，latest.json 會被覆寫，要用 --no-overwrite-latest 避免。")
     parser.add_argument("--no-overwrite-latest", action="store_true",
                         help="不覆寫 latest.json（搭配 --date 跑歷史資料時用）")
+    parser.add_argument("--replay-from", default=None,
+                        help="重播模式：從指定日期（YYYY-MM-DD）起每個交易日各寫一份 "
+                             "pullback_signal_{date}.json，每檔只抓一次資料")
+    parser.add_argument("--replay-to", default=None,
+                        help="重播結束日（YYYY-MM-DD），預設到最後可用資料")
     parser.add_argument("--workers", type=int, default=4)
     args = parser.parse_args()
 
@@ -552,6 +713,9 @@ def main():
         log.warning("無股票可掃")
         return 0
 
+    if args.replay_from:
+        return run_replay(args, universe)
+
     # 2. 抓加權指數
     log.info("抓加權指數...")
     market_df_full = fetch_twii(180)  # 180 天足夠算 MA60
@@ -671,12 +835,10 @@ def main():
         log.info(f"--no-overwrite-latest: 不覆寫 {LATEST_FILE.name}（dashboard 仍顯示原資料）")
         # 改寫到帶日期的檔案
         history_file = DATA_DIR / f"pullback_signal_{today_str}.json"
-        with open(history_file, 'w', encoding='utf-8') as f:
-            json.dump(latest_data, f, ensure_ascii=False, indent=2)
+        write_json(history_file, latest_data, manifest=False)
         log.info(f"✓ 歷史資料寫入：{history_file.name}")
     else:
-        with open(LATEST_FILE, 'w', encoding='utf-8') as f:
-            json.dump(latest_data, f, ensure_ascii=False, indent=2)
+        save_latest(latest_data)
 
     with open(LOG_FILE, 'a', encoding='utf-8') as f:
         f.write(json.dumps({
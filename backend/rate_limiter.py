@@ -0,0 +1,54 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+每個 host 各自限速的請求節流器
+=================================
+多執行緒併發抓資料時，用來取代各腳本裡的 time.sleep(0.3) / sleep(0.5)：
+同一個 host 的請求之間至少隔 interval 秒，不同 host 互不影響。
+
+使用方式:
+    from rate_limiter import HostRateLimiter
+
+    limiter = HostRateLimiter({'www.twse.com.tw': 0.5}, default_interval=0.1)
+    limiter.wait(url)              # 輪到這個 host 才返回
+    resp = limiter.get(url, headers=HEADERS, timeout=15)   # wait + requests.get
+"""
+import threading
+import time
+from urllib.parse import urlparse
+
+
+class HostRateLimiter:
+    """每個 host 的最小請求間隔（執行緒安全，等待時不佔鎖）"""
+
+    def __init__(self, intervals=None, default_interval=0.0):
+        self.intervals = dict(intervals or {})
+        self.default_interval = default_interval
+        self._next_slot = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def host_of(url_or_host):
+        """URL 或 host 字串 → host"""
+        if '://' in url_or_host:
+            return urlparse(url_or_host).netloc
+        return url_or_host
+
+    def wait(self, url_or_host):
+        """預約這個 host 的下一個時段並睡到那時候"""
+        host = self.host_of(url_or_host)
+        interval = self.intervals.get(host, self.default_interval)
+        with self._lock:
+            now = time.monotonic()
+            slot = max(now, self._next_slot.get(host, now))
+            self._next_slot[host] = slot + interval
+        delay = slot - now
+        if delay > 0:
+            time.sleep(delay)
+
+    def get(self, url, session=None, **kwargs):
+        """限速後發 GET（可傳入 requests.Session）"""
+        import requests
+
+        self.wait(url)
+        return (session or requests).get(url, **kwargs)
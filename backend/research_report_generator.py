@@ -32,8 +32,12 @@ from pathlib import Path
 from typing import Optional
 from concurrent.futures import ThreadPoolExecutor, as_completed
 
+import numpy as np
 import requests
 
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+from indicators import as_array, sma, volume_ratio, pct_change
+
 # 載入 .env (和 backend/ 其他模組相同慣例)
 try:
     from dotenv import load_dotenv
@@ -166,32 +170,27 @@ def compute_technicals(chart: dict) -> dict:
     try:
         result = chart["chart"]["result"][0]
         quote = result["indicators"]["quote"][0]
-        closes = [c for c in quote["close"] if c is not None]
-        volumes = [v for v in quote["volume"] if v is not None]
+        closes = as_array([c for c in quote["close"] if c is not None])
+        volumes = as_array([v for v in quote["volume"] if v is not None])
 
         if len(closes) < 20:
             return {}
 
-        latest = closes[-1]
-        ma5 = sum(closes[-5:]) / 5
-        ma20 = sum(closes[-20:]) / 20
-        ma60 = sum(closes[-60:]) / 60 if len(closes) >= 60 else None
+        def _last(arr):
+            v = float(arr[-1]) if len(arr) else float("nan")
+            return None if np.isnan(v) else v
 
-        # 量比（當日量 / 20 日均量）
-        vol_ratio = None
-        if len(volumes) >= 20:
-            ma20_vol = sum(volumes[-20:]) / 20
-            vol_ratio = volumes[-1] / ma20_vol if ma20_vol > 0 else None
+        latest = float(closes[-1])
+        ma5 = _last(sma(closes, 5))
+        ma20 = _last(sma(closes, 20))
+        ma60 = _last(sma(closes, 60))
 
-        # 近 5 日漲跌幅
-        change_5d = None
-        if len(closes) >= 6:
-            change_5d = (closes[-1] - closes[-6]) / closes[-6] * 100
+        # 量比（當日量 / 20 日均量）
+        vol_ratio = _last(volume_ratio(volumes, 1, 20))
 
-        # 近 20 日漲跌幅
-        change_20d = None
-        if len(closes) >= 21:
-            change_20d = (closes[-1] - closes[-21]) / closes[-21] * 100
+        # 近 5 日 / 20 日漲跌幅
+        change_5d = _last(pct_change(closes, 5))
+        change_20d = _last(pct_change(closes, 20))
 
         return {
             "close": round(latest, 2),
@@ -202,8 +201,8 @@ def compute_technicals(chart: dict) -> dict:
             "above_ma5": latest > ma5,
             "above_ma20": latest > ma20,
             "above_ma60": latest > ma60 if ma60 else None,
-            "high_60d": round(max(closes), 2),
-            "low_60d": round(min(closes), 2),
+            "high_60d": round(float(closes.max()), 2),
+            "low_60d": round(float(closes.min()), 2),
             "change_5d_pct": round(change_5d, 2) if change_5d is not None else None,
             "change_20d_pct": round(change_20d, 2) if change_20d is not None else None,
         }
@@ -409,6 +409,14 @@ try:
 except Exception as e:
     print(f"  ✗ 錯誤: {e}")
 
+# 儀表板合併資料包 (/api/dashboard 用，須在所有匯出之後)
+print("\n[補充] 儀表板合併資料包...")
+try:
+    from dashboard_bundle import build_bundle
+    print("  ✓ 已更新" if build_bundle() else "  ✓ 內容未變")
+except Exception as e:
+    print(f"  ✗ 錯誤: {e}")
+
 print(f"\n{'='*60}")
 print(f"✓ 所有數據更新完成!")
 print(f"執行時間: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
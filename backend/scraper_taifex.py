@@ -1,10 +1,30 @@
 """
 期交所微台指散戶多空比數據爬蟲 - 終極版
 直接使用欄位索引，不轉換成數字陣列
+
+回補歷史: get_retail_ratio_range() 用期交所的 CSV 下載 (futContractsDateDown)
+一次拿一段日期、所有商品的三大法人部位，不必每天每個商品各抓一次 HTML
 """
+import csv
+import io
 import requests
-from bs4 import BeautifulSoup
-from datetime import datetime
+from datetime import datetime, timedelta
+
+from html_tables import extract_tables
+
+HTML_URL = "https://www.taifex.com.tw/cht/3/futContractsDate"
+CSV_URL = "https://www.taifex.com.tw/cht/3/futContractsDateDown"
+
+# CSV 下載每次查詢的天數上限 (期交所限制查詢區間, 保守切成一個月一段)
+BACKFILL_CHUNK_DAYS = 31
+
+# CSV 身份別 → 內部 key
+IDENTITY_MAP = {
+    '自營商': 'dealers',
+    '投信': 'trusts',
+    '外資': 'foreign',
+    '外資及陸資': 'foreign',
+}
 
 class TAIFEXScraper:
     def __init__(self):
@@ -41,6 +61,12 @@ class TAIFEXScraper:
         if not positions:
             return None
         
+        return self._build_retail_result(date, commodity_id, positions, debug)
+    
+    def _build_retail_result(self, date, commodity_id, positions, debug=False):
+        """由三大法人部位推估散戶多空比"""
+        product_name = self.product_map.get(commodity_id, '微型臺指')
+        
         inst_long = (positions['dealers']['long'] + 
                     positions['trusts']['long'] + 
                     positions['foreign']['long'])
@@ -93,15 +119,13 @@ class TAIFEXScraper:
             date = datetime.now().strftime('%Y/%m/%d')
         
         product_name = self.product_map.get(commodity_id, '微型臺指')
-        url = "https://www.taifex.com.tw/cht/3/futContractsDate"
         params = {'queryStartDate': date, 'queryEndDate': date}
         
         try:
-            resp = requests.get(url, params=params, headers=self.headers, timeout=30)
+            resp = requests.get(HTML_URL, params=params, headers=self.headers, timeout=30)
             resp.raise_for_status()
             
-            soup = BeautifulSoup(resp.text, 'html.parser')
-            tables = soup.find_all('table')
+            tables = extract_tables(resp.text)
             
             if debug:
                 print(f"\n[三大法人部位] 找到 {len(tables)} 個表格")
@@ -112,13 +136,11 @@ class TAIFEXScraper:
                 'foreign': {'long': 0, 'short': 0, 'net': 0},
             }
             
-            for table in tables:
-                rows = table.find_all('tr')
-                
+            for rows in tables:
                 # 找微型臺指
                 mxf_idx = -1
-                for idx, row in enumerate(rows):
-                    if product_name in row.get_text():
+                for idx, cells in enumerate(rows):
+                    if product_name in ''.join(cells):
                         mxf_idx = idx
                         break
                 
@@ -131,15 +153,14 @@ class TAIFEXScraper:
                     if row_idx >= len(rows):
                         break
                     
-                    row = rows[row_idx]
-                    cells = row.find_all(['td', 'th'])
+                    cells = rows[row_idx]
                     
                     if offset == 0:
                         # 自營商: 15欄
                         identity = 'dealers'
                         if len(cells) >= 12:
-                            oi_long = self._to_int(cells[9].get_text())
-                            oi_short = self._to_int(cells[11].get_text())
+                            oi_long = self._to_int(cells[9])
+                            oi_short = self._to_int(cells[11])
                         else:
                             continue
                     else:
@@ -148,10 +169,10 @@ class TAIFEXScraper:
                             continue
                         
                         # 直接用欄位 [7] 和 [9]
-                        oi_long = self._to_int(cells[7].get_text())
-                        oi_short = self._to_int(cells[9].get_text())
+                        oi_long = self._to_int(cells[7])
+                        oi_short = self._to_int(cells[9])
                         
-                        row_text = row.get_text()
+                        row_text = ''.join(cells)
                         if '投信' in row_text:
                             identity = 'trusts'
                         elif '外資' in row_text or '外陸資' in row_text:
@@ -180,6 +201,87 @@ class TAIFEXScraper:
                 traceback.print_exc()
             return None
 
+    # ============================================================
+    # 區間回補 (CSV 下載)
+    # ============================================================
+    def parse_positions_csv(self, text, commodity_ids=('MXF', 'TX')):
+        """
+        解析 futContractsDateDown 的 CSV
+        
+        欄位: 日期, 商品名稱, 身份別, 多方交易口數, 多方交易金額, 空方交易口數, 空方交易金額,
+              多空交易淨口數, 多空交易淨額, 多方未平倉口數(9), 多方未平倉金額, 空方未平倉口數(11), ...
+        
+        Returns: {'YYYY/MM/DD': {commodity_id: positions}}，positions 格式同 get_institutional_positions
+        """
+        names = {cid: self.product_map[cid] for cid in commodity_ids}
+        result = {}
+        
+        for row in csv.reader(io.StringIO(text)):
+            if len(row) < 12:
+                continue
+            product = row[1].strip()
+            identity = IDENTITY_MAP.get(row[2].strip())
+            if identity is None:
+                continue  # 表頭或其他身份別
+            cid = next((c for c, name in names.items() if name in product), None)
+            if cid is None:
+                continue
+            
+            oi_long = self._to_int(row[9])
+            oi_short = self._to_int(row[11])
+            date = row[0].strip()
+            positions = result.setdefault(date, {}).setdefault(cid, {
+                'dealers': {'long': 0, 'short': 0, 'net': 0},
+                'trusts':  {'long': 0, 'short': 0, 'net': 0},
+                'foreign': {'long': 0, 'short': 0, 'net': 0},
+            })
+            positions[identity] = {'long': oi_long, 'short': oi_short, 'net': oi_long - oi_short}
+        
+        return result
+    
+    def get_positions_range(self, start_date, end_date, commodity_ids=('MXF', 'TX'), debug=False):
+        """
+        下載一段日期的三大法人部位 (每 BACKFILL_CHUNK_DAYS 天一次請求)
+        
+        start_date / end_date: datetime
+        Returns: {'YYYY/MM/DD': {commodity_id: positions}}
+        """
+        result = {}
+        chunk_start = start_date
+        while chunk_start <= end_date:
+            chunk_end = min(chunk_start + timedelta(days=BACKFILL_CHUNK_DAYS - 1), end_date)
+            data = {
+                'queryStartDate': chunk_start.strftime('%Y/%m/%d'),
+                'queryEndDate': chunk_end.strftime('%Y/%m/%d'),
+            }
+            try:
+                resp = requests.post(CSV_URL, data=data, headers=self.headers, timeout=60)
+                resp.raise_for_status()
+                text = resp.content.decode('cp950', errors='replace')
+                chunk = self.parse_positions_csv(text, commodity_ids)
+                result.update(chunk)
+                if debug:
+                    print(f"  {data['queryStartDate']} ~ {data['queryEndDate']}: {len(chunk)} 個交易日")
+            except Exception as e:
+                print(f"錯誤 ({data['queryStartDate']} ~ {data['queryEndDate']}): {e}")
+            chunk_start = chunk_end + timedelta(days=1)
+        return result
+    
+    def get_retail_ratio_range(self, start_date, end_date, commodity_ids=('MXF', 'TX'), debug=False):
+        """
+        區間版 get_retail_ratio: 一次下載整段, 所有商品一起算
+        
+        Returns: {'YYYY/MM/DD': {commodity_id: result}}，result 格式同 get_retail_ratio
+        """
+        positions = self.get_positions_range(start_date, end_date, commodity_ids, debug)
+        results = {}
+        for date in sorted(positions):
+            for cid, pos in positions[date].items():
+                if sum(v['long'] + v['short'] for v in pos.values()) == 0:
+                    continue
+                results.setdefault(date, {})[cid] = self._build_retail_result(date, cid, pos)
+        return results
+
 if __name__ == '__main__':
     scraper = TAIFEXScraper()
     result = scraper.get_retail_ratio('2026/02/07', 'MXF', debug=True)
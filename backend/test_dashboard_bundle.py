@@ -0,0 +1,57 @@
+"""
+dashboard_bundle.py 單元測試
+
+Run: python -m pytest test_dashboard_bundle.py -v
+"""
+import gzip
+import json
+import os
+
+import dashboard_bundle as db
+
+
+def write(path, data):
+    path.write_text(json.dumps(data, ensure_ascii=False), encoding='utf-8')
+
+
+def test_build_skips_missing_and_broken_sources(tmp_path):
+    write(tmp_path / 'market_data.json', {'updated_at': 't', 'sentiment': {'score': 55}})
+    (tmp_path / 'vix.json').write_text('not json', encoding='utf-8')
+    assert db.build_bundle(tmp_path) is True
+    bundle = json.loads((tmp_path / db.BUNDLE_NAME).read_text(encoding='utf-8'))
+    assert bundle['market_data'] == {'updated_at': 't', 'sentiment': {'score': 55}}
+    assert 'vix' not in bundle and set(bundle['sources']) == {'market_data'}
+
+    # 來源沒變 → 只有 built_at / sources 不同，不重寫
+    assert db.build_bundle(tmp_path) is False
+
+
+def test_select_fields_with_dotted_paths():
+    bundle = {'built_at': 't', 'sources': {'a': {'file': 'a.json'}, 'b': {'file': 'b.json'}},
+              'a': {'x': {'y': 1}, 'z': 2}, 'b': [1, 2]}
+    assert db.select_fields(bundle, ['a.x.y', 'a.z', 'b', 'a.missing', 'nope', 'sources']) == {
+        'built_at': 't',
+        'a': {'x': {'y': 1}, 'z': 2},
+        'b': [1, 2],
+        'sources': {'a': {'file': 'a.json'}, 'b': {'file': 'b.json'}},
+    }
+
+
+def test_cache_serves_prebuilt_bytes_and_rebuilds_on_source_change(tmp_path):
+    write(tmp_path / 'vix.json', {'vix': 17})
+    db.build_bundle(tmp_path)
+    cache = db.BundleCache(tmp_path)
+    body, gz_body, etag = cache.get()
+    assert body == (tmp_path / db.BUNDLE_NAME).read_bytes()
+    assert gzip.decompress(gz_body) == body
+    assert cache.get() == (body, gz_body, etag)
+
+    selected, _, selected_etag = cache.get(['vix.vix'])
+    assert json.loads(selected)['vix'] == {'vix': 17} and selected_etag != etag
+
+    write(tmp_path / 'vix.json', {'vix': 30})
+    stat = (tmp_path / 'vix.json').stat()
+    os.utime(tmp_path / 'vix.json', ns=(stat.st_atime_ns, stat.st_mtime_ns + 10**9))
+    body, _, new_etag = cache.get()
+    assert json.loads(body)['vix'] == {'vix': 30} and new_etag != etag
+    assert json.loads(cache.get(['vix'])[0])['vix'] == {'vix': 30}
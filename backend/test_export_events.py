@@ -0,0 +1,44 @@
+"""
+export_events.py 單元測試
+
+Run: python -m pytest test_export_events.py -v
+"""
+import json
+
+import export_events
+from json_export import write_json
+
+
+def test_poll_publishes_only_changed_versions(tmp_path):
+    write_json(tmp_path / 'a.json', {'value': 1})
+    events = export_events.ExportEvents(tmp_path)
+    assert events.poll() == 0          # 第一次只記基準
+    assert events.poll() == 0
+
+    write_json(tmp_path / 'a.json', {'value': 1, 'updated_at': 'later'})   # 內容沒變
+    assert events.poll() == 0
+
+    write_json(tmp_path / 'a.json', {'value': 2})
+    write_json(tmp_path / 'b.json', {'value': 1})
+    assert events.poll() == 2
+    got = events.wait(0, timeout=0)
+    assert [(e['id'], e['file'], e['panel'], e['version']) for e in got] == [
+        (1, 'a.json', 'a', 2), (2, 'b.json', 'b', 1)]
+    assert got[0]['path'].startswith('hashed/a.')
+
+
+def test_wait_returns_only_newer_events_and_times_out(tmp_path):
+    events = export_events.ExportEvents(tmp_path)
+    assert events.wait(0, timeout=0.01) == []
+    for name in ('a.json', 'b.json', 'c.json'):
+        events.publish(name, {'version': 1})
+    assert [e['file'] for e in events.wait(1, timeout=0)] == ['b.json', 'c.json']
+    assert events.last_id == 3
+
+
+def test_format_sse():
+    text = export_events.format_sse({'id': 7, 'file': 'ai_summary.json'}).decode('utf-8')
+    lines = text.split('\n')
+    assert lines[:2] == ['id: 7', 'event: export']
+    assert json.loads(lines[2][len('data: '):]) == {'id': 7, 'file': 'ai_summary.json'}
+    assert text.endswith('\n\n')
@@ -0,0 +1,173 @@
+"""
+html_tables.py 單元測試 + 解析效能比較
+
+黃金測試: 各爬蟲改寫前的 BeautifulSoup 寫法當參考答案，確認 lxml 版本結果一致。
+測試頁面依各來源的實際結構產生（期交所三大法人、MOPS 內部人持股、HiStock 題材頁、
+Yahoo 概念股頁），大小與真實頁面同一量級。
+
+Run: python -m pytest test_html_tables.py -v
+Bench: python test_html_tables.py
+"""
+import re
+import time
+
+import pytest
+from bs4 import BeautifulSoup
+
+import html_tables
+
+NAV = ''.join(f'<li><a href="/menu/{i}">選單 {i}</a></li>' for i in range(400))
+SCRIPTS = '<script>var x = "' + 'x' * 20000 + '";</script>'
+
+
+# ============================================================
+# 測試頁面
+# ============================================================
+def taifex_page(products=40):
+    """futContractsDate: 每個商品三列（自營商 15 欄，投信/外資 13 欄）"""
+    rows = []
+    for p in range(products):
+        name = '微型臺指' if p == 20 else f'商品{p}'
+        for j, identity in enumerate(('自營商', '投信', '外資')):
+            head = f'<td rowspan="3">{p + 1}</td><td rowspan="3"><div>{name}</div></td>' if j == 0 else ''
+            nums = ''.join(f'<td align="right"><font color="blue">{(p * 13 + j * 7 + k) * 1000:,}</font></td>'
+                           for k in range(12))
+            rows.append(f'<tr class="12bk">{head}<td>{identity}</td>{nums}</tr>')
+    table = '<table class="table_f">' + ''.join(rows) + '</table>'
+    return f'<html><head><title>期貨契約</title>{SCRIPTS}</head><body><ul>{NAV}</ul>{table}</body></html>'
+
+
+def mops_page(insiders=120):
+    """ajax_stapap1: class=hasBorder 的表格，前兩列是表頭"""
+    rows = ['<tr><th colspan="7">內部人持股</th></tr>',
+            '<tr><th>職稱</th><th>姓名</th><th>選任時持股</th><th>目前持股</th>'
+            '<th>設質股數</th><th>設質比例</th><th>配偶未成年子女持股</th></tr>']
+    for i in range(insiders):
+        rows.append(f'<tr class="even"><td> 董事 </td><td>姓名{i}</td><td>{i * 1000:,}</td>'
+                    f'<td>{i * 1500:,}</td><td>-</td><td>0.00%</td><td>{i * 10:,}</td></tr>')
+    return (f'<html><body><table class="noBorder"><tr><td>公司</td></tr></table>'
+            f'<table class="hasBorder" width="100%">{"".join(rows)}</table></body></html>')
+
+
+def histock_page(stocks=60):
+    links = ''.join(f'<tr><td><a href="/stock/{2300 + i}">股{i}</a></td><td>{i}.5</td></tr>'
+                    for i in range(stocks))
+    return (f'<html><head><meta charset="utf-8"><title>\n  上市 AI伺服器概念股成份股行情報價 &amp; 走勢\n</title>'
+            f'{SCRIPTS}</head><body><ul>{NAV}</ul><a href="/stock/2330">台積電</a>'
+            f'<table>{links}</table></body></html>')
+
+
+def yahoo_page(stocks=80):
+    links = ''.join(f'<li><a href="https://tw.stock.yahoo.com/quote/{3000 + i}.TW">'
+                    f'<span>名稱</span><span>{i}</span></a></li>' for i in range(stocks))
+    return f'<html><head>{SCRIPTS}</head><body><ul>{NAV}</ul><ul>{links}</ul></body></html>'
+
+
+# ============================================================
+# 參考實作（改寫前的 BeautifulSoup 寫法）
+# ============================================================
+def ref_tables(text):
+    soup = BeautifulSoup(text, 'html.parser')
+    return [[[c.get_text(strip=True) for c in tr.find_all(['td', 'th'])] for tr in t.find_all('tr')]
+            for t in soup.find_all('table')]
+
+
+def ref_mops_rows(text):
+    soup = BeautifulSoup(text, 'html.parser')
+    table = soup.find('table', {'class': 'hasBorder'})
+    return [[td.get_text(strip=True) for td in tr.find_all('td')] for tr in table.find_all('tr')]
+
+
+def ref_title(text):
+    return BeautifulSoup(text, 'lxml').find('title').get_text(strip=True)
+
+
+def ref_probe(text):
+    """1_discover_themes.probe_id: 同一棵 lxml soup 取 title 與成分股連結"""
+    soup = BeautifulSoup(text, 'lxml')
+    return (soup.find('title').get_text(strip=True),
+            [a['href'] for a in soup.find_all('a', href=re.compile(r'/stock/\d+$'))])
+
+
+def ref_links(text, pattern):
+    soup = BeautifulSoup(text, 'html.parser')
+    return [(a['href'], a.get_text(strip=True)) for a in soup.find_all('a', href=re.compile(pattern))]
+
+
+# ============================================================
+# 黃金測試
+# ============================================================
+def test_tables_match_beautifulsoup():
+    text = taifex_page()
+    assert html_tables.extract_tables(text) == ref_tables(text)
+
+
+def test_class_xpath_selects_like_find_class():
+    text = mops_page()
+    tables = html_tables.extract_tables(text, html_tables.class_xpath('table', 'hasBorder'), cells=('td',))
+    assert len(tables) == 1
+    assert tables[0] == ref_mops_rows(text)
+    assert tables[0][2][:4] == ['董事', '姓名0', '0', '0']
+
+
+def test_title_is_unescaped_and_stripped():
+    text = histock_page()
+    assert html_tables.extract_title(text) == ref_title(text)
+    assert html_tables.extract_title('<html><body>no title</body></html>') is None
+
+
+def test_links_match_beautifulsoup():
+    text = histock_page()
+    assert html_tables.extract_links(text, r'/stock/\d+$') == ref_links(text, r'/stock/\d+$')
+    text = yahoo_page()
+    pattern = r'/quote/(\d{4,6})(?:\.TW)?'
+    assert html_tables.extract_links(text, pattern) == ref_links(text, pattern)
+
+
+@pytest.mark.parametrize('text', ['', '   ', None])
+def test_empty_input(text):
+    assert html_tables.extract_tables(text) == []
+    assert html_tables.extract_links(text) == []
+
+
+def test_xml_declaration_is_accepted():
+    text = '<?xml version="1.0" encoding="UTF-8"?>' + mops_page(3)
+    assert len(html_tables.extract_tables(text, html_tables.class_xpath('table', 'hasBorder'))) == 1
+
+
+# ============================================================
+# 效能比較
+# ============================================================
+def _bench(label, fn, repeat=5):
+    best = float('inf')
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - t0)
+    print(f"  {label:<40s} {best * 1000:9.2f} ms")
+    return best
+
+
+if __name__ == '__main__':
+    pages = {
+        '期交所 futContractsDate': (taifex_page(), lambda t: ref_tables(t), lambda t: html_tables.extract_tables(t)),
+        'MOPS stapap1': (mops_page(),
+                         lambda t: ref_mops_rows(t),
+                         lambda t: html_tables.extract_tables(t, html_tables.class_xpath('table', 'hasBorder'),
+                                                              cells=('td',))),
+        'HiStock 題材頁 (title + 連結)': (histock_page(),
+                                     lambda t: ref_probe(t),
+                                     lambda t: (html_tables.extract_title(t),
+                                                html_tables.extract_links(t, r'/stock/\d+$'))),
+        'HiStock 非題材頁 (只看 title)': (histock_page().replace('成份股', ''),
+                                     lambda t: ref_title(t),
+                                     lambda t: html_tables.extract_title(t)),
+        'Yahoo 概念股頁': (yahoo_page(),
+                        lambda t: ref_links(t, r'/quote/(\d{4,6})'),
+                        lambda t: html_tables.extract_links(t, r'/quote/(\d{4,6})')),
+    }
+    for label, (text, old, new) in pages.items():
+        print(f"\n📄 {label} ({len(text) / 1024:.0f} KB)")
+        t_old = _bench("BeautifulSoup (舊)", lambda: old(text))
+        t_new = _bench("html_tables (lxml)", lambda: new(text))
+        print(f"  {'加速':<40s} {t_old / t_new:9.1f} x")
@@ -0,0 +1,83 @@
+"""
+indicator_state.py 單元測試
+
+驗證「逐根推進」與「完整重算」結果一致，以及歷史被修正時會自動重算。
+
+Run: python -m pytest test_indicator_state.py -v
+"""
+import tempfile
+from pathlib import Path
+
+import numpy as np
+import pytest
+
+import indicator_state
+from test_indicators import make_klines
+
+
+@pytest.fixture
+def temp_store(monkeypatch):
+    """每個測試用獨立的狀態目錄"""
+    with tempfile.TemporaryDirectory() as tmpdir:
+        monkeypatch.setattr(indicator_state, "KLINE_DIR", Path(tmpdir))
+        yield Path(tmpdir)
+
+
+def _assert_same(a, b):
+    for field in indicator_state.TAIL_FIELDS:
+        if field == 'date':
+            assert a['tail'][field] == b['tail'][field]
+        else:
+            np.testing.assert_allclose(a['tail'][field], b['tail'][field],
+                                       rtol=1e-9, atol=1e-9, equal_nan=True)
+    assert a['count'] == b['count']
+    assert a['date'] == b['date']
+
+
+def test_advance_matches_full_rebuild(temp_store):
+    """從 400 根開始每天推進一根，到 720 根時與完整重算一致"""
+    klines = make_klines(720)
+    indicator_state.update_state('2330', klines[:400])
+    for n in range(401, 721):
+        state = indicator_state.update_state('2330', klines[:n])
+    _assert_same(state, indicator_state.build_state(klines))
+    assert len(state['tail']['date']) == indicator_state.TAIL_BARS
+
+
+def test_short_history_advance(temp_store):
+    """資料很少（暖機期內）時推進也與重算一致"""
+    klines = make_klines(40)
+    indicator_state.update_state('2330', klines[:3])
+    for n in range(4, 41):
+        state = indicator_state.update_state('2330', klines[:n])
+    _assert_same(state, indicator_state.build_state(klines))
+
+
+def test_advance_only_touches_new_bars(temp_store, monkeypatch):
+    """已有狀態時只推進新 K 棒，不呼叫完整重算"""
+    klines = make_klines(300)
+    indicator_state.update_state('2330', klines[:299])
+
+    def fail(_):
+        raise AssertionError("不應該完整重算")
+    monkeypatch.setattr(indicator_state, "build_state", fail)
+    state = indicator_state.update_state('2330', klines)
+    assert state['date'] == klines[-1]['date']
+
+
+def test_revised_history_triggers_rebuild(temp_store):
+    """昨天的收盤被修正（例如盤中資料被覆蓋）→ 完整重算"""
+    klines = make_klines(300)
+    indicator_state.update_state('2330', klines[:299])
+    revised = [dict(k) for k in klines]
+    revised[298]['close'] = revised[298]['close'] * 1.01
+    state = indicator_state.update_state('2330', revised)
+    _assert_same(state, indicator_state.build_state(revised))
+
+
+def test_backfilled_history_triggers_rebuild(temp_store):
+    """K 線庫補了更早的歷史（筆數對不上）→ 完整重算"""
+    klines = make_klines(300)
+    indicator_state.update_state('2330', klines[100:])
+    state = indicator_state.update_state('2330', klines)
+    assert state['count'] == 300
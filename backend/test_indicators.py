@@ -0,0 +1,259 @@
+"""
+indicators.py 單元測試 + 效能比較
+
+黃金測試: 用各掃描器改寫前的原始算法當參考答案，確認向量化版本結果一致
+- macd_signal_scanner.calc_ema / calc_macd / calc_ma (純 Python 迴圈)
+- backtest_pullback_strategy.add_indicators (pandas ewm / rolling + KD 迴圈)
+
+Run: python -m pytest test_indicators.py -v
+Bench: python test_indicators.py
+"""
+import random
+import time
+from datetime import date, timedelta
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import indicators
+
+
+# ============================================================
+# 參考實作（改寫前的原始算法，原封不動保留）
+# ============================================================
+def ref_calc_ema(prices, period):
+    if len(prices) < period:
+        return []
+    ema = [0.0] * len(prices)
+    multiplier = 2.0 / (period + 1)
+    sma = sum(prices[:period]) / period
+    ema[period - 1] = sma
+    for i in range(period, len(prices)):
+        ema[i] = (prices[i] - ema[i - 1]) * multiplier + ema[i - 1]
+    return ema
+
+
+def ref_calc_macd(closes, fast=12, slow=26, signal=9):
+    ema_fast = ref_calc_ema(closes, fast)
+    ema_slow = ref_calc_ema(closes, slow)
+    dif = [0.0] * len(closes)
+    for i in range(slow - 1, len(closes)):
+        dif[i] = ema_fast[i] - ema_slow[i]
+    dif_valid = dif[slow - 1:]
+    macd_signal_raw = ref_calc_ema(dif_valid, signal)
+    macd_signal = [0.0] * len(closes)
+    histogram = [0.0] * len(closes)
+    start_idx = slow - 1
+    for i in range(len(macd_signal_raw)):
+        macd_signal[start_idx + i] = macd_signal_raw[i]
+        histogram[start_idx + i] = dif[start_idx + i] - macd_signal_raw[i]
+    return dif, macd_signal, histogram
+
+
+def ref_calc_ma(prices, period):
+    if len(prices) < period:
+        return []
+    ma = [0.0] * len(prices)
+    for i in range(period - 1, len(prices)):
+        ma[i] = sum(prices[i - period + 1:i + 1]) / period
+    return ma
+
+
+def ref_add_indicators(df):
+    df["ma20"] = df["close"].rolling(20).mean()
+    df["ma60"] = df["close"].rolling(60).mean()
+    ema12 = df["close"].ewm(span=12, adjust=False).mean()
+    ema26 = df["close"].ewm(span=26, adjust=False).mean()
+    df["dif"] = ema12 - ema26
+    df["macd"] = df["dif"].ewm(span=9, adjust=False).mean()
+    df["osc"] = df["dif"] - df["macd"]
+    low9 = df["low"].rolling(9).min()
+    high9 = df["high"].rolling(9).max()
+    rsv = (df["close"] - low9) / (high9 - low9) * 100
+    k = pd.Series(index=df.index, dtype=float)
+    d = pd.Series(index=df.index, dtype=float)
+    k.iloc[0] = 50
+    d.iloc[0] = 50
+    for i in range(1, len(df)):
+        rsv_i = rsv.iloc[i]
+        if pd.isna(rsv_i):
+            k.iloc[i] = k.iloc[i-1]
+            d.iloc[i] = d.iloc[i-1]
+        else:
+            k.iloc[i] = (2/3) * k.iloc[i-1] + (1/3) * rsv_i
+            d.iloc[i] = (2/3) * d.iloc[i-1] + (1/3) * k.iloc[i]
+    df["k"] = k
+    df["d"] = d
+    return df
+
+
+# ============================================================
+# 測試資料
+# ============================================================
+def make_klines(n, seed=42):
+    """隨機漫步產生 K 線 list of dict（同 kline_history_manager 格式）"""
+    rng = random.Random(seed)
+    price = 100.0
+    klines = []
+    for i in range(n):
+        o = price
+        c = max(1.0, o * (1 + rng.gauss(0, 0.02)))
+        h = max(o, c) * (1 + abs(rng.gauss(0, 0.005)))
+        l = min(o, c) * (1 - abs(rng.gauss(0, 0.005)))
+        klines.append({
+            'date': (date(2015, 1, 1) + timedelta(days=i)).strftime('%Y-%m-%d'),
+            'open': round(o, 2), 'high': round(h, 2),
+            'low': round(l, 2), 'close': round(c, 2),
+            'volume': rng.randint(1000, 100000),
+        })
+        price = c
+    return klines
+
+
+def make_df(klines):
+    df = pd.DataFrame(klines)
+    df.index = pd.date_range("2020-01-01", periods=len(df), freq="B")
+    return df[["open", "high", "low", "close", "volume"]].astype(float)
+
+
+@pytest.fixture
+def klines():
+    return make_klines(720)
+
+
+# ============================================================
+# 黃金測試
+# ============================================================
+def test_as_array_accepts_klines_and_lists(klines):
+    """list of dict / list / Series 都能轉成同一個 array"""
+    closes = [k['close'] for k in klines]
+    np.testing.assert_array_equal(indicators.as_array(klines, 'close'), closes)
+    np.testing.assert_array_equal(indicators.as_array(closes), closes)
+    np.testing.assert_array_equal(indicators.as_array(pd.Series(closes)), closes)
+
+
+def test_sma_matches_calc_ma(klines):
+    """SMA 對照 macd_signal_scanner.calc_ma（暖機期原本是 0，改為 NaN）"""
+    closes = [k['close'] for k in klines]
+    ref = ref_calc_ma(closes, 20)
+    got = indicators.sma(klines, 20)
+    assert np.isnan(got[:19]).all()
+    np.testing.assert_allclose(got[19:], ref[19:], rtol=1e-12)
+
+
+def test_ema_sma_seed_matches_calc_ema(klines):
+    """seed='sma' 對照 macd_signal_scanner.calc_ema"""
+    closes = [k['close'] for k in klines]
+    for period in (9, 12, 26):
+        ref = ref_calc_ema(closes, period)
+        got = indicators.ema(closes, period, seed='sma')
+        np.testing.assert_allclose(got[period - 1:], ref[period - 1:], rtol=1e-10)
+
+
+def test_macd_sma_seed_matches_calc_macd(klines):
+    """seed='sma' 的 MACD 對照 macd_signal_scanner.calc_macd"""
+    closes = [k['close'] for k in klines]
+    ref_dif, ref_sig, ref_hist = ref_calc_macd(closes)
+    dif, sig, hist = indicators.macd(closes, seed='sma')
+    valid = 26 + 9 - 2
+    np.testing.assert_allclose(dif[25:], ref_dif[25:], rtol=1e-9, atol=1e-9)
+    np.testing.assert_allclose(sig[valid:], ref_sig[valid:], rtol=1e-9, atol=1e-9)
+    np.testing.assert_allclose(hist[valid:], ref_hist[valid:], rtol=1e-9, atol=1e-9)
+
+
+def test_macd_first_seed_matches_pandas_ewm(klines):
+    """seed='first' 的 MACD 對照 pandas ewm(adjust=False)"""
+    ref = ref_add_indicators(make_df(klines))
+    dif, sig, hist = indicators.macd(ref["close"], seed='first')
+    np.testing.assert_allclose(dif, ref["dif"], rtol=1e-9, atol=1e-9)
+    np.testing.assert_allclose(sig, ref["macd"], rtol=1e-9, atol=1e-9)
+    np.testing.assert_allclose(hist, ref["osc"], rtol=1e-9, atol=1e-9)
+
+
+def test_kd_matches_loop_implementation(klines):
+    """KD 對照 backtest_pullback_strategy 原本的逐列迴圈"""
+    ref = ref_add_indicators(make_df(klines))
+    k, d = indicators.kd(ref["high"], ref["low"], ref["close"])
+    np.testing.assert_allclose(k, ref["k"], rtol=1e-10)
+    np.testing.assert_allclose(d, ref["d"], rtol=1e-10)
+
+
+def test_kd_holds_value_when_range_is_flat():
+    """9 日最高 = 最低（RSV 無法計算）時 K/D 沿用前值"""
+    klines = make_klines(30)
+    for k in klines[15:]:
+        k['open'] = k['high'] = k['low'] = k['close'] = 50.0
+    df = make_df(klines)
+    ref = ref_add_indicators(df.copy())
+    k, d = indicators.kd(df["high"], df["low"], df["close"])
+    np.testing.assert_allclose(k, ref["k"], rtol=1e-10)
+    np.testing.assert_allclose(d, ref["d"], rtol=1e-10)
+
+
+def test_rolling_stats_match_pandas(klines):
+    """滾動分位數 / 最大 / 最小 對照 pandas rolling"""
+    df = ref_add_indicators(make_df(klines))
+    np.testing.assert_allclose(
+        indicators.rolling_quantile(df["osc"], 60, 0.25),
+        df["osc"].rolling(60).quantile(0.25), rtol=1e-10, equal_nan=True)
+    np.testing.assert_allclose(
+        indicators.rolling_max(df["high"], 240),
+        df["high"].rolling(240).max(), equal_nan=True)
+    np.testing.assert_allclose(
+        indicators.rolling_min(df["low"], 9),
+        df["low"].rolling(9).min(), equal_nan=True)
+
+
+def test_volume_ratio(klines):
+    """量比 = 近 5 日均量 / 近 20 日均量，長均量為 0 時 NaN"""
+    volumes = [k['volume'] for k in klines]
+    got = indicators.volume_ratio(volumes, 5, 20)
+    expected = (sum(volumes[-5:]) / 5) / (sum(volumes[-20:]) / 20)
+    assert got[-1] == pytest.approx(expected)
+    assert np.isnan(indicators.volume_ratio([0] * 20, 5, 20)[-1])
+
+
+def test_ema_long_series_stays_stable():
+    """10 年資料（分段閉式解）不溢位，結果與 pandas 一致"""
+    closes = indicators.as_array(make_klines(2600, seed=7), 'close')
+    ref = pd.Series(closes).ewm(span=12, adjust=False).mean()
+    np.testing.assert_allclose(indicators.ema(closes, 12), ref, rtol=1e-9)
+
+
+def test_short_input_returns_all_nan():
+    """資料不足時回傳全 NaN，長度不變"""
+    assert np.isnan(indicators.sma([1, 2, 3], 5)).all()
+    assert np.isnan(indicators.ema([1, 2, 3], 5, seed='sma')).all()
+    assert len(indicators.rolling_quantile([1, 2], 60, 0.25)) == 2
+
+
+# ============================================================
+# 效能比較
+# ============================================================
+def _bench(label, fn, repeat=5):
+    best = float('inf')
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - t0)
+    print(f"  {label:<36s} {best * 1000:9.2f} ms")
+    return best
+
+
+if __name__ == '__main__':
+    for n in (80, 365, 720, 2500):
+        bench_klines = make_klines(n)
+        closes = [k['close'] for k in bench_klines]
+        df = make_df(bench_klines)
+        print(f"\n📊 {n} 根 K 線")
+        _bench("calc_macd + calc_ma(20) (舊)",
+               lambda: (ref_calc_macd(closes), ref_calc_ma(closes, 20)))
+        _bench("macd + sma(20) (NumPy)",
+               lambda: (indicators.macd(bench_klines, seed='sma'), indicators.sma(bench_klines, 20)))
+        _bench("add_indicators (舊 pandas + 迴圈)",
+               lambda: ref_add_indicators(df.copy()), repeat=2)
+        _bench("macd + kd + sma(20/60) (NumPy)",
+               lambda: (indicators.macd(df["close"]),
+                        indicators.kd(df["high"], df["low"], df["close"]),
+                        indicators.sma(df["close"], 20), indicators.sma(df["close"], 60)))
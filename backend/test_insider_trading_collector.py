@@ -0,0 +1,78 @@
+"""
+insider_trading_collector.py 單元測試（checkpoint 接續與月份快取）
+
+Run: python -m pytest test_insider_trading_collector.py -v
+"""
+import json
+
+import pytest
+
+import insider_trading_collector as itc
+
+
+@pytest.fixture(autouse=True)
+def store(tmp_path, monkeypatch):
+    monkeypatch.setattr(itc, 'DB_PATH', tmp_path / 'market_data.db')
+    monkeypatch.setattr(itc, 'CHECKPOINT_PATH', tmp_path / 'insider_trading_progress.json')
+    monkeypatch.setattr(itc, 'OUTPUT_PATH', tmp_path / 'insider_trading.json')
+    monkeypatch.setattr(itc, 'get_stock_name', lambda sid: sid)
+    return tmp_path
+
+
+def holder(shares):
+    return [{'title': '董事長', 'name': '甲', 'elected_shares': 0, 'current_shares': shares,
+             'pledged_shares': 0, 'related_shares': 0}]
+
+
+def use_mops(monkeypatch, months):
+    """months: {(stock_id, month): records}, 沒列到的月份 MOPS 查無資料"""
+    calls = []
+
+    def fake_fetch(stock_id, roc_year, month, mops=None):
+        calls.append((stock_id, month))
+        return months.get((stock_id, month), [])
+    monkeypatch.setattr(itc, 'fetch_insider_holdings', fake_fetch)
+    return calls
+
+
+def test_stock_without_data_does_not_freeze_later_runs(monkeypatch):
+    monkeypatch.setattr(itc, 'load_watchlist_codes', lambda: ['0050', '2330'])
+    use_mops(monkeypatch, {('2330', 5): holder(1000), ('2330', 4): holder(1000)})
+    out = itc.main(115, 5)
+    assert out['fail_count'] == 1 and out['summary']['total_changes'] == 0
+    assert not itc.CHECKPOINT_PATH.exists()
+
+    # MOPS 之後補上申報 (略過當天快取) → 下一輪要看得到, 不能被舊進度跳過
+    monkeypatch.setattr(itc, 'load_cached_month', lambda *a: None)
+    use_mops(monkeypatch, {('2330', 5): holder(3000), ('2330', 4): holder(1000)})
+    out = itc.main(115, 5)
+    assert out['summary']['total_buyers'] == 1
+
+
+def test_checkpoint_only_resumes_same_day():
+    itc.save_checkpoint({'target_month': '2026/05', 'run_date': '2026-06-03', 'done': {'2330': []}})
+    assert itc.load_checkpoint('2026/05', '2026-06-03')['done'] == {'2330': []}
+    assert itc.load_checkpoint('2026/05', '2026-06-04')['done'] == {}
+    assert itc.load_checkpoint('2026/06', '2026-06-03')['done'] == {}
+
+    # 舊格式 (沒有 run_date) 也直接丟棄
+    itc.CHECKPOINT_PATH.write_text(json.dumps({'target_month': '2026/05', 'done': {'2330': []}}),
+                                   encoding='utf-8')
+    assert itc.load_checkpoint('2026/05', '2026-06-03')['done'] == {}
+
+
+def test_month_without_data_is_cached_and_confirmed_after_deadline(monkeypatch):
+    monkeypatch.setattr(itc, 'load_watchlist_codes', lambda: ['0050'])
+    calls = use_mops(monkeypatch, {})
+    itc.init_cache()
+
+    # 申報期限 (6/15) 前查到空結果 → 存起來但未確認
+    itc.save_cached_month('0050', 115, 5, [], fetched=itc.datetime(2026, 6, 3))
+    assert itc.load_cached_month('0050', 115, 5)[:2] == ([], False)
+
+    # 期限後查到的空結果 → 確認, 之後不再查 MOPS
+    itc.main(115, 5)
+    assert calls == [('0050', 5)]
+    assert itc.load_cached_month('0050', 115, 5)[:2] == ([], True)
+    out = itc.main(115, 5)
+    assert calls == [('0050', 5)] and out['fail_count'] == 1
@@ -0,0 +1,132 @@
+"""
+json_export.py 單元測試
+
+Run: python -m pytest test_json_export.py -v
+"""
+import gzip
+import json
+
+import numpy as np
+import pytest
+
+import json_export
+
+
+@pytest.fixture(params=['orjson', 'json'])
+def backend(request, monkeypatch):
+    """orjson 與標準 json 兩種序列化都要跑"""
+    if request.param == 'json':
+        monkeypatch.setattr(json_export, 'orjson', None)
+    elif json_export.orjson is None:
+        pytest.skip('orjson 未安裝')
+    return request.param
+
+
+def manifest(tmp_path):
+    return json.loads((tmp_path / json_export.MANIFEST_NAME).read_text(encoding='utf-8'))
+
+
+def test_compact_output_round_trips(tmp_path, backend):
+    data = {'updated_at': '2026-05-20T18:00:00', '名稱': '台積電', 'rows': [1, 2.5, None],
+            'np': np.float64(1.5), 'count': np.int64(3)}
+    path = tmp_path / 'out.json'
+    assert json_export.write_json(path, data) is True
+    text = path.read_text(encoding='utf-8')
+    assert '\n' not in text and '台積電' in text
+    assert json.loads(text) == {**data, 'np': 1.5, 'count': 3}
+
+
+def test_unchanged_content_skips_write(tmp_path, backend):
+    path = tmp_path / 'out.json'
+    assert json_export.write_json(path, {'updated_at': 't1', 'value': 1}) is True
+    entry = manifest(tmp_path)['files']['out.json']
+    assert entry['version'] == 1 and entry['size'] == path.stat().st_size
+
+    # 只有 updated_at 變 → 不寫、版本不變、檔案保留舊的 updated_at
+    assert json_export.write_json(path, {'updated_at': 't2', 'value': 1}) is False
+    assert json.loads(path.read_text())['updated_at'] == 't1'
+    assert manifest(tmp_path)['files']['out.json']['version'] == 1
+
+    assert json_export.write_json(path, {'updated_at': 't3', 'value': 2}) is True
+    entry = manifest(tmp_path)['files']['out.json']
+    assert entry['version'] == 2 and entry['hash'] != ''
+    assert json.loads(path.read_text())['value'] == 2
+
+
+def test_file_changed_outside_writer_is_rewritten(tmp_path, backend):
+    path = tmp_path / 'out.json'
+    json_export.write_json(path, {'value': 1})
+    path.write_text('{"value": 1, "extra": true}', encoding='utf-8')
+    assert json_export.write_json(path, {'value': 1}) is True
+    assert json.loads(path.read_text()) == {'value': 1}
+
+    path.unlink()
+    assert json_export.write_json(path, {'value': 1}) is True
+
+
+def test_manifest_tracks_each_file_and_skips_history(tmp_path, backend):
+    json_export.write_json(tmp_path / 'a.json', {'value': 1})
+    json_export.write_json(tmp_path / 'b.json', [1, 2, 3])
+    json_export.write_json(tmp_path / 'history_20260520.json', {'value': 1}, manifest=False)
+    assert set(manifest(tmp_path)['files']) == {'a.json', 'b.json'}
+    assert not list(tmp_path.glob('*.tmp'))
+
+
+def test_broken_manifest_is_rebuilt(tmp_path, backend):
+    (tmp_path / json_export.MANIFEST_NAME).write_text('not json', encoding='utf-8')
+    assert json_export.write_json(tmp_path / 'a.json', {'value': 1}) is True
+    assert manifest(tmp_path)['files']['a.json']['version'] == 1
+
+
+def test_compressed_and_hashed_copies(tmp_path, backend):
+    path = tmp_path / 'out.json'
+    json_export.write_json(path, {'value': 1})
+    entry = manifest(tmp_path)['files']['out.json']
+    hashed = tmp_path / entry['path']
+    assert entry['path'] == f"hashed/out.{entry['hash']}.json"
+    assert hashed.read_bytes() == path.read_bytes()
+    for f in (path, hashed):
+        assert gzip.decompress(f.with_name(f.name + '.gz').read_bytes()) == path.read_bytes()
+    assert entry['encodings'] == json_export.encodings()
+
+    # 壓縮檔被刪 → 內容沒變也要補回
+    (tmp_path / 'out.json.gz').unlink()
+    assert json_export.write_json(path, {'value': 1}) is True
+    assert (tmp_path / 'out.json.gz').exists()
+
+
+def test_old_hashed_versions_are_pruned(tmp_path, backend):
+    path = tmp_path / 'out.json'
+    paths = []
+    for value in range(4):
+        json_export.write_json(path, {'value': value})
+        paths.append(manifest(tmp_path)['files']['out.json']['path'])
+    kept = sorted(p.name for p in (tmp_path / json_export.HASHED_DIR).glob('*.json'))
+    assert kept == sorted(p.split('/')[-1] for p in paths[-json_export.KEEP_VERSIONS:])
+    assert len(list((tmp_path / json_export.HASHED_DIR).glob('*.gz'))) == json_export.KEEP_VERSIONS
+
+    # 內容回到舊版：雜湊檔重新出現且不會被當成舊版刪掉
+    json_export.write_json(path, {'value': 0})
+    assert (tmp_path / paths[0]).exists()
+
+
+def test_hashed_copy_is_never_rewritten(tmp_path, backend):
+    path = tmp_path / 'out.json'
+    json_export.write_json(path, {'updated_at': 't1', 'value': 'A'})
+    hashed = tmp_path / manifest(tmp_path)['files']['out.json']['path']
+    original = hashed.read_bytes()
+    gz = hashed.with_name(hashed.name + '.gz')
+
+    # A → B → A：雜湊檔名相同，內容仍是第一次寫出的 bytes
+    json_export.write_json(path, {'updated_at': 't2', 'value': 'B'})
+    json_export.write_json(path, {'updated_at': 't3', 'value': 'A'})
+    assert manifest(tmp_path)['files']['out.json']['path'] == hashed.relative_to(tmp_path).as_posix()
+    assert hashed.read_bytes() == original
+    assert json.loads(path.read_text())['updated_at'] == 't3'
+
+    # 壓縮檔遺失重建時也不動雜湊檔
+    gz.unlink()
+    (tmp_path / 'out.json.gz').unlink()
+    assert json_export.write_json(path, {'updated_at': 't4', 'value': 'A'}) is True
+    assert hashed.read_bytes() == original
+    assert gzip.decompress(gz.read_bytes()) == original
@@ -0,0 +1,47 @@
+"""
+kline_history_manager.py 單元測試（needs_refresh 的涵蓋與過期判斷）
+
+Run: python -m pytest test_kline_history_manager.py -v
+"""
+from datetime import date, timedelta
+
+import pandas as pd
+import pytest
+
+import kline_history_manager as khm
+
+
+@pytest.fixture(autouse=True)
+def store(tmp_path, monkeypatch):
+    monkeypatch.setattr(khm, 'KLINE_DIR', tmp_path)
+
+
+def save_range(code, start, end):
+    klines = [{'date': d.strftime('%Y-%m-%d'), 'open': 10, 'high': 11, 'low': 9, 'close': 10,
+               'volume': 1000} for d in pd.bdate_range(start, end)]
+    khm.save_kline_csv(code, klines)
+    return klines[-1]['date']
+
+
+def test_fresh_one_year_fetch_counts_as_covered():
+    # Yahoo 1y：從約 365 天前的第一個交易日開始
+    today = date.today()
+    last = save_range('9999', today - timedelta(days=365), today)
+    assert khm.needs_refresh('9999', years=1, max_stale_days=0, latest=last) == 'fresh'
+    assert khm.needs_refresh('9999', years=2, max_stale_days=0, latest=last) == 'missing'
+
+
+def test_staleness_is_measured_from_latest_trading_day():
+    today = date.today()
+    # 最後一根是「上週五」，latest 也是它 → 週末不算過期
+    friday = today - timedelta(days=(today.weekday() - 4) % 7 or 7)
+    last = save_range('2330', today - timedelta(days=400), friday)
+    assert khm.needs_refresh('2330', years=1, max_stale_days=0, latest=last) == 'fresh'
+
+    newer = (friday + timedelta(days=3)).strftime('%Y-%m-%d')
+    assert khm.needs_refresh('2330', years=1, max_stale_days=0, latest=newer) == 'stale'
+    assert khm.needs_refresh('2330', years=1, max_stale_days=3, latest=newer) == 'fresh'
+
+
+def test_missing_file():
+    assert khm.needs_refresh('0000', years=1) == 'missing'
@@ -0,0 +1,170 @@
+"""
+market_data_exporter.py 單元測試
+
+- 快照版 calc_sentiment 與「逐日 as-of」一致: 情緒歷史每一天的分數，等於把資料庫截到
+  那天再跑 calc_sentiment(load_snapshot(conn)) 的結果
+- 增量更新與全部回補結果相同
+- 輸入資料沒變時 export() 沿用上次輸出（美股指數照樣重抓；舊格式不沿用）
+
+測試資料庫故意讓各表日期不齊（融資缺日、期貨晚開始、漲跌停表有 breadth 沒有的日子）、
+含空值與 0。
+
+Run: python -m pytest test_market_data_exporter.py -v
+"""
+import json
+import random
+import sqlite3
+
+import pandas as pd
+import pytest
+
+import market_data_exporter as mde
+
+SCHEMA = """
+CREATE TABLE margin_data (id INTEGER PRIMARY KEY AUTOINCREMENT, date TEXT NOT NULL UNIQUE,
+                          margin_balance REAL, margin_ratio REAL);
+CREATE TABLE futures_data (id INTEGER PRIMARY KEY AUTOINCREMENT, date TEXT NOT NULL UNIQUE,
+                           long_short_ratio REAL, foreign_net INTEGER, trust_net INTEGER,
+                           dealer_net INTEGER, retail_long INTEGER, retail_short INTEGER,
+                           retail_net INTEGER, retail_ratio REAL, pcr_volume REAL);
+CREATE TABLE market_breadth (id INTEGER PRIMARY KEY AUTOINCREMENT, date TEXT NOT NULL UNIQUE,
+                             taiex_close REAL, up_count INTEGER, down_count INTEGER,
+                             unchanged INTEGER, up_ratio REAL, up_limit INTEGER DEFAULT 0,
+                             down_limit INTEGER DEFAULT 0);
+CREATE TABLE limit_updown (id INTEGER PRIMARY KEY AUTOINCREMENT, date TEXT, code TEXT, type TEXT,
+                           UNIQUE(date, code, type));
+"""
+
+DATES = [d.strftime('%Y-%m-%d') for d in pd.bdate_range('2026-01-01', periods=160)]
+
+
+def fill_db(conn, seed=7):
+    rnd = random.Random(seed)
+    conn.executescript(SCHEMA)
+    for i, d in enumerate(DATES):
+        if i % 11 != 3:
+            ratio = 0 if i == 40 else rnd.uniform(45, 75)
+            conn.execute('INSERT INTO margin_data (date, margin_balance, margin_ratio) VALUES (?,?,?)',
+                         (d, rnd.uniform(2000, 4000), ratio))
+        if i >= 8:
+            conn.execute(
+                'INSERT INTO futures_data (date, long_short_ratio, foreign_net, trust_net, dealer_net, '
+                'retail_long, retail_short, retail_net, retail_ratio, pcr_volume) '
+                'VALUES (?,?,?,?,?,?,?,?,?,?)',
+                (d, rnd.uniform(0.8, 1.2), rnd.choice([None, 5000, rnd.randint(-30000, 30000)]),
+                 1, 2, 3, 4, 5, 0.5, rnd.choice([None, rnd.uniform(0.4, 1.6)])))
+        if i >= 3 and i % 13 != 5:
+            close = None if i % 17 == 0 else 20000 + i * 10 + rnd.uniform(-300, 300)
+            conn.execute(
+                'INSERT INTO market_breadth (date, taiex_close, up_count, down_count, unchanged, '
+                'up_ratio, up_limit, down_limit) VALUES (?,?,?,?,?,?,?,?)',
+                (d, close, 500, 400, 50, rnd.choice([None, rnd.uniform(20, 80)]),
+                 0 if i % 2 else rnd.randint(1, 30), rnd.randint(0, 10)))
+        for k in range(rnd.randint(0, 6)):
+            conn.execute('INSERT INTO limit_updown (date, code, type) VALUES (?,?,?)',
+                         (d, str(k), rnd.choice(['limit_up', 'limit_down'])))
+    conn.commit()
+
+
+@pytest.fixture
+def db(tmp_path, monkeypatch):
+    path = tmp_path / 'market_data.db'
+    monkeypatch.setattr(mde, 'DB_PATH', path)
+    monkeypatch.setattr(mde, 'OUTPUT', tmp_path / 'market_data.json')
+    monkeypatch.setattr(mde, 'get_us_fear_greed', lambda: {'score': 50, 'rating': 'N/A'})
+    conn = sqlite3.connect(path)
+    fill_db(conn)
+    yield conn
+    conn.close()
+
+
+def as_of_sentiment(conn, date):
+    """把資料庫截到 date 為止再跑快照版 calc_sentiment"""
+    copy = sqlite3.connect(':memory:')
+    conn.backup(copy)
+    for table in mde.SOURCE_TABLES:
+        copy.execute(f'DELETE FROM {table} WHERE date > ?', (date,))
+    result = mde.calc_sentiment(mde.load_snapshot(copy))
+    copy.close()
+    return result
+
+
+def test_history_matches_as_of_calc_sentiment(db):
+    history = mde.compute_sentiment_history(mde.load_history_frames(db))
+    checked = 0
+    for date in DATES:
+        expected = as_of_sentiment(db, date)
+        if expected is None:
+            assert date not in history.index
+            continue
+        row = history.loc[date]
+        assert row['score'] == expected['score'], date
+        assert row['rating'] == expected['rating']
+        assert row['available_weight'] == expected['available_weight']
+        for key in mde.COMPONENT_WEIGHTS:
+            if key in expected['components']:
+                assert row[key] == expected['components'][key]['score'], (date, key)
+            else:
+                assert pd.isna(row[key]), (date, key)
+        checked += 1
+    assert checked > 150
+
+
+def test_incremental_update_matches_backfill(db):
+    assert mde.update_sentiment_history(db, full=True) == len(DATES)
+    full = db.execute('SELECT * FROM sentiment_history ORDER BY date').fetchall()
+
+    # 砍掉最後 20 天，再用增量補回
+    db.execute('DELETE FROM sentiment_history WHERE date > ?', (DATES[-21],))
+    assert mde.update_sentiment_history(db) == 21
+    again = db.execute('SELECT * FROM sentiment_history ORDER BY date').fetchall()
+    assert [r[1:-1] for r in again] == [r[1:-1] for r in full]   # 不比 id / created_at
+
+
+def test_export_reuses_output_when_inputs_unchanged(db, capsys):
+    mde.export()
+    output = json.loads(mde.OUTPUT.read_text(encoding='utf-8'))
+    assert output['history']['sentiment'][-1]['date'] == DATES[-1]
+    assert output['sentiment']['taiwan']['score'] == as_of_sentiment(db, DATES[-1])['score']
+
+    capsys.readouterr()
+    mde.export()
+    assert '沿用' in capsys.readouterr().out
+
+    # 當日資料改寫（INSERT OR REPLACE 換 id）→ 重算
+    db.execute('INSERT OR REPLACE INTO margin_data (date, margin_balance, margin_ratio) VALUES (?,?,?)',
+               (DATES[-1], 1, 72))
+    db.commit()
+    mde.export()
+    assert '沿用' not in capsys.readouterr().out
+
+
+def test_reused_output_still_refreshes_us_sentiment(db, monkeypatch, capsys):
+    mde.export()
+    capsys.readouterr()
+
+    # 台股休市、美股照常交易
+    monkeypatch.setattr(mde, 'get_us_fear_greed', lambda: {'score': 72, 'rating': 'GREED'})
+    mde.export()
+    assert '沿用' in capsys.readouterr().out
+    output = json.loads(mde.OUTPUT.read_text(encoding='utf-8'))
+    assert output['sentiment']['us'] == {'score': 72, 'rating': 'GREED'}
+
+    # 抓取失敗 → 保留上次的值
+    monkeypatch.setattr(mde, 'get_us_fear_greed', lambda: {'score': None, 'rating': 'N/A'})
+    mde.export()
+    output = json.loads(mde.OUTPUT.read_text(encoding='utf-8'))
+    assert output['sentiment']['us']['score'] == 72
+
+
+def test_old_format_output_is_not_reused(db, capsys):
+    mde.export()
+    output = json.loads(mde.OUTPUT.read_text(encoding='utf-8'))
+    del output['format'], output['history']['sentiment']
+    mde.OUTPUT.write_text(json.dumps(output), encoding='utf-8')
+    capsys.readouterr()
+
+    mde.export()
+    assert '沿用' not in capsys.readouterr().out
+    output = json.loads(mde.OUTPUT.read_text(encoding='utf-8'))
+    assert output['format'] == mde.OUTPUT_FORMAT and output['history']['sentiment']
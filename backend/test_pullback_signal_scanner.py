@@ -0,0 +1,31 @@
+"""
+pullback_signal_scanner.py 單元測試（latest.json 輸出）
+
+Run: python -m pytest test_pullback_signal_scanner.py -v
+"""
+import json
+
+import export_events
+import json_export
+import pullback_signal_scanner as pss
+
+
+def test_latest_file_is_tracked_in_manifest(tmp_path, monkeypatch):
+    monkeypatch.setattr(pss, 'LATEST_FILE', tmp_path / 'pullback_signal_latest.json')
+    events = export_events.ExportEvents(tmp_path)
+    events.poll()
+
+    latest = {'date': '2026-05-20', 'signal_count': 1, 'signals': [{'code': '2330'}],
+              'updated_at': '2026-05-20T18:00:00'}
+    assert pss.save_latest(latest) is True
+    assert json.loads(pss.LATEST_FILE.read_text(encoding='utf-8')) == latest
+    manifest = json_export.load_manifest(tmp_path)
+    assert manifest['files']['pullback_signal_latest.json']['version'] == 1
+
+    # dashboard 的雷達面板靠這個事件重載
+    assert events.poll() == 1
+    assert events.wait(0, timeout=0)[0]['file'] == 'pullback_signal_latest.json'
+
+    # 只有 updated_at 變 → 不寫、不發事件
+    assert pss.save_latest({**latest, 'updated_at': '2026-05-20T19:00:00'}) is False
+    assert events.poll() == 0
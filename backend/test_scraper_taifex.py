@@ -0,0 +1,111 @@
+"""
+scraper_taifex.py 區間回補單元測試
+
+用同一組三大法人部位做出 HTML (futContractsDate) 與 CSV (futContractsDateDown)
+兩種格式，確認 get_retail_ratio_range 的結果與逐日 get_retail_ratio 一致。
+
+Run: python -m pytest test_scraper_taifex.py -v
+"""
+from datetime import datetime
+
+import scraper_taifex
+from scraper_taifex import TAIFEXScraper
+
+# {date: {product: {identity: (oi_long, oi_short)}}}
+POSITIONS = {
+    '2026/02/05': {
+        '臺股期貨': {'自營商': (9000, 12000), '投信': (30000, 5000), '外資': (40000, 70000)},
+        '微型臺指期貨': {'自營商': (800, 900), '投信': (0, 0), '外資': (5000, 8000)},
+    },
+    '2026/02/06': {
+        '臺股期貨': {'自營商': (9500, 11000), '投信': (31000, 5200), '外資': (42000, 69000)},
+        '微型臺指期貨': {'自營商': (850, 950), '投信': (10, 0), '外資': (5200, 7900)},
+    },
+}
+
+
+def _row(oi_long, oi_short):
+    """交易口數/金額 (6 欄) + 未平倉多/空 口數與金額"""
+    return ['1', '2', '3', '4', '-1', '-2', f'{oi_long:,}', '100', f'{oi_short:,}', '200',
+            f'{oi_long - oi_short:,}', '-100']
+
+
+def make_csv():
+    lines = ['日期,商品名稱,身份別,多方交易口數,多方交易契約金額(千元),空方交易口數,'
+             '空方交易契約金額(千元),多空交易口數淨額,多空交易契約金額淨額(千元),'
+             '多方未平倉口數,多方未平倉契約金額(千元),空方未平倉口數,空方未平倉契約金額(千元),'
+             '多空未平倉口數淨額,多空未平倉契約金額淨額(千元)']
+    for date, products in POSITIONS.items():
+        for product, identities in products.items():
+            for identity, (oi_long, oi_short) in identities.items():
+                cells = [date, product, '外資及陸資' if identity == '外資' else identity]
+                cells += [c.replace(',', '') for c in _row(oi_long, oi_short)]
+                lines.append(','.join(cells))
+    return '\n'.join(lines)
+
+
+def make_html(date):
+    """futContractsDate 的表格: 第一列 15 欄 (序號, 商品, 身份...), 後兩列 13 欄"""
+    rows = []
+    for seq, (product, identities) in enumerate(POSITIONS[date].items(), 1):
+        for j, (identity, (oi_long, oi_short)) in enumerate(identities.items()):
+            cells = ([str(seq), product] if j == 0 else []) + [identity] + _row(oi_long, oi_short)
+            rows.append('<tr>' + ''.join(f'<td>{c}</td>' for c in cells) + '</tr>')
+    return '<html><table>' + ''.join(rows) + '</table></html>'
+
+
+class FakeResponse:
+    def __init__(self, text):
+        self.text = text
+        self.content = text.encode('cp950')
+
+    def raise_for_status(self):
+        pass
+
+
+def test_parse_positions_csv():
+    parsed = TAIFEXScraper().parse_positions_csv(make_csv())
+    assert sorted(parsed) == sorted(POSITIONS)
+    tx = parsed['2026/02/05']['TX']
+    assert tx['foreign'] == {'long': 40000, 'short': 70000, 'net': -30000}
+    assert tx['dealers'] == {'long': 9000, 'short': 12000, 'net': -3000}
+    assert parsed['2026/02/06']['MXF']['trusts'] == {'long': 10, 'short': 0, 'net': 10}
+
+
+def test_range_matches_daily_html(monkeypatch):
+    scraper = TAIFEXScraper()
+    posts = []
+
+    def fake_post(url, data=None, **kwargs):
+        posts.append(data)
+        return FakeResponse(make_csv())
+
+    def fake_get(url, params=None, **kwargs):
+        return FakeResponse(make_html(params['queryStartDate']))
+
+    monkeypatch.setattr(scraper_taifex.requests, 'post', fake_post)
+    monkeypatch.setattr(scraper_taifex.requests, 'get', fake_get)
+
+    results = scraper.get_retail_ratio_range(datetime(2026, 2, 5), datetime(2026, 2, 6))
+    assert len(posts) == 1
+
+    for date in POSITIONS:
+        for cid in ('TX', 'MXF'):
+            daily = scraper.get_retail_ratio(date, cid)
+            bulk = results[date][cid]
+            for key in ('total_oi', 'dealers', 'trusts', 'foreign', 'institutional_net',
+                        'retail_long', 'retail_short', 'retail_net', 'retail_ratio'):
+                assert bulk[key] == daily[key], (date, cid, key)
+
+
+def test_range_is_split_into_chunks(monkeypatch):
+    posts = []
+
+    def fake_post(url, data=None, **kwargs):
+        posts.append((data['queryStartDate'], data['queryEndDate']))
+        return FakeResponse('')
+
+    monkeypatch.setattr(scraper_taifex.requests, 'post', fake_post)
+    TAIFEXScraper().get_positions_range(datetime(2026, 1, 1), datetime(2026, 3, 15))
+    assert posts == [('2026/01/01', '2026/01/31'), ('2026/02/01', '2026/03/03'),
+                     ('2026/03/04', '2026/03/15')]
@@ -8,11 +8,13 @@ trading_day.py 單元測試
 - 週末:    2026/04/11 (週六)
 - 週末:    2026/04/12 (週日)
 
+FMTQIK 以整月為單位 mock,「今天」固定為 2026/05/20。
+
 Run: python -m pytest test_trading_day.py -v
 """
 import json
 import tempfile
-from datetime import date
+from datetime import date, datetime, timedelta
 from pathlib import Path
 from unittest.mock import patch, MagicMock
 
@@ -20,92 +22,182 @@ import pytest
 
 import trading_day
 
+NOW = datetime(2026, 5, 20, 18, 0)
+HOLIDAYS = {date(2026, 4, 2), date(2026, 4, 3), date(2026, 5, 1)}
+
+
+def month_days(year, month, through=None):
+    """假的 FMTQIK 整月資料: 週間扣掉 HOLIDAYS,到 through 為止"""
+    through = through or NOW.date()
+    d = date(year, month, 1)
+    days = []
+    while d.month == month and d <= through:
+        if d.weekday() < 5 and d not in HOLIDAYS:
+            days.append(d)
+        d += timedelta(days=1)
+    return days
+
 
 @pytest.fixture
 def temp_cache(monkeypatch):
-    """每個測試用獨立的臨時快取,避免互相干擾"""
+    """每個測試用獨立的臨時快取與日曆,避免互相干擾"""
     with tempfile.TemporaryDirectory() as tmpdir:
         cache_path = Path(tmpdir) / "trading_days.json"
         monkeypatch.setattr(trading_day, "CACHE_PATH", cache_path)
+        monkeypatch.setattr(trading_day, "_calendar", None)
+        monkeypatch.setattr(trading_day, "_now", lambda: NOW)
         yield cache_path
 
 
-def test_weekend_saturday_returns_false(temp_cache):
+@pytest.fixture
+def fake_fetch(temp_cache):
+    with patch.object(trading_day, "_fetch_month", side_effect=month_days) as mock_fetch:
+        yield mock_fetch
+
+
+def test_weekend_saturday_returns_false(fake_fetch):
     """週六不打 API,直接回傳 False"""
-    with patch.object(trading_day, "_query_twse_index") as mock_query:
-        result = trading_day.is_trading_day(date(2026, 4, 11))  # 週六
-        assert result is False
-        mock_query.assert_not_called()
+    assert trading_day.is_trading_day(date(2026, 4, 11)) is False  # 週六
+    fake_fetch.assert_not_called()
 
 
-def test_weekend_sunday_returns_false(temp_cache):
+def test_weekend_sunday_returns_false(fake_fetch):
     """週日不打 API,直接回傳 False"""
-    with patch.object(trading_day, "_query_twse_index") as mock_query:
-        result = trading_day.is_trading_day(date(2026, 4, 12))  # 週日
-        assert result is False
-        mock_query.assert_not_called()
-
-
-def test_trading_day_hits_api_and_caches(temp_cache):
-    """交易日第一次查 API,第二次用快取"""
-    with patch.object(trading_day, "_query_twse_index", return_value=True) as mock_query:
-        # 第一次
-        assert trading_day.is_trading_day(date(2026, 4, 1)) is True
-        assert mock_query.call_count == 1
-        
-        # 第二次應該命中快取
-        assert trading_day.is_trading_day(date(2026, 4, 1)) is True
-        assert mock_query.call_count == 1  # 沒有再打 API
-        
-    # 確認快取檔存在且內容正確
-    assert temp_cache.exists()
-    with open(temp_cache) as f:
-        cache = json.load(f)
-    assert cache == {"2026-04-01": True}
+    assert trading_day.is_trading_day(date(2026, 4, 12)) is False  # 週日
+    fake_fetch.assert_not_called()
+
 
+def test_whole_month_fetched_once_and_cached(fake_fetch, temp_cache):
+    """同一個月只打一次 API,之後 (含新行程讀快取檔) 都不再查詢"""
+    assert trading_day.is_trading_day(date(2026, 4, 1)) is True
+    assert trading_day.is_trading_day(date(2026, 4, 2)) is False   # 兒童節
+    assert trading_day.is_trading_day(date(2026, 4, 30)) is True
+    assert fake_fetch.call_count == 1
 
-def test_holiday_cached_as_false(temp_cache):
-    """休市日 (國定假日) 結果要寫入快取"""
-    with patch.object(trading_day, "_query_twse_index", return_value=False):
-        result = trading_day.is_trading_day(date(2026, 4, 2))  # 兒童節
-        assert result is False
-    
     with open(temp_cache) as f:
         cache = json.load(f)
-    assert cache["2026-04-02"] is False
+    assert cache["months"]["2026-04"]["days"][0] == "2026-04-01"
+    assert "2026-04-02" not in cache["months"]["2026-04"]["days"]
+
+    # 模擬新行程: 只讀快取檔
+    trading_day._calendar = None
+    assert trading_day.is_trading_day(date(2026, 4, 7)) is True
+    assert fake_fetch.call_count == 1
 
 
 def test_api_failure_returns_false_without_caching(temp_cache):
     """API 失敗時回傳 False,但不寫快取(下次會重試)"""
-    with patch.object(trading_day, "_query_twse_index", return_value=None):
-        result = trading_day.is_trading_day(date(2026, 4, 15))
-        assert result is False
-    
-    # 不應該有快取檔,或快取裡不該有這個日期
-    if temp_cache.exists():
-        with open(temp_cache) as f:
-            cache = json.load(f)
-        assert "2026-04-15" not in cache
-
-
-def test_default_date_is_today(temp_cache):
+    with patch.object(trading_day, "_fetch_month", return_value=None):
+        assert trading_day.is_trading_day(date(2026, 4, 15)) is False
+        assert trading_day.latest_trading_day(date(2026, 4, 15)) is None
+    assert not temp_cache.exists()
+
+    trading_day._calendar = None
+    with patch.object(trading_day, "_fetch_month", side_effect=month_days) as mock_fetch:
+        assert trading_day.is_trading_day(date(2026, 4, 15)) is True
+        assert mock_fetch.call_count == 1
+
+
+def test_legacy_cache_is_rebuilt(fake_fetch, temp_cache):
+    """舊版逐日快取格式直接捨棄,改抓整月"""
+    temp_cache.write_text(json.dumps({"2026-04-01": True}))
+    assert trading_day.is_trading_day(date(2026, 4, 1)) is True
+    assert fake_fetch.call_count == 1
+    assert json.loads(temp_cache.read_text())["version"] == trading_day.CACHE_VERSION
+
+
+def test_default_date_is_today(fake_fetch):
     """不傳參數時應該用今天"""
-    with patch.object(trading_day, "_query_twse_index", return_value=True) as mock_query:
-        trading_day.is_trading_day()
-        # 被呼叫時的日期應該是今天
-        called_date = mock_query.call_args[0][0]
-        assert called_date == date.today()
+    assert trading_day.is_trading_day() is True
+    assert fake_fetch.call_args[0] == (2026, 5)
+
+
+def test_previous_and_latest_cross_month_and_holidays(fake_fetch):
+    assert trading_day.previous_trading_day(date(2026, 4, 6)) == date(2026, 4, 1)   # 跳過連假與週末
+    assert trading_day.previous_trading_day(date(2026, 5, 4)) == date(2026, 4, 30)  # 5/1 勞動節跨月
+    assert trading_day.latest_trading_day(date(2026, 4, 4)) == date(2026, 4, 1)
+    assert trading_day.latest_trading_day(date(2026, 4, 1)) == date(2026, 4, 1)
+    assert trading_day.latest_trading_day() == date(2026, 5, 20)
+    assert fake_fetch.call_count == 2
+
+
+def test_next_trading_day(fake_fetch):
+    assert trading_day.next_trading_day(date(2026, 4, 1)) == date(2026, 4, 6)
+    assert trading_day.next_trading_day(date(2026, 4, 30)) == date(2026, 5, 4)
+    # 今天之後的交易日 TWSE 還沒有資料
+    assert trading_day.next_trading_day(date(2026, 5, 20)) is None
+
+
+def test_trading_days_between(fake_fetch):
+    days = trading_day.trading_days_between(date(2026, 3, 30), date(2026, 4, 8))
+    assert days == [date(2026, 3, 30), date(2026, 3, 31), date(2026, 4, 1),
+                    date(2026, 4, 6), date(2026, 4, 7), date(2026, 4, 8)]
+    assert fake_fetch.call_count == 2
+
+
+def test_recent_trading_days_and_datetime_input(fake_fetch):
+    """收集器用: 最近 N 個交易日 (新到舊);datetime 參數也能用"""
+    assert trading_day.recent_trading_days(2) == [date(2026, 5, 20), date(2026, 5, 19)]
+    assert trading_day.recent_trading_days(2, datetime(2026, 5, 4, 10, 0)) == [
+        date(2026, 5, 4), date(2026, 4, 30)]
+    assert trading_day.is_trading_day(datetime(2026, 4, 2, 15, 0)) is False
+
+
+def test_preload_year_fetches_each_month_once(fake_fetch):
+    count = trading_day.get_calendar().preload(2026)
+    assert fake_fetch.call_count == 5   # 1~5 月,未來月份不查
+    assert count == sum(len(month_days(2026, m)) for m in range(1, 6))
+    trading_day.trading_days_between(date(2026, 1, 1), date(2026, 5, 19))
+    assert fake_fetch.call_count == 5
+
+
+def test_current_month_refreshes_after_data_date(temp_cache, monkeypatch):
+    """當月資料抓取時尚未收盤 → 當日暫視為休市,REFRESH_INTERVAL 後再查"""
+    monkeypatch.setattr(trading_day, "_now", lambda: datetime(2026, 5, 20, 9, 0))
+    with patch.object(trading_day, "_fetch_month",
+                      side_effect=lambda y, m: month_days(y, m, date(2026, 5, 19))) as mock_fetch:
+        assert trading_day.is_trading_day(date(2026, 5, 20)) is False
+        assert trading_day.is_trading_day(date(2026, 5, 20)) is False
+        assert mock_fetch.call_count == 1   # 節流期間不重查
+
+    monkeypatch.setattr(trading_day, "REFRESH_INTERVAL", 0)
+    monkeypatch.setattr(trading_day, "_now", lambda: NOW)
+    with patch.object(trading_day, "_fetch_month", side_effect=month_days) as mock_fetch:
+        assert trading_day.is_trading_day(date(2026, 5, 20)) is True
+        assert mock_fetch.call_count == 1
+        # 5/19 已定案,不再查
+        assert trading_day.is_trading_day(date(2026, 5, 19)) is True
+        assert mock_fetch.call_count == 1
+
+
+def test_empty_refresh_keeps_known_month(temp_cache, monkeypatch):
+    """當月重查遇到 stat 非 OK (回傳空 list) → 保留已知交易日,不當成整月休市"""
+    monkeypatch.setattr(trading_day, "_now", lambda: datetime(2026, 5, 20, 9, 0))
+    with patch.object(trading_day, "_fetch_month",
+                      side_effect=lambda y, m: month_days(y, m, date(2026, 5, 19))):
+        assert trading_day.is_trading_day(date(2026, 5, 19)) is True
+
+    monkeypatch.setattr(trading_day, "REFRESH_INTERVAL", 0)
+    monkeypatch.setattr(trading_day, "_now", lambda: NOW)
+    with patch.object(trading_day, "_fetch_month", return_value=[]) as mock_fetch:
+        assert trading_day.is_trading_day(date(2026, 5, 20)) is False   # 無法判斷,保守視為休市
+        assert mock_fetch.call_count == 1
+        assert trading_day.is_trading_day(date(2026, 5, 19)) is True
+        assert trading_day.latest_trading_day(date(2026, 5, 20)) == date(2026, 5, 19)
+
+    with open(temp_cache) as f:
+        assert "2026-05-19" in json.load(f)["months"]["2026-05"]["days"]
 
 
 def test_require_trading_day_decorator_skips_on_holiday(temp_cache):
     """@require_trading_day 在休市日應該跳過函式執行"""
     calls = []
-    
+
     @trading_day.require_trading_day
     def my_scanner():
         calls.append("executed")
         return "result"
-    
+
     with patch.object(trading_day, "is_trading_day", return_value=False):
         result = my_scanner()
         assert result is None
@@ -117,27 +209,30 @@ def test_require_trading_day_decorator_runs_on_trading_day(temp_cache):
     @trading_day.require_trading_day
     def my_scanner():
         return "scanned"
-    
+
     with patch.object(trading_day, "is_trading_day", return_value=True):
         result = my_scanner()
         assert result == "scanned"
 
 
 def test_roc_date_format_parsing(temp_cache):
-    """驗證民國年格式組裝正確: 2026/04/18 → 115/04/18"""
+    """驗證民國年格式解析正確: 115/04/18 → 2026/04/18,並以月初日期查詢"""
     mock_response = MagicMock()
     mock_response.json.return_value = {
         "stat": "OK",
         "data": [
+            ["115/04/21", "20150", "20300", "20100", "20250"],
             ["115/04/17", "20000", "20100", "19900", "20050"],
             ["115/04/18", "20050", "20200", "20000", "20150"],
-            ["115/04/21", "20150", "20300", "20100", "20250"],
         ],
     }
     mock_response.raise_for_status = MagicMock()
-    
+
+    with patch.object(trading_day.requests, "get", return_value=mock_response) as mock_get:
+        days = trading_day._fetch_month(2026, 4)
+    assert days == [date(2026, 4, 17), date(2026, 4, 18), date(2026, 4, 21)]
+    assert mock_get.call_args.kwargs["params"]["date"] == "20260401"
+
+    mock_response.json.return_value = {"stat": "很抱歉，沒有符合條件的資料!"}
     with patch.object(trading_day.requests, "get", return_value=mock_response):
-        # 有資料的日期
-        assert trading_day._query_twse_index(date(2026, 4, 18)) is True
-        # 沒有資料的日期 (假設是 4/20,週一但沒出現在 data 中)
-        assert trading_day._query_twse_index(date(2026, 4, 20)) is False
+        assert trading_day._fetch_month(2026, 12) == []
@@ -0,0 +1,285 @@
+"""
+twse_json.py 單元測試 + 解析效能/記憶體比較
+
+黃金測試: 各收集器原本的 resp.json() + 逐格 replace/float 寫法當參考答案，
+確認串流解析結果一致。測試 payload 依 TWSE / TPEx 實際格式產生，大小與真實回應同一量級。
+
+Run: python -m pytest test_twse_json.py -v
+Bench: python test_twse_json.py [已存的 payload.json ...]
+"""
+import io
+import json
+import math
+import os
+import random
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import numpy as np
+import pytest
+
+import twse_json
+
+
+# ============================================================
+# 測試 payload
+# ============================================================
+def _num(x, digits=2):
+    return f"{x:,.{digits}f}"
+
+
+def mi_index_payload(stocks=1500, seed=1):
+    """rwd MI_INDEX type=ALL: tables[0..7] 為指數/統計小表，tables[8] 為每日收盤行情"""
+    rng = random.Random(seed)
+    tables = []
+    for t in range(8):
+        tables.append({
+            "title": f"115年04月17日 價格指數(臺灣證券交易所) {t}",
+            "fields": ["指數", "收盤指數", "漲跌(+/-)", "漲跌點數", "漲跌百分比(%)", "特殊處理註記"],
+            "data": [[f"指數{i}", _num(rng.uniform(100, 30000)), "<p style ='color:red'>+</p>",
+                      _num(rng.uniform(0, 100)), _num(rng.uniform(0, 3)), ""] for i in range(30)],
+            "notes": ["說明 \"data\": 不是欄位"],
+        })
+    rows = []
+    for i in range(stocks):
+        close = rng.uniform(5, 1200)
+        change = rng.uniform(0, close * 0.1)
+        sign = rng.choice(["<p style= color:red>+</p>", "<p style= color:green>-</p>", " ", "X"])
+        traded = rng.random() > 0.05
+        rows.append([
+            f"{1101 + i}", f"股票{i}",
+            _num(rng.randint(0, 80_000_000), 0), _num(rng.randint(0, 90_000), 0),
+            _num(rng.randint(0, 9_000_000_000), 0),
+            _num(close) if traded else "--", _num(close * 1.02) if traded else "--",
+            _num(close * 0.98) if traded else "--", _num(close) if traded else "--",
+            sign, _num(change) if sign != " " else "0.00",
+            _num(close * 0.999), _num(rng.randint(1, 500), 0),
+            _num(close * 1.001), _num(rng.randint(1, 500), 0),
+            _num(rng.uniform(5, 60)) if rng.random() > 0.2 else "0.00",
+        ])
+    tables.append({
+        "title": "115年04月17日 每日收盤行情(全部)",
+        "fields": ["證券代號", "證券名稱", "成交股數", "成交筆數", "成交金額", "開盤價", "最高價",
+                   "最低價", "收盤價", "漲跌(+/-)", "漲跌價差", "最後揭示買價", "最後揭示買量",
+                   "最後揭示賣價", "最後揭示賣量", "本益比"],
+        "data": rows,
+        "hints": "符號說明:+/-/X表示漲/跌/不比價",
+    })
+    return json.dumps({"tables": tables, "params": {"date": "20260417", "type": "ALL"},
+                       "stat": "OK", "date": "20260417"}, ensure_ascii=False)
+
+
+def stock_day_all_payload(stocks=1200, seed=2):
+    rng = random.Random(seed)
+    rows = []
+    for i in range(stocks):
+        close = rng.uniform(5, 1200)
+        change = rng.uniform(-close * 0.1, close * 0.1)
+        traded = rng.random() > 0.05
+        rows.append([
+            f"{1101 + i}", f"股票{i}",
+            _num(rng.randint(0, 80_000_000), 0), _num(rng.randint(0, 9_000_000_000), 0),
+            _num(close) if traded else "", _num(close * 1.02) if traded else "",
+            _num(close * 0.98) if traded else "", _num(close) if traded else "",
+            rng.choice([f"{change:+.2f}", "X0.00", "0.00"]) if traded else "",
+            _num(rng.randint(0, 90_000), 0),
+        ])
+    return json.dumps({"stat": "OK", "date": "20260417", "title": "115年04月17日 全部",
+                       "fields": ["證券代號", "證券名稱", "成交股數", "成交金額", "開盤價", "最高價",
+                                  "最低價", "收盤價", "漲跌價差", "成交筆數"],
+                       "data": rows, "total": len(rows)}, ensure_ascii=False)
+
+
+def tpex_payload(stocks=900, seed=3):
+    rng = random.Random(seed)
+    rows = []
+    for i in range(stocks):
+        close = rng.uniform(5, 800)
+        rows.append({
+            "Date": "1150417", "SecuritiesCompanyCode": f"{3100 + i}", "CompanyName": f"上櫃{i}",
+            "Close": f"{close:.2f}" if rng.random() > 0.05 else "---",
+            "Change": rng.choice([f"{rng.uniform(-5, 5):+.2f}", "0.00", "X0.00"]),
+            "Open": f"{close:.2f}", "High": f"{close * 1.03:.2f}", "Low": f"{close * 0.97:.2f}",
+            "Average": f"{close:.2f}", "TradingShares": str(rng.randint(0, 9_000_000)),
+            "TransactionAmount": str(rng.randint(0, 900_000_000)),
+            "TransactionNumber": str(rng.randint(0, 9000)),
+        })
+    return json.dumps(rows, ensure_ascii=False)
+
+
+# ============================================================
+# 參考實作（原本 resp.json() + 逐格轉換）
+# ============================================================
+def ref_float(s):
+    s = str(s).replace(',', '').strip()
+    try:
+        return float(s)
+    except ValueError:
+        return math.nan
+
+
+def ref_mi_index(text):
+    data = json.loads(text)
+    for table in data['tables']:
+        if '每日收盤行情' in table.get('title', ''):
+            out = {}
+            for row in table['data']:
+                sign = math.nan if 'X' in row[9] else -1 if '-' in row[9] else (1 if '+' in row[9] else 0)
+                out[row[0].strip()] = (ref_float(row[8]), sign * ref_float(row[10]), ref_float(row[2]))
+            return data['stat'], out
+
+
+def ref_stock_day_all(text):
+    data = json.loads(text)
+    return data['stat'], data['date'], {
+        row[0].strip(): (ref_float(row[7]), ref_float(row[8]), ref_float(row[3]))
+        for row in data['data']}
+
+
+def ref_tpex(text):
+    return {item['SecuritiesCompanyCode']: (ref_float(item['Close']), ref_float(item['Change']))
+            for item in json.loads(text)}
+
+
+def _same(a, b):
+    return (math.isnan(a) and math.isnan(b)) or a == pytest.approx(b, rel=1e-12)
+
+
+# ============================================================
+# 黃金測試
+# ============================================================
+@pytest.fixture(params=[64 * 1024, 97])
+def chunk_size(request, monkeypatch):
+    """正常區塊與很小的區塊（列、數字、中文字都會被切斷）"""
+    monkeypatch.setattr(twse_json, "CHUNK_SIZE", request.param)
+    monkeypatch.setattr(twse_json, "ROW_BATCH", 50)
+    return request.param
+
+
+def test_mi_index_matches_reference(chunk_size):
+    text = mi_index_payload(300)
+    stat, ref = ref_mi_index(text)
+    meta, q = twse_json.parse_mi_index_quotes(text.encode('utf-8'))
+    assert meta['stat'] == stat and meta['date'] == '20260417'
+    assert len(meta['tables']) == 9 and meta['tables'][8]['data'] == []
+    assert len(meta['tables'][0]['data']) == 30
+    assert list(q['code']) == list(ref)
+    for i, code in enumerate(q['code']):
+        close, change, volume = ref[code]
+        assert _same(q['close'][i], close) and _same(q['change'][i], change) and q['volume'][i] == volume
+    assert q['close'].dtype == np.float64 and q['code'].dtype.kind == 'U'
+
+
+def test_stock_day_all_matches_reference(chunk_size):
+    text = stock_day_all_payload(300)
+    stat, day, ref = ref_stock_day_all(text)
+    meta, q = twse_json.parse_stock_day_all(io.BytesIO(text.encode('utf-8')))
+    assert (meta['stat'], meta['date'], meta['total']) == (stat, day, 300)
+    assert list(q['code']) == list(ref)
+    for i, code in enumerate(q['code']):
+        close, change, value = ref[code]
+        assert _same(q['close'][i], close) and _same(q['change'][i], change) and q['value'][i] == value
+    np.testing.assert_allclose(q['prev_close'], q['close'] - q['change'])
+
+
+def test_tpex_matches_reference(chunk_size):
+    text = tpex_payload(200)
+    ref = ref_tpex(text)
+    meta, q = twse_json.parse_tpex_daily_close(text)
+    assert meta['date'] == '1150417'
+    assert list(q['code']) == list(ref)
+    for i, code in enumerate(q['code']):
+        assert _same(q['close'][i], ref[code][0]) and _same(q['change'][i], ref[code][1])
+
+
+def test_falls_back_when_title_follows_data():
+    """表格的 title 在 data 之後（非預期順序）時退回整份解析"""
+    doc = json.loads(mi_index_payload(20))
+    doc['tables'] = [{k: t[k] for k in ('data', 'fields', 'title')} for t in doc['tables']]
+    meta, q = twse_json.parse_mi_index_quotes(json.dumps(doc, ensure_ascii=False))
+    assert len(q['code']) == 20
+    assert meta['tables'][8]['data'][0][0] == '1101'
+
+
+def test_error_and_empty_payloads():
+    meta, q = twse_json.parse_stock_day_all('{"stat": "很抱歉，沒有符合條件的資料!"}')
+    assert meta['stat'] != 'OK' and len(q['close']) == 0
+    meta, q = twse_json.parse_stock_day_all(b'')
+    assert meta == {} and len(q['code']) == 0
+    meta, q = twse_json.parse_tpex_daily_close('[]')
+    assert meta['date'] is None and len(q['code']) == 0
+
+
+def test_field_selection():
+    text = mi_index_payload(50)
+    _, full = twse_json.parse_mi_index_quotes(text)
+    _, part = twse_json.parse_mi_index_quotes(text, fields=['code', 'prev_close'])
+    assert sorted(part) == ['code', 'prev_close']
+    np.testing.assert_array_equal(part['prev_close'], full['prev_close'])
+    with pytest.raises(KeyError):
+        twse_json.parse_stock_day_all(text, fields=['nope'])
+
+
+def test_short_rows_are_padded():
+    meta, q = twse_json.parse_stock_day_all('{"stat":"OK","data":[["1101","台泥","1,000"]]}')
+    assert q['code'][0] == '1101' and q['volume'][0] == 1000 and math.isnan(q['close'][0])
+
+
+# ============================================================
+# 效能 / 記憶體比較
+# ============================================================
+def _measure(fn, repeat=3):
+    best = float('inf')
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - t0)
+    tracemalloc.start()
+    fn()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return best, peak
+
+
+def bench(label, path, ref, new, fields):
+    size = os.path.getsize(path)
+    print(f"\n📄 {label} ({size / 1024 / 1024:.1f} MB)")
+
+    def old():
+        # resp.json(): 整份 content 進記憶體後展開
+        with open(path, 'rb') as f:
+            return ref(f.read().decode('utf-8'))
+
+    def streamed():
+        with open(path, 'rb') as f:
+            return new(f, fields=fields)
+
+    t_old, m_old = _measure(old)
+    t_new, m_new = _measure(streamed)
+    print(f"  {'resp.json() + 逐格轉換 (舊)':<30s} {t_old * 1000:8.1f} ms  峰值 {m_old / 1024 / 1024:6.1f} MB")
+    print(f"  {'twse_json 串流 (新)':<30s} {t_new * 1000:8.1f} ms  峰值 {m_new / 1024 / 1024:6.1f} MB")
+    print(f"  {'加速 / 記憶體':<30s} {t_old / t_new:8.1f} x  {m_old / m_new:9.1f} x")
+
+
+if __name__ == '__main__':
+    # 與參考實作取相同欄位
+    parsers = {'mi_index': (ref_mi_index, twse_json.parse_mi_index_quotes, ['code', 'close', 'change', 'volume']),
+               'stock_day_all': (ref_stock_day_all, twse_json.parse_stock_day_all, ['code', 'close', 'change', 'value']),
+               'tpex': (ref_tpex, twse_json.parse_tpex_daily_close, ['code', 'close', 'change'])}
+    if len(sys.argv) > 1:
+        # 已存的真實 payload: 依檔名判斷格式 (mi_index*.json / stock_day_all*.json / tpex*.json)
+        for path in sys.argv[1:]:
+            kind = next(k for k in parsers if os.path.basename(path).lower().startswith(k))
+            bench(os.path.basename(path), path, *parsers[kind])
+    else:
+        with tempfile.TemporaryDirectory() as tmpdir:
+            fixtures = {'mi_index': mi_index_payload(20000),
+                        'stock_day_all': stock_day_all_payload(15000),
+                        'tpex': tpex_payload(12000)}
+            for kind, text in fixtures.items():
+                path = os.path.join(tmpdir, f'{kind}.json')
+                with open(path, 'w', encoding='utf-8') as f:
+                    f.write(text)
+                bench(kind, path, *parsers[kind])
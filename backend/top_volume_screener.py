@@ -16,6 +16,12 @@ from datetime import datetime, timedelta
 from bs4 import BeautifulSoup
 import re
 
+import numpy as np
+
+from indicators import sma, volume_ratio
+from indicator_state import update_state, state_arrays
+from kline_history_manager import ensure_kline_data, get_csv_path
+
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 DATA_DIR = os.path.join(BASE_DIR, 'data')
 DB_PATH  = os.path.join(BASE_DIR, 'stock_data.db')
@@ -181,11 +187,45 @@ def fetch_twse_top30_fallback():
 # Yahoo Finance K線快取（避免重複爬）
 _yahoo_cache = {}
 
+def load_store_kline(stock_code):
+    """
+    K 線庫已有這檔時：補到當日、推進增量指標，直接取 MA20 / 量比
+    回傳格式同 fetch_yahoo_kline；K 線庫沒有或資料不足回傳 None
+    """
+    if not get_csv_path(stock_code).exists():
+        return None
+    status = ensure_kline_data(stock_code, years=1, verbose=False, max_stale_days=0)
+    if status['status'] == 'failed':
+        return None
+    state = update_state(stock_code)
+    if state is None or state['count'] < 20:
+        return None
+    
+    arrays = state_arrays(state)
+    closes = arrays['close'][-60:]
+    volumes = arrays['volume'][-60:]
+    vol_ratio = float(volume_ratio(volumes, 1, 20)[-1])
+    return {
+        'price':        float(closes[-1]),
+        'ma20':         round(float(arrays['ma20'][-1]), 2),
+        'volume_ratio': 0 if np.isnan(vol_ratio) else round(vol_ratio, 2),
+        'vol_rising':   bool(volumes[-1] > volumes[-2] > volumes[-3]),
+        'closes':       closes.tolist(),
+        'volumes':      volumes.tolist(),
+    }
+
+
 def fetch_yahoo_kline(stock_code, days=30):
     """爬 Yahoo Finance 取個股K線（含MA20/volume_ratio計算）"""
     if stock_code in _yahoo_cache:
         return _yahoo_cache[stock_code]
     
+    # K 線庫有資料就用增量指標，不必再抓 60 天重算
+    stored = load_store_kline(stock_code)
+    if stored:
+        _yahoo_cache[stock_code] = stored
+        return stored
+    
     ticker = stock_code + '.TW'
     url = f'https://query1.finance.yahoo.com/v8/finance/chart/{ticker}?interval=1d&range=60d'
     try:
@@ -204,12 +244,15 @@ def fetch_yahoo_kline(stock_code, days=30):
             _yahoo_cache[stock_code] = {}
             return {}
         
-        # 計算 MA20
-        ma20 = sum(closes[-20:]) / min(len(closes), 20)
+        # 計算 MA20（不足 20 日用全部資料）
+        ma20 = float(sma(closes, min(len(closes), 20))[-1])
         
         # volume_ratio：今日量 / 近20日均量
-        avg_vol = sum(volumes[-20:]) / min(len(volumes), 20) if volumes else 0
-        vol_ratio = volumes[-1] / avg_vol if avg_vol > 0 else 0
+        vol_ratio = 0
+        if volumes:
+            vol_ratio = float(volume_ratio(volumes, 1, min(len(volumes), 20))[-1])
+            if np.isnan(vol_ratio):
+                vol_ratio = 0
         
         # 近3日量是否持續上揚
         vol_rising = len(volumes) >= 3 and volumes[-1] > volumes[-2] > volumes[-3]
@@ -237,24 +280,6 @@ def load_institutional_from_db(stock_code, days=5):
     return []
 
 
-def calc_ema(prices, period):
-    """計算 EMA"""
-    if len(prices) < period:
-        return []
-    k = 2 / (period + 1)
-    emas = [sum(prices[:period]) / period]
-    for p in prices[period:]:
-        emas.append(p * k + emas[-1] * (1 - k))
-    return emas
-
-
-def calc_ma(values, period):
-    """計算 MA（移動平均）"""
-    if len(values) < period:
-        return []
-    return [sum(values[i:i+period]) / period for i in range(len(values) - period + 1)]
-
-
 # ─────────────────────────────────────────
 # 3. 六條件判斷邏輯
 # ─────────────────────────────────────────
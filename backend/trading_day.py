@@ -1,20 +1,33 @@
 """
-交易日判斷工具
+交易日判斷工具 (交易日曆)
 
-以 TWSE 大盤指數 (TAIEX) 當日有無資料為唯一判斷依據。
+以 TWSE 每日市場成交資訊 (FMTQIK) 當日有無資料為唯一判斷依據。
 這種做法可以自動處理國定假日、颱風臨時休市等所有情況。
 
+FMTQIK 一次回傳整個月的交易日,所以以「月」為單位抓取並快取,
+查詢時全部由記憶體中的排序日期陣列回答 (bisect),同一個月只打一次 API。
+已結束的月份永久快取;當月份在資料日之後才重新查詢 (最多每 REFRESH_INTERVAL 秒一次)。
+
 Usage:
-    from backend.utils.trading_day import is_trading_day
-    
+    from trading_day import is_trading_day, previous_trading_day, latest_trading_day
+
     if is_trading_day():
         run_scanners()
+
+    latest_trading_day()                      # TWSE 已發布資料的最近交易日
+    previous_trading_day(date(2026, 4, 7))    # 前一個交易日
+    recent_trading_days(2)                    # [最近交易日, 前一交易日]
+    trading_days_between(date(2026, 1, 1), date(2026, 3, 31))
 """
+import bisect
 import json
 import logging
-from datetime import date, datetime
+import os
+import threading
+import time
+from datetime import date, datetime, timedelta
 from pathlib import Path
-from typing import Optional
+from typing import List, Optional
 
 import requests
 
@@ -41,46 +54,57 @@ REQUEST_HEADERS = {
 # API 請求超時 (秒)
 REQUEST_TIMEOUT = 10
 
+# 當月份資料未定案時,同一個月最短重新查詢間隔 (秒)
+REFRESH_INTERVAL = 600
 
-def _load_cache() -> dict:
-    """讀取快取檔;損毀或不存在時回傳空字典"""
-    if not CACHE_PATH.exists():
-        return {}
-    try:
-        with open(CACHE_PATH, "r", encoding="utf-8") as f:
-            return json.load(f)
-    except (json.JSONDecodeError, IOError) as e:
-        logger.warning(f"快取檔讀取失敗,將重建: {e}")
-        return {}
+# previous / latest 往回找的最多月份數 (春節連假最長也不會跨兩個月)
+MAX_LOOKBACK_MONTHS = 3
 
+CACHE_VERSION = 1
 
-def _save_cache(cache: dict) -> None:
-    """寫入快取檔,父目錄不存在時自動建立"""
-    CACHE_PATH.parent.mkdir(parents=True, exist_ok=True)
-    try:
-        with open(CACHE_PATH, "w", encoding="utf-8") as f:
-            json.dump(cache, f, ensure_ascii=False, indent=2, sort_keys=True)
-    except IOError as e:
-        logger.error(f"快取檔寫入失敗: {e}")
+
+def _now() -> datetime:
+    return datetime.now()
+
+
+def _today() -> date:
+    return _now().date()
+
+
+def _month_key(year: int, month: int) -> str:
+    return f"{year:04d}-{month:02d}"
+
+
+def _month_end(year: int, month: int) -> date:
+    if month == 12:
+        return date(year, 12, 31)
+    return date(year, month + 1, 1) - timedelta(days=1)
 
 
-def _query_twse_index(check_date: date) -> Optional[bool]:
+def _prev_month(year: int, month: int):
+    return (year - 1, 12) if month == 1 else (year, month - 1)
+
+
+def _next_month(year: int, month: int):
+    return (year + 1, 1) if month == 12 else (year, month + 1)
+
+
+def _fetch_month(year: int, month: int) -> Optional[List[date]]:
     """
-    向 TWSE FMTQIK API 查詢指定日期是否為交易日。
-    
+    向 TWSE FMTQIK API 查詢整個月的交易日。
+
     FMTQIK 回傳該月「每日市場成交資訊」,只要該日有成交就會出現。
     比個股或指數 API 更穩定 (大盤只要有開盤一定有成交)。
-    
+
     Returns:
-        True:   當日有資料 → 有開盤
-        False:  當月有其他交易日,但指定日期無資料 → 休市
-        None:   API 錯誤或當月完全無資料,無法判斷 (不應快取)
+        交易日 list (遞增):  查詢成功;當月尚無資料 (月初連假、未來月份) 時為空 list
+        None:                API 錯誤,無法判斷 (不應快取)
     """
     params = {
         "response": "json",
-        "date": check_date.strftime("%Y%m%d"),
+        "date": f"{year:04d}{month:02d}01",
     }
-    
+
     try:
         resp = requests.get(
             TWSE_FMTQIK_API,
@@ -91,73 +115,297 @@ def _query_twse_index(check_date: date) -> Optional[bool]:
         resp.raise_for_status()
         data = resp.json()
     except (requests.RequestException, ValueError) as e:
-        logger.error(f"TWSE API 查詢失敗 {check_date}: {e}")
+        logger.error(f"TWSE API 查詢失敗 {_month_key(year, month)}: {e}")
         return None
-    
+
     # stat 不是 "OK" 表示該月份無任何資料 (例如查詢未來月份)
     if data.get("stat") != "OK":
-        logger.warning(f"TWSE API 回應非 OK: {data.get('stat')}")
-        return None
-    
-    rows = data.get("data", [])
-    if not rows:
-        return None
-    
+        logger.info(f"TWSE FMTQIK {_month_key(year, month)} 無資料: {data.get('stat')}")
+        return []
+
     # 資料格式: [["115/04/18", "成交股數", "成交金額", "成交筆數", "發行量加權指數", "漲跌點數"], ...]
-    target_roc = f"{check_date.year - 1911}/{check_date.month:02d}/{check_date.day:02d}"
-    
-    for row in rows:
-        if row and row[0] == target_roc:
+    days = []
+    for row in data.get("data", []):
+        try:
+            roc_y, m, d = (int(x) for x in str(row[0]).strip().split("/"))
+            days.append(date(roc_y + 1911, m, d))
+        except (IndexError, ValueError):
+            continue
+    return sorted(days)
+
+
+class TradingCalendar:
+    """
+    交易日曆:以月為單位抓 FMTQIK,快取到 CACHE_PATH,查詢全部走記憶體。
+
+    一個月的資料在「抓取日 > 該日」時才算定案 (FMTQIK 當天收盤後才會有當日資料);
+    未定案的日期在 REFRESH_INTERVAL 之後才會重新查詢,期間視為休市 (保守)。
+    """
+
+    def __init__(self, cache_path: Path = None):
+        self.cache_path = cache_path or CACHE_PATH
+        self._months = {}        # "YYYY-MM" -> {"days": ["YYYY-MM-DD", ...], "fetched_at": ISO datetime}
+        self._days = []          # 所有已知交易日 (遞增排序的 date)
+        self._attempted = {}     # "YYYY-MM" -> 最近一次查詢的 time.monotonic()
+        self._loaded = False
+        self._dirty = False
+        self._lock = threading.RLock()
+
+    # ---------- 快取檔 ----------
+    def _load(self) -> None:
+        if self._loaded:
+            return
+        self._loaded = True
+        if not self.cache_path.exists():
+            return
+        try:
+            with open(self.cache_path, "r", encoding="utf-8") as f:
+                cache = json.load(f)
+        except (json.JSONDecodeError, IOError) as e:
+            logger.warning(f"快取檔讀取失敗,將重建: {e}")
+            return
+        if not isinstance(cache, dict) or cache.get("version") != CACHE_VERSION:
+            # 舊版逐日快取 {"2026-04-01": true, ...} 不含整月資訊,直接捨棄重抓
+            logger.info("交易日快取為舊格式,將以整月資料重建")
+            return
+        self._months = cache.get("months", {})
+        self._rebuild()
+
+    def _save(self) -> None:
+        """只在有新抓的月份時寫檔 (暫存檔 + replace,避免寫到一半被讀)"""
+        if not self._dirty:
+            return
+        self.cache_path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = self.cache_path.with_suffix(".json.tmp")
+        try:
+            with open(tmp, "w", encoding="utf-8") as f:
+                json.dump({"version": CACHE_VERSION, "months": self._months}, f,
+                          separators=(",", ":"), sort_keys=True)
+            os.replace(tmp, self.cache_path)
+            self._dirty = False
+        except IOError as e:
+            logger.error(f"快取檔寫入失敗: {e}")
+
+    def _rebuild(self) -> None:
+        self._days = sorted(
+            date.fromisoformat(d) for rec in self._months.values() for d in rec["days"]
+        )
+
+    # ---------- 月份資料 ----------
+    def _settled(self, rec: dict, through: date) -> bool:
+        """這筆月資料對 through (含) 以前的日期是否已定案"""
+        if not rec["days"]:
+            return False
+        return date.fromisoformat(rec["fetched_at"][:10]) > through
+
+    def _ensure_month(self, year: int, month: int, through: date) -> bool:
+        """
+        確保 (year, month) 到 through 為止的資料已定案,必要時查詢 API。
+
+        Returns: 這個月是否有可用資料 (False = API 失敗且沒有快取)
+        """
+        self._load()
+        key = _month_key(year, month)
+        rec = self._months.get(key)
+        through = min(through, _month_end(year, month))
+        if rec is not None and self._settled(rec, through):
             return True
-    
-    # 該月有資料,但沒找到指定日期 → 該日休市
-    return False
+        if date(year, month, 1) > _today():
+            # 未來月份:FMTQIK 不會有資料
+            return rec is not None
+
+        last = self._attempted.get(key)
+        if last is not None and time.monotonic() - last < REFRESH_INTERVAL:
+            return rec is not None
+
+        self._attempted[key] = time.monotonic()
+        days = _fetch_month(year, month)
+        if days is None:
+            return rec is not None
+        if not days and rec is not None and rec["days"]:
+            # 已知有交易日的月份不會變成空的:stat 非 OK (節流/暫時錯誤) 視為無法判斷,
+            # 保留原資料,不寫入快取
+            logger.warning(f"TWSE FMTQIK {key} 回傳空資料,沿用已知的 {len(rec['days'])} 個交易日")
+            return True
+
+        self._months[key] = {
+            "days": [d.isoformat() for d in days],
+            "fetched_at": _now().isoformat(timespec="seconds"),
+        }
+        self._dirty = True
+        self._rebuild()
+        return True
+
+    def _ensure_range(self, start: date, end: date) -> bool:
+        """確保 start~end 涵蓋的月份都已載入;全部成功才回傳 True"""
+        ok = True
+        year, month = start.year, start.month
+        while date(year, month, 1) <= end:
+            ok &= self._ensure_month(year, month, end)
+            year, month = _next_month(year, month)
+        return ok
+
+    # ---------- 查詢 ----------
+    def is_trading_day(self, check_date: date) -> bool:
+        # 週末快速路徑:不浪費 API 配額
+        if check_date.weekday() >= 5:  # 5=Sat, 6=Sun
+            return False
+        with self._lock:
+            self._load()
+            if self._contains(check_date):
+                return True
+            if not self._ensure_month(check_date.year, check_date.month, check_date):
+                logger.warning(f"{check_date} 無法判斷交易日,保守視為休市")
+            self._save()
+            return self._contains(check_date)
+
+    def latest_trading_day(self, on_or_before: date) -> Optional[date]:
+        """on_or_before (含) 以前最近的交易日;API 失敗時回傳 None"""
+        with self._lock:
+            try:
+                year, month = on_or_before.year, on_or_before.month
+                through = on_or_before
+                for _ in range(MAX_LOOKBACK_MONTHS):
+                    if not self._ensure_month(year, month, through):
+                        logger.warning(f"{_month_key(year, month)} 交易日資料無法取得")
+                        return None
+                    idx = bisect.bisect_right(self._days, through)
+                    if idx > 0 and self._days[idx - 1] >= date(year, month, 1):
+                        return self._days[idx - 1]
+                    year, month = _prev_month(year, month)
+                    through = _month_end(year, month)
+                return None
+            finally:
+                self._save()
+
+    def recent_trading_days(self, count: int, on_or_before: date) -> List[date]:
+        """on_or_before (含) 以前最近的 count 個交易日,新到舊"""
+        days = []
+        while len(days) < count:
+            day = self.latest_trading_day(on_or_before)
+            if day is None:
+                break
+            days.append(day)
+            on_or_before = day - timedelta(days=1)
+        return days
+
+    def previous_trading_day(self, check_date: date) -> Optional[date]:
+        """check_date 之前 (不含) 最近的交易日"""
+        return self.latest_trading_day(check_date - timedelta(days=1))
+
+    def next_trading_day(self, check_date: date) -> Optional[date]:
+        """check_date 之後 (不含) 最近的交易日;尚未發生 (TWSE 還沒資料) 時回傳 None"""
+        with self._lock:
+            try:
+                year, month = check_date.year, check_date.month
+                for _ in range(MAX_LOOKBACK_MONTHS):
+                    month_end = _month_end(year, month)
+                    if not self._ensure_month(year, month, month_end):
+                        return None
+                    idx = bisect.bisect_right(self._days, check_date)
+                    if idx < len(self._days) and self._days[idx] <= month_end:
+                        return self._days[idx]
+                    if month_end >= _today():
+                        return None
+                    year, month = _next_month(year, month)
+                return None
+            finally:
+                self._save()
+
+    def trading_days_between(self, start: date, end: date) -> List[date]:
+        """start ~ end (皆含) 之間的交易日,遞增排序"""
+        with self._lock:
+            if not self._ensure_range(start, end):
+                logger.warning(f"{start} ~ {end} 部分月份無法取得,結果可能不完整")
+            self._save()
+            lo = bisect.bisect_left(self._days, start)
+            hi = bisect.bisect_right(self._days, end)
+            return self._days[lo:hi]
+
+    def preload(self, start_year: int, end_year: int = None) -> int:
+        """一次抓齊整年 (到本月為止) 的交易日,回傳已知交易日數"""
+        end_year = end_year or start_year
+        end = min(date(end_year, 12, 31), _today())
+        with self._lock:
+            self._ensure_range(date(start_year, 1, 1), end)
+            self._save()
+            return len(self.trading_days_between(date(start_year, 1, 1), end))
+
+    def _contains(self, check_date: date) -> bool:
+        idx = bisect.bisect_left(self._days, check_date)
+        return idx < len(self._days) and self._days[idx] == check_date
+
+
+_calendar = None
+_calendar_lock = threading.Lock()
+
+
+def _as_date(value) -> date:
+    """None → 今天;datetime → date (date 與 datetime 不能互相比較)"""
+    if value is None:
+        return _today()
+    if isinstance(value, datetime):
+        return value.date()
+    return value
+
+
+def get_calendar() -> TradingCalendar:
+    """共用的交易日曆 (CACHE_PATH 改變時重建)"""
+    global _calendar
+    with _calendar_lock:
+        if _calendar is None or _calendar.cache_path != CACHE_PATH:
+            _calendar = TradingCalendar(CACHE_PATH)
+        return _calendar
 
 
 def is_trading_day(check_date: Optional[date] = None) -> bool:
     """
     判斷指定日期台股是否有開盤。
-    
+
     判斷順序:
     1. 週末直接回傳 False (不打 API)
-    2. 檢查快取
-    3. 打 TWSE API,結果寫入快取
+    2. 查記憶體中的交易日曆 (含快取檔)
+    3. 該月未載入或未定案時抓整個月的 FMTQIK,結果寫入快取
     4. API 失敗時保守回傳 False (不快取,下次重試)
-    
+
     Args:
         check_date: 要檢查的日期,預設為今天
-    
+
     Returns:
         True  = 當日有開盤
         False = 休市 / 週末 / 國定假日 / API 失敗
     """
-    if check_date is None:
-        check_date = date.today()
-    
-    # 週末快速路徑:不浪費 API 配額
-    if check_date.weekday() >= 5:  # 5=Sat, 6=Sun
-        return False
-    
-    date_key = check_date.strftime("%Y-%m-%d")
-    cache = _load_cache()
-    
-    # 命中快取
-    if date_key in cache:
-        return cache[date_key]
-    
-    # 查詢 API
-    result = _query_twse_index(check_date)
-    
-    if result is None:
-        # API 失敗或無法判斷 → 保守回傳 False,且不寫快取
-        logger.warning(f"{date_key} 無法判斷交易日,保守視為休市")
-        return False
-    
-    # 寫入快取 (歷史交易日結果不會變)
-    cache[date_key] = result
-    _save_cache(cache)
-    
-    return result
+    return get_calendar().is_trading_day(_as_date(check_date))
+
+
+def latest_trading_day(on_or_before: Optional[date] = None) -> Optional[date]:
+    """TWSE 已有資料的最近交易日 (預設今天以前,含今天)"""
+    return get_calendar().latest_trading_day(_as_date(on_or_before))
+
+
+def previous_trading_day(check_date: Optional[date] = None) -> Optional[date]:
+    """check_date (預設今天) 的前一個交易日"""
+    return get_calendar().previous_trading_day(_as_date(check_date))
+
+
+def next_trading_day(check_date: Optional[date] = None) -> Optional[date]:
+    """check_date (預設今天) 的下一個交易日"""
+    return get_calendar().next_trading_day(_as_date(check_date))
+
+
+def trading_days_between(start: date, end: date) -> List[date]:
+    """start ~ end (皆含) 之間的交易日"""
+    return get_calendar().trading_days_between(_as_date(start), _as_date(end))
+
+
+def recent_trading_days(count: int, on_or_before: Optional[date] = None) -> List[date]:
+    """
+    TWSE 已有資料的最近 count 個交易日,新到舊。
+
+    各收集器用來決定要抓哪一天:通常只需要第一個;
+    盤後報表 (T86 等) 比 FMTQIK 晚公布時,再退到第二個。
+    """
+    return get_calendar().recent_trading_days(count, _as_date(on_or_before))
 
 
 def require_trading_day(func):
@@ -170,7 +418,7 @@ def require_trading_day(func):
             ...
     """
     def wrapper(*args, **kwargs):
-        today = date.today()
+        today = _today()
         if not is_trading_day(today):
             logger.info(f"[{func.__name__}] {today} 非交易日,略過執行")
             return None
@@ -182,14 +430,22 @@ def require_trading_day(func):
 
 if __name__ == "__main__":
     # CLI 測試: python trading_day.py [YYYY-MM-DD]
+    #          python trading_day.py --preload 2024 [2026]
     import sys
-    
+
     logging.basicConfig(level=logging.INFO, format="%(levelname)s: %(message)s")
-    
+
+    if len(sys.argv) > 2 and sys.argv[1] == "--preload":
+        years = [int(y) for y in sys.argv[2:4]]
+        count = get_calendar().preload(*years)
+        print(f"已快取 {'~'.join(map(str, years))} 年交易日 {count} 天 → {CACHE_PATH}")
+        sys.exit(0)
+
     if len(sys.argv) > 1:
         target = datetime.strptime(sys.argv[1], "%Y-%m-%d").date()
     else:
-        target = date.today()
-    
+        target = _today()
+
     result = is_trading_day(target)
     print(f"{target} (週{'一二三四五六日'[target.weekday()]}): {'✓ 有開盤' if result else '✗ 休市'}")
+    print(f"  前一交易日: {previous_trading_day(target)}  下一交易日: {next_trading_day(target)}")
@@ -7,9 +7,10 @@
 """
 
 import sqlite3
-import json
 from datetime import datetime
 
+from json_export import write_json
+
 def get_consecutive_overheat_days(stock_code, days=7):
     """計算連續過熱天數"""
     conn = sqlite3.connect('data/market_data.db')
@@ -151,8 +152,7 @@ def analyze_and_export():
     }
     
     # 寫入 JSON
-    with open('data/turnover_analysis.json', 'w', encoding='utf-8') as f:
-        json.dump(output, f, ensure_ascii=False, indent=2)
+    write_json('data/turnover_analysis.json', output)
     
     print(f"✓ 分析完成:")
     print(f"   高周轉 (>=15%): {stats['overheat']} 檔")
@@ -0,0 +1,443 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+TWSE / TPEx 全市場 JSON 串流解析
+=================================
+MI_INDEX?type=ALL、STOCK_DAY_ALL、TPEx tpex_mainboard_daily_close_quotes 都是數 MB 的
+JSON。原本各收集器 resp.json() 整份展開成巢狀 list，再逐格 .replace(',', '') + float()
+走第二遍。這裡邊下載邊解析：目標表格每次把緩衝裡完整的列交給 C 的 JSON 解析器，
+每批列轉置後整欄一次轉成 NumPy 陣列（千分位、'--' 一次處理整欄），只解析要求的欄位。
+
+- 目標表格以外的內容（小表格、stat、date、fields...）保留為文字，最後組回 meta dict
+- 找不到目標表格時（欄位順序與預期不同）退回整份解析，結果相同
+- 數值欄為 float64，缺值為 NaN；代號/名稱為 str 陣列
+- 漲跌 'X'（除權息等不比價）為 NaN，prev_close 也跟著是 NaN
+
+使用方式:
+    from twse_json import fetch, parse_mi_index_quotes, parse_stock_day_all
+
+    meta, quotes = fetch(url, parse_stock_day_all, headers=HEADERS, timeout=30)
+    if meta.get('stat') == 'OK':
+        mask = quotes['close'] > 0
+        codes, closes = quotes['code'][mask], quotes['close'][mask]
+
+    # 只解析需要的欄位
+    meta, quotes = fetch(url, parse_mi_index_quotes, fields=['code', 'close', 'change'], timeout=30)
+"""
+import codecs
+import json
+import re
+
+import numpy as np
+
+CHUNK_SIZE = 64 * 1024
+COMPACT_AT = 256 * 1024        # 已消化的緩衝超過這個大小就丟掉
+ROW_BATCH = 2048               # 每累積這麼多列就轉成 NumPy 一次
+
+NA_TOKENS = ['', '--', '---', '----', 'X', 'N/A', '除權息', '除息', '除權']
+
+# 漲跌欄的 'X0.00' = 除權息等不比價，沒有可比較的漲跌 → NaN
+NOT_COMPARED_RE = re.compile(r'\nX[^\n]*')
+
+# MI_INDEX type=ALL 的「每日收盤行情」(tables[8])
+# 證券代號, 證券名稱, 成交股數, 成交筆數, 成交金額, 開盤價, 最高價, 最低價, 收盤價,
+# 漲跌(+/-) (HTML), 漲跌價差 (絕對值), 最後揭示買價, 買量, 賣價, 賣量, 本益比
+MI_INDEX_TITLE = '每日收盤行情'
+MI_INDEX_COLUMNS = {
+    'code': (0, 'str'), 'name': (1, 'str'),
+    'volume': (2, 'float'), 'trades': (3, 'float'), 'value': (4, 'float'),
+    'open': (5, 'float'), 'high': (6, 'float'), 'low': (7, 'float'), 'close': (8, 'float'),
+    'sign': (9, 'sign'), 'change': (10, 'float'), 'pe': (15, 'float'),
+}
+
+# STOCK_DAY_ALL: 證券代號, 證券名稱, 成交股數, 成交金額, 開盤價, 最高價, 最低價, 收盤價, 漲跌價差, 成交筆數
+STOCK_DAY_ALL_COLUMNS = {
+    'code': (0, 'str'), 'name': (1, 'str'),
+    'volume': (2, 'float'), 'value': (3, 'float'),
+    'open': (4, 'float'), 'high': (5, 'float'), 'low': (6, 'float'), 'close': (7, 'float'),
+    'change': (8, 'change'), 'trades': (9, 'float'),
+}
+
+# TPEx 上櫃每日收盤行情 (openapi): list of dict
+TPEX_DAILY_CLOSE_COLUMNS = {
+    'date': ('Date', 'str'), 'code': ('SecuritiesCompanyCode', 'str'), 'name': ('CompanyName', 'str'),
+    'close': ('Close', 'float'), 'change': ('Change', 'change'),
+    'open': ('Open', 'float'), 'high': ('High', 'float'), 'low': ('Low', 'float'),
+    'volume': ('TradingShares', 'float'), 'value': ('TransactionAmount', 'float'),
+    'trades': ('TransactionNumber', 'float'),
+}
+
+
+# ============================================================
+# 串流
+# ============================================================
+def _iter_chunks(source):
+    """requests.Response / 檔案 / bytes / str / bytes 區塊的 iterable → bytes 區塊"""
+    if source is None:
+        return iter(())
+    if hasattr(source, 'iter_content'):
+        return source.iter_content(CHUNK_SIZE)
+    if hasattr(source, 'read'):
+        return iter(lambda: source.read(CHUNK_SIZE), b'')
+    if isinstance(source, str):
+        source = source.encode('utf-8')
+    if isinstance(source, (bytes, bytearray)):
+        return (bytes(source[i:i + CHUNK_SIZE]) for i in range(0, len(source), CHUNK_SIZE))
+    return iter(source)
+
+
+class _JsonStream:
+    """bytes 區塊 → 文字緩衝，可往前找字串、逐個 raw_decode JSON 值"""
+
+    def __init__(self, source):
+        self._chunks = _iter_chunks(source)
+        self._utf8 = codecs.getincrementaldecoder('utf-8-sig')()
+        self._decoder = json.JSONDecoder()
+        self.buf = ''
+        self.pos = 0
+        self.eof = False
+
+    def fill(self):
+        """多讀一塊；已到結尾回傳 False"""
+        if self.eof:
+            return False
+        for chunk in self._chunks:
+            text = self._utf8.decode(chunk)
+            if text:
+                self.buf += text
+                return True
+        self.buf += self._utf8.decode(b'', final=True)
+        self.eof = True
+        return False
+
+    def compact(self):
+        if self.pos > COMPACT_AT:
+            self.buf = self.buf[self.pos:]
+            self.pos = 0
+
+    def skip_ws(self):
+        while True:
+            while self.pos < len(self.buf) and self.buf[self.pos] in ' \t\r\n':
+                self.pos += 1
+            if self.pos < len(self.buf) or not self.fill():
+                return
+
+    def peek(self):
+        self.skip_ws()
+        return self.buf[self.pos] if self.pos < len(self.buf) else ''
+
+    def value(self):
+        """解出目前位置的一個 JSON 值（資料不足時繼續讀）"""
+        self.skip_ws()
+        while True:
+            try:
+                obj, end = self._decoder.raw_decode(self.buf, self.pos)
+            except json.JSONDecodeError:
+                if self.fill():
+                    continue
+                raise
+            # 數字可能被區塊切斷（"12" + "34"）：後面沒有字元時再讀一塊確認
+            if end == len(self.buf) and not self.eof and self.fill():
+                continue
+            self.pos = end
+            return obj
+
+    def rest(self):
+        while self.fill():
+            pass
+        text = self.buf[self.pos:]
+        self.pos = len(self.buf)
+        return text
+
+
+def _stream_rows(stream, on_batch):
+    """
+    目前位置是 '['：逐塊解出各列，每 ROW_BATCH 列交給 on_batch；消化掉結尾的 ']'
+
+    緩衝裡到最後一個「列結尾 + 逗號」為止的完整列一次 json.loads（C 解析），
+    沒有完整的列就先多讀一塊；切點剛好落在字串裡時解析失敗，改逐列 raw_decode。
+    """
+    if stream.peek() != '[':
+        raise ValueError('expected JSON array')
+    stream.pos += 1
+    batch = []
+    while True:
+        ch = stream.peek()
+        if ch == ']':
+            stream.pos += 1
+            break
+        if ch == ',':
+            stream.pos += 1
+            continue
+        if not ch:
+            raise ValueError('unterminated JSON array')
+
+        rows = None
+        cut = stream.buf.rfind((']' if ch == '[' else '}') + ',', stream.pos)
+        if cut > stream.pos:
+            text = '[' + stream.buf[stream.pos:cut + 1] + ']'
+            try:
+                rows, end = stream._decoder.raw_decode(text)
+            except json.JSONDecodeError:
+                rows = None
+            else:
+                if end < len(text):
+                    # 切點在整個陣列的結尾 ']],' 上：陣列已在 end 結束
+                    stream.pos += end - 1
+                    batch.extend(rows)
+                    break
+                stream.pos = cut + 1
+        elif stream.fill():
+            # 緩衝裡沒有完整的列：多讀一塊再整批解析
+            continue
+        if rows is None:
+            rows = [stream.value()]
+        batch.extend(rows)
+        if len(batch) >= ROW_BATCH:
+            on_batch(batch)
+            batch = []
+            stream.compact()
+    if batch:
+        on_batch(batch)
+
+
+# ============================================================
+# 欄位轉換
+# ============================================================
+class _Columns:
+    """只收集 schema 裡的欄位；每批列轉置後立即轉成 NumPy，不保留字串"""
+
+    def __init__(self, schema):
+        self.schema = schema
+        self.parts = {name: [] for name in schema}
+
+    def add_list_rows(self, rows):
+        width = max(idx for idx, _ in self.schema.values()) + 1
+        if not rows:
+            return
+        if min(map(len, rows)) < width:
+            rows = [r + [''] * (width - len(r)) for r in rows]
+        transposed = list(zip(*rows))
+        for name, (idx, kind) in self.schema.items():
+            self.parts[name].append(_convert(transposed[idx], kind))
+
+    def add_dict_rows(self, rows):
+        rows = [r for r in rows if isinstance(r, dict)]
+        if not rows:
+            return
+        for name, (key, kind) in self.schema.items():
+            self.parts[name].append(_convert([r.get(key, '') for r in rows], kind))
+
+    def arrays(self):
+        out = {}
+        for name, (_, kind) in self.schema.items():
+            parts = self.parts[name]
+            if parts:
+                out[name] = np.concatenate(parts) if len(parts) > 1 else parts[0]
+            else:
+                out[name] = np.empty(0, dtype=str if kind == 'str' else np.float64)
+        return out
+
+
+def _float_or_nan(text):
+    try:
+        return float(text)
+    except ValueError:
+        return np.nan
+
+
+def _to_float(values, not_compared=False):
+    """
+    字串序列 → float64 陣列：去千分位，'--' 等缺值為 NaN
+
+    整欄先接成一個字串做取代（C 迴圈），再一次 float；比逐格 replace 或
+    NumPy 的字串陣列 astype 都快。not_compared=True 時 'X0.00'（不比價）也是 NaN。
+    """
+    count = len(values)
+    if not count:
+        return np.empty(0, dtype=np.float64)
+    text = '\n' + '\n'.join(map(str, values)).replace(',', '') + '\n'
+    if not_compared:
+        text = NOT_COMPARED_RE.sub('\nnan', text)
+    for token in NA_TOKENS:
+        pattern = f'\n{token}\n'
+        if pattern in text:
+            # 相鄰的缺值共用分隔符，取代兩次才會全部換到
+            text = text.replace(pattern, '\nnan\n').replace(pattern, '\nnan\n')
+    cells = text[1:-1].split('\n')
+    try:
+        if len(cells) == count:
+            return np.fromiter(map(float, cells), dtype=np.float64, count=count)
+    except ValueError:
+        pass
+    # 少見的其他文字（或儲存格內含換行）：逐格處理
+    return np.array([_float_or_nan(str(v).replace(',', '')) for v in values], dtype=np.float64)
+
+
+def _convert(values, kind):
+    if kind == 'str':
+        try:
+            return np.array([v.strip() for v in values], dtype=str)
+        except AttributeError:
+            return np.array([str(v).strip() for v in values], dtype=str)
+    if kind == 'sign':
+        # MI_INDEX 漲跌欄: '<p style= color:red>+</p>' / '<p style= color:green>-</p>' / ' ' / 'X'
+        return np.array([np.nan if 'X' in v else -1.0 if '-' in v else 1.0 if '+' in v else 0.0
+                         for v in map(str, values)])
+    if kind == 'change':
+        return _to_float(values, not_compared=True)
+    return _to_float(values)
+
+
+def _select(schema, fields, requires=None):
+    """只留 fields 指定的欄位（None = 全部）；requires 為衍生欄位需要的原始欄位"""
+    if fields is None:
+        return dict(schema)
+    wanted = set(fields)
+    for derived, needs in (requires or {}).items():
+        if derived in wanted:
+            wanted.update(needs)
+    unknown = wanted - set(schema) - set(requires or {})
+    if unknown:
+        raise KeyError(f'unknown fields: {sorted(unknown)}')
+    return {name: spec for name, spec in schema.items() if name in wanted}
+
+
+def _finish(arrays, fields, derive):
+    """算衍生欄位（change 帶號、prev_close），再只回傳要求的欄位"""
+    derive(arrays)
+    if 'close' in arrays and 'change' in arrays:
+        arrays['prev_close'] = arrays['close'] - arrays['change']
+    if fields is None:
+        return arrays
+    return {name: arrays[name] for name in fields}
+
+
+# ============================================================
+# 解析
+# ============================================================
+def _find_table(doc, title_keyword):
+    """整份 JSON 裡找表格（rwd 的 tables[] 或頂層 data）"""
+    if isinstance(doc, list):
+        return doc
+    for table in doc.get('tables') or []:
+        if title_keyword is None or title_keyword in str(table.get('title', '')):
+            return table.get('data') or []
+    if title_keyword is None or title_keyword in str(doc.get('title', '')):
+        return doc.get('data') or []
+    return []
+
+
+def _stream_table(source, schema, title_keyword=None):
+    """
+    串流解析 {"...", "data": [[...], ...], ...} 或 rwd 的 {"tables": [{"title", "data"}, ...]}
+
+    Returns: (meta, arrays) — meta 為去掉目標表格 data 後的整份 JSON
+    """
+    stream = _JsonStream(source)
+    columns = _Columns(schema)
+    prefix = []
+    found = False
+
+    while not found:
+        idx = stream.buf.find('"data"', stream.pos)
+        if idx < 0:
+            keep = max(stream.pos, len(stream.buf) - len('"data"'))
+            prefix.append(stream.buf[stream.pos:keep])
+            stream.pos = keep
+            if not stream.fill():
+                break
+            stream.compact()
+            continue
+
+        prefix.append(stream.buf[stream.pos:idx + len('"data"')])
+        stream.pos = idx + len('"data"')
+        if stream.peek() != ':':
+            continue
+        stream.pos += 1
+        if stream.peek() != '[':
+            continue
+
+        head = ''.join(prefix)
+        title_at = head.rfind('"title"')
+        title = ''
+        if title_at >= 0:
+            try:
+                title = json.JSONDecoder().raw_decode(head[head.index(':', title_at) + 1:].lstrip())[0]
+            except (ValueError, json.JSONDecodeError):
+                title = ''
+        if title_keyword is None or title_keyword in str(title):
+            prefix.append(':[')
+            _stream_rows(stream, columns.add_list_rows)
+            prefix.append(']')
+            found = True
+        else:
+            prefix.append(':')
+
+    text = ''.join(prefix) + stream.rest()
+    if not text.strip():
+        return {}, columns.arrays()
+    doc = json.loads(text)
+    if not found:
+        columns.add_list_rows(_find_table(doc, title_keyword))
+    return doc, columns.arrays()
+
+
+def parse_mi_index_quotes(source, fields=None):
+    """
+    MI_INDEX?type=ALL 的「每日收盤行情」
+
+    fields: 只解析需要的欄位（例如 ['code', 'close', 'change']），None = 全部
+    Returns: (meta, arrays)
+        arrays: code, name, volume, trades, value, open, high, low, close, pe,
+                change (已依漲跌欄帶正負號), prev_close
+    """
+    schema = _select(MI_INDEX_COLUMNS, fields,
+                     {'change': ('sign',), 'prev_close': ('close', 'change', 'sign')})
+
+    def derive(arrays):
+        if 'change' in arrays:
+            arrays['change'] = arrays['change'] * arrays.pop('sign')
+
+    meta, arrays = _stream_table(source, schema, MI_INDEX_TITLE)
+    return meta, _finish(arrays, fields, derive)
+
+
+def parse_stock_day_all(source, fields=None):
+    """
+    STOCK_DAY_ALL (全上市當日行情)
+
+    Returns: (meta, arrays)
+        arrays: code, name, volume, value, open, high, low, close, change, trades, prev_close
+    """
+    schema = _select(STOCK_DAY_ALL_COLUMNS, fields, {'prev_close': ('close', 'change')})
+    meta, arrays = _stream_table(source, schema)
+    return meta, _finish(arrays, fields, lambda arrays: None)
+
+
+def parse_tpex_daily_close(source, fields=None):
+    """
+    TPEx openapi tpex_mainboard_daily_close_quotes (上櫃每日收盤行情)
+
+    Returns: (meta, arrays) — meta 只有 date (民國 YYYMMDD，資料中最新的一天)
+        arrays: date, code, name, close, change, open, high, low, volume, value, trades, prev_close
+    """
+    schema = _select(TPEX_DAILY_CLOSE_COLUMNS, fields, {'prev_close': ('close', 'change')})
+    schema.setdefault('date', TPEX_DAILY_CLOSE_COLUMNS['date'])
+    stream = _JsonStream(source)
+    columns = _Columns(schema)
+    if stream.peek() == '[':
+        _stream_rows(stream, columns.add_dict_rows)
+    arrays = columns.arrays()
+    meta = {'date': max(arrays['date']) if len(arrays['date']) else None}
+    return meta, _finish(arrays, fields, lambda arrays: None)
+
+
+def fetch(url, parser, fields=None, session=None, **kwargs):
+    """以串流方式下載並解析（parser 為上面任一個 parse_*），HTTP 錯誤照常拋出"""
+    import requests
+
+    resp = (session or requests).get(url, stream=True, **kwargs)
+    with resp:
+        resp.raise_for_status()
+        return parser(resp, fields=fields)
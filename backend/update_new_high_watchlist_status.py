@@ -5,14 +5,22 @@
 每日由 run_daily.py 呼叫，更新 new_high_watchlist.json 中每檔的當前狀態
 與舊有 watchlist.json (MACD) 完全獨立
 
+K 線讀本地 K 線庫（data/kline_history，enrich_long_term_high.py 剛補過），
+已到最新交易日的股票不連網；只有落後的才併發補資料。
+
 讀取/寫入: data/new_high_watchlist.json
 """
 
-import requests
 import json
 import os
-import time
-from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+
+import numpy as np
+
+from kline_history_manager import ensure_kline_data, load_kline_csv
+from rate_limiter import HostRateLimiter
+import trading_day
 
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 DATA_DIR = os.path.join(BASE_DIR, 'data')
@@ -20,85 +28,104 @@ DATA_DIR = os.path.join(BASE_DIR, 'data')
 # ⚠️ 與舊 watchlist.json 隔離
 NHWL_PATH = os.path.join(DATA_DIR, 'new_high_watchlist.json')
 
-HEADERS = {
-    'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36',
-}
+# K 線庫補抓年限：與 enrich_long_term_high.py 共用同一份 10 年 K 線庫，
+# 用較短的年限會讓它每次都判定「涵蓋不夠」而整份重抓
+KLINE_YEARS = 10
+NEW_HIGH_BARS = 240
+
+# 併發補資料：執行緒數 + Yahoo 最小請求間隔（取代逐檔 sleep 0.2）
+FETCH_WORKERS = 8
+LIMITER = HostRateLimiter({'query1.finance.yahoo.com': 0.2})
+
+
+def kline_arrays(klines):
+    """K 線 list → (dates, highs, closes) 陣列"""
+    dates = np.array([k['date'] for k in klines])
+    highs = np.array([k['high'] for k in klines], dtype=float)
+    closes = np.array([k['close'] for k in klines], dtype=float)
+    return dates, highs, closes
+
+
+def is_fresh(klines, latest):
+    """K 線庫最後一根已是最新交易日（latest 未知時一律視為要補）"""
+    return bool(klines) and latest is not None and klines[-1]['date'] >= latest
 
 
-def fetch_yahoo_kline(stock_code, range_str='1y'):
-    """抓 Yahoo Finance K 線"""
-    url = f'https://query1.finance.yahoo.com/v8/finance/chart/{stock_code}.TW?interval=1d&range={range_str}'
+def refresh_klines(code, latest=None):
+    """補 K 線庫到最近交易日後重讀；補失敗但本地還有資料就照用舊的"""
     try:
-        r = requests.get(url, headers=HEADERS, timeout=15)
-        data = r.json()
-        result = data.get('chart', {}).get('result', [])
-        if not result:
-            return None
-        chart = result[0]
-        timestamps = chart.get('timestamp', [])
-        quote = chart.get('indicators', {}).get('quote', [{}])[0]
-        highs   = quote.get('high', [])
-        closes  = quote.get('close', [])
-        
-        clean = []
-        for ts, h, c in zip(timestamps, highs, closes):
-            if h is not None and c is not None:
-                clean.append({
-                    'date': datetime.fromtimestamp(ts).strftime('%Y-%m-%d'),
-                    'high': h,
-                    'close': c,
-                })
-        return clean if clean else None
+        ensure_kline_data(code, years=KLINE_YEARS, verbose=False,
+                          max_stale_days=0, limiter=LIMITER, latest=latest)
     except Exception:
-        return None
+        pass
+    return load_kline_csv(code)
 
 
-def update_stock_status(stock):
-    """更新單檔狀態"""
-    code = stock['code']
-    added_date = stock.get('added_date', '')
-    
-    kline = fetch_yahoo_kline(code, range_str='1y')
-    if not kline:
+def update_stock_status(stock, klines):
+    """用 K 線（由舊到新）更新單檔狀態"""
+    if not klines:
         return stock
-    
-    today = kline[-1]
-    today_close = today['close']
-    today_high  = today['high']
-    
+    added_date = stock.get('added_date', '')
+    dates, highs, closes = kline_arrays(klines)
+
+    today_close = float(closes[-1])
+    today_high = float(highs[-1])
+
     stock['current_price'] = round(today_close, 2)
     stock['last_updated']  = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-    
+
     # 漲跌幅
     if stock.get('added_price'):
         added_price = float(stock['added_price'])
         if added_price > 0:
             stock['pct_change'] = round((today_close - added_price) / added_price * 100, 2)
-    
-    # 加入後最高/最低
-    after_kline = [k for k in kline if k['date'] >= added_date] if added_date else kline
-    if after_kline:
-        stock['highest_after'] = round(max(k['high']  for k in after_kline), 2)
-        stock['lowest_after']  = round(min(k['close'] for k in after_kline), 2)
-    
-    # 是否仍創 240 日新高
-    if len(kline) >= 241:
-        past_240 = [k['high'] for k in kline[-241:-1]]
-        stock['still_new_high'] = today_high >= max(past_240)
-    elif len(kline) >= 21:
-        past_all = [k['high'] for k in kline[:-1]]
-        stock['still_new_high'] = today_high >= max(past_all) if past_all else None
+
+    # 加入後最高/最低（沒有加入日時看最近一年，同原本抓 1y K 線的範圍）
+    if not added_date:
+        last_day = datetime.strptime(dates[-1], '%Y-%m-%d')
+        added_date = (last_day - timedelta(days=365)).strftime('%Y-%m-%d')
+    after = dates >= added_date
+    if after.any():
+        stock['highest_after'] = round(float(highs[after].max()), 2)
+        stock['lowest_after']  = round(float(closes[after].min()), 2)
+
+    # 是否仍創 240 日新高（歷史不足 240 根但有 20 根以上時，看全部歷史）
+    if len(highs) >= NEW_HIGH_BARS + 1:
+        stock['still_new_high'] = bool(today_high >= highs[-NEW_HIGH_BARS - 1:-1].max())
+    elif len(highs) >= 21:
+        stock['still_new_high'] = bool(today_high >= highs[:-1].max())
     else:
         stock['still_new_high'] = None
-    
+
     # 從加入後最高的回檔幅度
     if stock.get('highest_after') and stock['highest_after'] > 0:
         pullback = (stock['highest_after'] - today_close) / stock['highest_after'] * 100
         stock['pullback_from_peak'] = round(pullback, 2)
-    
+
     return stock
 
 
+def load_watchlist_klines(codes):
+    """
+    一次讀齊清單內所有股票的 K 線
+
+    Returns: ({code: klines}, 補資料的檔數)
+    """
+    try:
+        latest = trading_day.latest_trading_day()
+    except Exception:
+        latest = None
+    latest = latest.strftime('%Y-%m-%d') if latest else None
+
+    klines_by_code = {code: load_kline_csv(code) for code in dict.fromkeys(codes)}
+    stale = [code for code, klines in klines_by_code.items() if not is_fresh(klines, latest)]
+    if stale:
+        with ThreadPoolExecutor(max_workers=FETCH_WORKERS) as ex:
+            for code, klines in zip(stale, ex.map(refresh_klines, stale, [latest] * len(stale))):
+                klines_by_code[code] = klines
+    return klines_by_code, len(stale)
+
+
 def main():
     if not os.path.exists(NHWL_PATH):
         print('  新高觀察清單尚未建立，略過')
@@ -118,16 +145,18 @@ def main():
         return
     
     print(f'  更新 {len(stocks)} 檔新高觀察清單…', flush=True)
+    klines_by_code, refreshed = load_watchlist_klines([s['code'] for s in stocks])
+    print(f'    K 線庫：{len(klines_by_code) - refreshed} 檔已是最新、{refreshed} 檔補資料',
+          flush=True)
     for i, stock in enumerate(stocks, 1):
         try:
-            update_stock_status(stock)
+            update_stock_status(stock, klines_by_code.get(stock['code']))
             print(f'    [{i}/{len(stocks)}] {stock["code"]} {stock.get("name","")} '
                   f'{stock.get("current_price","-")} '
                   f'({stock.get("pct_change","-")}%)',
                   flush=True)
         except Exception as e:
             print(f'    [{i}/{len(stocks)}] {stock["code"]} 失敗: {e}', flush=True)
-        time.sleep(0.2)
     
     data['updated_at'] = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
     
@@ -4,17 +4,27 @@ Watchlist API Server
 提供 /api/watchlist GET/POST 給 dashboard 使用
 port: 5001
 """
-from http.server import HTTPServer, BaseHTTPRequestHandler
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
 import json
 import os
+import threading
 import urllib.request
 from pathlib import Path
+from urllib.parse import parse_qs, urlparse
 from dotenv import load_dotenv
+from dashboard_bundle import BundleCache
+from export_events import ExportEvents, format_sse
+from json_export import atomic_write
 load_dotenv(Path(__file__).parent / '.env')
 
 NOTION_TOKEN = os.getenv("NOTION_TOKEN", "")
 CHAIN_INDEX_DB_ID = "68c1ed96abac4e05a708d4169cee93d1"  # 📡 產業鏈索引
 WATCHLIST_PATH = Path(__file__).parent / 'data' / 'watchlist.json'
+# 多執行緒下 POST 互相排隊；寫檔走暫存檔 + os.replace，GET 不會讀到寫一半的檔
+WATCHLIST_LOCK = threading.Lock()
+DASHBOARD_BUNDLE = BundleCache()
+EXPORT_EVENTS = ExportEvents()
+SSE_KEEPALIVE = 15   # 秒；定期送註解行，避免代理伺服器把閒置連線切掉
 
 def _notion_text(prop):
     t = prop.get("type", "")
@@ -40,6 +50,12 @@ class WatchlistHandler(BaseHTTPRequestHandler):
         self._set_headers()
 
     def do_GET(self):
+        if self.path == '/api/events' or self.path.startswith('/api/events?'):
+            self._handle_events()
+            return
+        if self.path == '/api/dashboard' or self.path.startswith('/api/dashboard?'):
+            self._handle_dashboard()
+            return
         if self.path.startswith('/api/chains'):
             self._handle_chains()
             return
@@ -101,10 +117,9 @@ class WatchlistHandler(BaseHTTPRequestHandler):
             length = int(self.headers.get('Content-Length', 0))
             body = self.rfile.read(length)
             data = json.loads(body)
-            WATCHLIST_PATH.write_text(
-                json.dumps(data, ensure_ascii=False, indent=2),
-                encoding='utf-8'
-            )
+            with WATCHLIST_LOCK:
+                atomic_write(WATCHLIST_PATH,
+                             json.dumps(data, ensure_ascii=False, indent=2).encode('utf-8'))
             self._set_headers()
             self.wfile.write(json.dumps({'ok': True}).encode())
         except Exception as e:
@@ -112,6 +127,76 @@ class WatchlistHandler(BaseHTTPRequestHandler):
             self.wfile.write(json.dumps({'error': str(e)}).encode())
 
 
+    def _handle_dashboard(self):
+        """
+        儀表板合併資料包（一次請求拿到首屏所有資料）
+        /api/dashboard?fields=market_data,macd_signal_stocks.scan_date  只取部分區塊
+        """
+        query = parse_qs(urlparse(self.path).query)
+        fields = [f.strip() for v in query.get('fields', []) for f in v.split(',') if f.strip()]
+        try:
+            body, gz_body, etag = DASHBOARD_BUNDLE.get(fields)
+        except Exception as e:
+            self._send_json({'error': str(e)}, status=500)
+            return
+        etag = f'"{etag}"'
+        if self.headers.get('If-None-Match') == etag:
+            self.send_response(304)
+            self.send_header('ETag', etag)
+            self.end_headers()
+            return
+        use_gzip = 'gzip' in self.headers.get('Accept-Encoding', '')
+        payload = gz_body if use_gzip else body
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json; charset=utf-8')
+        self.send_header('Access-Control-Allow-Origin', '*')
+        self.send_header('Cache-Control', 'no-cache')
+        self.send_header('ETag', etag)
+        self.send_header('Vary', 'Accept-Encoding')
+        if use_gzip:
+            self.send_header('Content-Encoding', 'gzip')
+        self.send_header('Content-Length', str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def _handle_events(self):
+        """
+        匯出檔更新推播（Server-Sent Events）
+        /api/events?files=macd_signal_stocks.json,ai_summary.json  只收部分檔案
+        斷線後瀏覽器會帶 Last-Event-ID 重連，補發期間漏掉的事件
+        """
+        query = parse_qs(urlparse(self.path).query)
+        files = {f.strip() for v in query.get('files', []) for f in v.split(',') if f.strip()}
+        current = EXPORT_EVENTS.last_id
+        try:
+            last_id = int(self.headers.get('Last-Event-ID', ''))
+        except ValueError:
+            last_id = current
+        if last_id > current:   # 伺服器重啟過，事件編號重新開始
+            last_id = current
+
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/event-stream; charset=utf-8')
+        self.send_header('Cache-Control', 'no-cache')
+        self.send_header('Access-Control-Allow-Origin', '*')
+        self.send_header('X-Accel-Buffering', 'no')   # nginx 不要緩衝
+        self.end_headers()
+        self.close_connection = True
+        try:
+            self.wfile.write(b'retry: 5000\n\n')
+            self.wfile.flush()
+            while True:
+                events = EXPORT_EVENTS.wait(last_id, timeout=SSE_KEEPALIVE)
+                if not events:
+                    self.wfile.write(b': keepalive\n\n')
+                for event in events:
+                    last_id = event['id']
+                    if not files or event['file'] in files:
+                        self.wfile.write(format_sse(event))
+                self.wfile.flush()
+        except (BrokenPipeError, ConnectionResetError):
+            pass
+
     def _handle_chains(self):
         url = f"https://api.notion.com/v1/databases/{CHAIN_INDEX_DB_ID}/query"
         payload = json.dumps({
@@ -375,7 +460,9 @@ class WatchlistHandler(BaseHTTPRequestHandler):
 
 
 if __name__ == '__main__':
-    server = HTTPServer(('0.0.0.0', 5001), WatchlistHandler)
+    EXPORT_EVENTS.start()
+    # SSE 連線會一直佔著，要用多執行緒版本
+    server = ThreadingHTTPServer(('0.0.0.0', 5001), WatchlistHandler)
     print('Watchlist API server running on port 5001')
     server.serve_forever()
 
@@ -62,6 +62,15 @@ server {
 
     location /data/ {
         alias $HOME_DIR/taiwan-stock-monitor-complete/backend/data/;
+        gzip_static on;    # 直接送 json_export 預先壓好的 .json.gz（有 brotli 模組可再加 brotli_static on）
+        add_header Cache-Control "no-cache";
+    }
+
+    # 內容雜湊檔名，內容永不變
+    location /data/hashed/ {
+        alias $HOME_DIR/taiwan-stock-monitor-complete/backend/data/hashed/;
+        gzip_static on;
+        add_header Cache-Control "public, max-age=31536000, immutable";
     }
 }
 EOF